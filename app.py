@@ -1,15 +1,30 @@
+import json
 import os
 import random
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+import secrets
+from flask import Flask, Response, g, render_template, request, redirect, url_for, session, flash, stream_with_context
+from werkzeug.local import LocalProxy
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_migrate import Migrate
 from functools import wraps
-from sqlalchemy import or_
+from datetime import datetime
+from sqlalchemy import or_, tuple_, union_all
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+from sqlalchemy.exc import IntegrityError
 
 from extensions import db
-from constants import CURRENCY_NAME,CHARACTER_ITEMS, algorithms, algorithm_effects, algorithm_descriptions, XP_TABLE, PASSIVE_ITEMS, UPGRADES, RANK_TIERS
-from battle import BattleBot, full_battle, calculate_bot_stat_points, ARENA_EFFECTS
-from models import User, Bot, History, Weapon, WeaponOwnership
+from constants import CURRENCY_NAME,CHARACTER_ITEMS, algorithms, algorithm_descriptions, XP_TABLE, PASSIVE_ITEMS, UPGRADES, RANK_TIERS
+from battle import full_battle, iter_battle, ENGINE_VERSION, EVENT_TEXT, encode_log, decode_log, render_event
+from models import User, Bot, History, Weapon, WeaponOwnership, BattleJob, TournamentResult
+from battle_memo import battle_memo
+from battle_jobs import DONE, FAILED, enqueue_job, finish_job, fail_job, prune_due, reclaim_job, run_claimed
+from bot_snapshots import SNAPSHOT_FIELDS, store_snapshot, snapshot_battle_bot
+from bot_stats import derived_stats, display_stats, upgrade_effects, apply_upgrade_arena_effects, stat_cache, weapon_changed
+from settlement import settle_battle, UPGRADE_FIELDS
+from matchups import win_chances, field_strength
+from matchmaking import matchmaking
+from ranked_queue import ranked_queue
+from ranking import ranking, users_in_order, index_rank, window_rank, top_ranked_users, supports_window_functions
 
 app = Flask(__name__, instance_relative_config=True)
 
@@ -26,17 +41,38 @@ if DATABASE_URL.startswith("postgres://"):
 app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Battles per /history page
+app.config["HISTORY_PAGE_SIZE"] = int(os.getenv("HISTORY_PAGE_SIZE", "25"))
+
+# Leaderboard ranks: "index" (in-process, ranking.py) or "window" (SQL window functions)
+app.config["LEADERBOARD_RANKING"] = os.getenv("LEADERBOARD_RANKING", "index")
+
+# Who plays a battle POST: "inline" (the request itself) or "worker"
+# (battle_jobs.py worker processes, the request only queues it)
+app.config["BATTLE_JOBS"] = os.getenv("BATTLE_JOBS", "inline")
+
+# Simulation processes for queued ranked battles (ranked_queue.py)
+app.config["RANKED_QUEUE_WORKERS"] = int(os.getenv("RANKED_QUEUE_WORKERS", "2"))
+
 db.init_app(app)
 migrate = Migrate(app, db)
 
 
 
+def get_current_user():
+    """
+    The logged-in User (None if logged out), loaded at most once per
+    request and kept on flask.g for the decorator, the view and templates.
+    """
+    if "current_user" not in g:
+        user_id = session.get("user_id")
+        g.current_user = db.session.get(User, user_id) if user_id else None
+    return g.current_user
+
 @app.context_processor
 def inject_current_user():
-    user = None
-    if "user_id" in session:
-        user = User.query.get(session["user_id"])
-    return dict(current_user=user)
+    # Lazy: pages whose template never touches current_user do not query
+    return dict(current_user=LocalProxy(get_current_user))
 
 def get_rank_tier(rating):
     for tier in RANK_TIERS:
@@ -68,22 +104,6 @@ def get_upgrade_labels(bot):
         labels.append("EMP Shield")
     return labels
 
-def apply_upgrade_arena_effects(stats, upgrades, arena="neutral"):
-    effective = stats.copy()
-
-    if upgrades.get("armor"):
-        effective["def"] = int((effective.get("def") or 0) * 1.10)
-    if upgrades.get("overclock"):
-        effective["clk"] = int((effective.get("clk") or 0) * 1.10)
-    if upgrades.get("crit"):
-        effective["luck"] = int((effective.get("luck") or 0) + 5)
-
-    effects = ARENA_EFFECTS.get(arena, ARENA_EFFECTS["neutral"])
-    effective["clk"] = int((effective.get("clk") or 0) * effects.get("spd_mod", 1.0))
-    effective["def"] = int((effective.get("def") or 0) * effects.get("def_mod", 1.0))
-
-    return effective
-
 def build_items_from_flags(flags):
     items = []
     for item in CHARACTER_ITEMS:
@@ -96,27 +116,6 @@ def build_items_from_flags(flags):
 def inject_upgrade_helpers():
     return dict(get_upgrade_labels=get_upgrade_labels)
 
-def calculate_elo_change(winner_rating, loser_rating, k_factor=32):
-    """
-    Calculate ELO rating changes for winner and loser.
-    
-    Args:
-        winner_rating: Current rating of the winner
-        loser_rating: Current rating of the loser
-        k_factor: How much ratings change per game (default 32)
-    
-    Returns:
-        (winner_change, loser_change) - both as integers
-    """
-    # Calculate expected win probability for the winner
-    expected_win = 1 / (1 + 10 ** ((loser_rating - winner_rating) / 400))
-    
-    # Calculate rating changes
-    winner_change = int(k_factor * (1 - expected_win))
-    loser_change = int(k_factor * (0 - (1 - expected_win)))
-    
-    return winner_change, loser_change
-
 # Stat Min/Max Values
 STAT_LIMITS = {
     "hp": (100, 999),
@@ -214,18 +213,34 @@ def login_required(f):
         if not user_id:
             flash("Please log in to continue.", "warning")
             return redirect(url_for("login"))
-        if not User.query.get(user_id):
+        if not get_current_user():
             session.clear()
             flash("Session expired. Please log in again.", "warning")
             return redirect(url_for("login"))
         return f(*args, **kwargs)
     return decorated_function
 
+# Roster pages: each bot's weapon ownerships and their weapons come in
+# the same query as the bot, so equipped_weapon (and derived_stats on a
+# cache miss) never lazy-load
+def roster_query(user_id):
+    return Bot.query.filter_by(user_id=user_id).options(
+        joinedload(Bot.equipped_weapon_ownership).joinedload(WeaponOwnership.weapon)
+    )
+
+def roster_bots(user_id):
+    """A user's bots, oldest first, ready for the roster pages (one query)."""
+    return roster_query(user_id).order_by(Bot.id).all()
+
+def roster_bot(user_id, bot_id):
+    """One of the user's bots loaded like roster_bots; 404 if it is not theirs."""
+    return roster_query(user_id).filter(Bot.id == bot_id).first_or_404()
+
 # dashboard
 @app.route("/dashboard", methods=["GET", "POST"])
 @login_required
 def dashboard():
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
     if not user:
         session.clear()
         flash("Session expired. Please log in again.", "warning")
@@ -242,30 +257,15 @@ def dashboard():
             new_bot = Bot(name=name, algorithm=algorithm, user_id=user.id)
             db.session.add(new_bot)
             db.session.commit()
+            matchmaking.add_bot(new_bot.id, user.id, user.rating)
             flash("Bot created successfully!", "success")
 
         return redirect(url_for("dashboard"))
 
-    enhanced_bots = []
-    for bot in user.bots:
-        total_proc = getattr(bot, "total_proc", None)
-        if total_proc is None:
-            total_proc = int(bot.atk or 0)
-
-        base_stats = {
-            "int": int(bot.hp or 0),
-            "proc": int(total_proc or 0),
-            "def": int(bot.defense or 0),
-            "clk": int(bot.speed or 0),
-            "logic": int(bot.logic or 0),
-            "luck": int(bot.luck or 0),
-            "pwr": int(bot.energy or 0),
-        }
-
-        effects = algorithm_effects.get(bot.algorithm, {})
-        final_stats = {stat: int(base * effects.get(stat, 1.0)) for stat, base in base_stats.items()}
-
-        enhanced_bots.append({"bot": bot, "final_stats": final_stats})
+    enhanced_bots = [
+        {"bot": bot, "final_stats": display_stats(derived_stats(bot).final)}
+        for bot in roster_bots(user.id)
+    ]
 
     return render_template(
         "dashboard.html",
@@ -300,9 +300,11 @@ def create_bot():
             flash("Please provide a bot name and select an algorithm.", "danger")
             return redirect(url_for("create_bot"))
 
-        new_bot = Bot(name=name, algorithm=algorithm, user_id=session["user_id"])
+        user = get_current_user()
+        new_bot = Bot(name=name, algorithm=algorithm, user_id=user.id)
         db.session.add(new_bot)
         db.session.commit()
+        matchmaking.add_bot(new_bot.id, user.id, user.rating)
 
         flash("Bot created successfully!", "success")
         return redirect(url_for("dashboard"))
@@ -313,9 +315,6 @@ def create_bot():
         algorithm_descriptions=algorithm_descriptions,
     )
 
-def bot_xp_to_next_level(level):
-    return 50 + (level - 1) * 25
-
 # manage bot
 @app.route('/manage_bot')
 @login_required
@@ -324,44 +323,19 @@ def manage_bot():
         flash("Please log in to manage your bots.", "warning")
         return redirect(url_for('login'))
 
-    user_bots = Bot.query.filter_by(user_id=session['user_id']).all()
-    user = User.query.get(session["user_id"])
-    bots = user.bots
-
-    enhanced_bots = []
-    for bot in bots:
-        base_stats = {
-            "int": bot.hp,
-            "proc": bot.total_proc,
-            "def": bot.defense,   
-            "clk": bot.speed,
-            "logic": bot.logic,
-            "luck": bot.luck,
-            "pwr": bot.energy
-        }
-
-        effects = algorithm_effects.get(bot.algorithm, {})
-        final_stats = {}
-
-        for stat, base in base_stats.items():
-            multiplier = effects.get(stat, 1.0)
-            final_stats[stat] = int(base * multiplier)
-
-        xp_needed = bot_xp_to_next_level(bot.level or 1)
-        xp_current = int(bot.xp or 0)
-        xp_percent = int((xp_current / xp_needed) * 100) if xp_needed > 0 else 0
-
-        enhanced_bots.append({
-            "bot": bot,
-            "final_stats": final_stats
-        })
-    return render_template('manage_bot.html', enhanced_bots=enhanced_bots, bots=user_bots, algorithms=algorithms, algorithm_descriptions=algorithm_descriptions)
+    bots = roster_bots(session['user_id'])
+
+    enhanced_bots = [
+        {"bot": bot, "final_stats": display_stats(derived_stats(bot).final)}
+        for bot in bots
+    ]
+    return render_template('manage_bot.html', enhanced_bots=enhanced_bots, bots=bots, algorithms=algorithms, algorithm_descriptions=algorithm_descriptions)
 
 # Other pages
 @app.route("/store")
 @login_required
 def store():
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
     bots = Bot.query.filter_by(user_id=user.id).all()
     credits = int(user.tokens or 0)
 
@@ -385,7 +359,7 @@ def store():
 @app.route('/buy_passive/<int:passive_id>', methods=['POST'])
 @login_required
 def buy_passive(passive_id):
-    user = User.query.get(session['user_id'])
+    user = get_current_user()
     bot_id = request.form.get('bot_id')
     bot = Bot.query.get(bot_id)
 
@@ -409,7 +383,7 @@ def buy_passive(passive_id):
 @app.route("/character")
 @login_required
 def character():
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
     bots = Bot.query.filter_by(user_id=user.id).all()
 
     selected_bot_id = request.args.get("bot_id")
@@ -437,7 +411,7 @@ def character():
 @app.route("/equip_weapon_from_store", methods=["POST"])
 @login_required
 def equip_weapon_from_store():
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
 
     ownership_id = request.form.get("ownership_id")
     bot_id = request.form.get("bot_id")
@@ -456,6 +430,8 @@ def equip_weapon_from_store():
         flash("Weapon not found in your inventory.", "danger")
         return redirect(url_for("store"))
 
+    previous_bot_id = ow.bot_id
+
     # Unequip any currently equipped weapon on this bot
     WeaponOwnership.query.filter_by(bot_id=bot.id, equipped=True).update(
         {"equipped": False, "bot_id": None}
@@ -469,6 +445,7 @@ def equip_weapon_from_store():
     # Equip it to selected bot
     ow.bot_id = bot.id
     ow.equipped = True
+    weapon_changed(bot.id, previous_bot_id)
 
     db.session.commit()
     flash(f"{ow.weapon.name} equipped to {bot.name}!", "success")
@@ -484,7 +461,7 @@ def profile():
         flash("Please log in first.", "warning")
         return redirect(url_for('login'))
 
-    user = User.query.get(user_id)
+    user = get_current_user()
     if not user:
         flash("Error loading profile.", "danger")
         return redirect(url_for('login'))
@@ -513,7 +490,7 @@ from constants import CHARACTER_ITEMS
 @app.route("/buy_character", methods=["POST"])
 @login_required
 def buy_character():
-    user = User.query.get(session.get("user_id"))
+    user = get_current_user()
     if not user:
         flash("User not found.", "danger")
         return redirect(url_for("dashboard"))
@@ -586,7 +563,7 @@ def buy_character():
 @app.route("/update_settings", methods=["POST"])
 @login_required
 def update_settings():
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
     username = request.form.get("username")
     email = request.form.get("email")
     password = request.form.get("password")
@@ -605,12 +582,17 @@ def update_settings():
 @app.route("/delete_account", methods=["POST"])
 @login_required
 def delete_account():
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
 
     # Delete related data
     # Delete weapon ownership
     WeaponOwnership.query.filter_by(user_id=user.id).delete()
 
+    # Keep the user's tournament results, without their bots
+    TournamentResult.query.filter(
+        TournamentResult.bot_id.in_(db.select(Bot.id).where(Bot.user_id == user.id))
+    ).update({"bot_id": None}, synchronize_session=False)
+
     # Delete bots (this will cascade to weapon_ownership if bot_id)
     Bot.query.filter_by(user_id=user.id).delete()
 
@@ -622,6 +604,8 @@ def delete_account():
     # Delete the user
     db.session.delete(user)
     db.session.commit()
+    ranking.discard(user.id)
+    matchmaking.remove_user(user.id)
 
     session.clear()
     flash("Account deleted successfully.", "info")
@@ -638,9 +622,12 @@ def delete_bot(bot_id):
     # Detach bot from history before delete (requires bot1_id/bot2_id to be nullable)
     History.query.filter_by(bot1_id=bot.id).update({"bot1_id": None})
     History.query.filter_by(bot2_id=bot.id).update({"bot2_id": None})
+    TournamentResult.query.filter_by(bot_id=bot.id).update({"bot_id": None})
 
     db.session.delete(bot)
     db.session.commit()
+    matchmaking.remove_bot(bot_id)
+    stat_cache.forget(bot_id)
     flash("Bot deleted successfully.", "success")
     return redirect(url_for("manage_bot"))
 
@@ -789,344 +776,109 @@ def edit_bot(bot_id):
 @app.route('/bot/<int:bot_id>')
 @login_required
 def bot_details(bot_id):
-    bot = Bot.query.filter_by(
-        id=bot_id,
-        user_id=session["user_id"]
-    ).first_or_404()
+    bot = roster_bot(session["user_id"], bot_id)
 
-    base_stats = {
-        "int": bot.hp,
-        "proc": bot.total_proc,
-        "def": bot.defense,   
-        "clk": bot.speed,
-        "logic": bot.logic,
-        "ent": bot.luck,
-        "pwr": bot.energy
-    }
-
-    effects = algorithm_effects.get(bot.algorithm, {})
-
-    final_stats = {}
-    multipliers = {}
-
-    for stat, value in base_stats.items():
-        multiplier = effects.get(stat, 1.0)
-        multipliers[stat] = multiplier
-        final_stats[stat] = int(value * multiplier)
+    block = derived_stats(bot)
 
     return render_template(
         "bot_details.html",
         bot=bot,
-        base_stats=base_stats,
-        multipliers=multipliers,
-        final_stats=final_stats
+        base_stats=display_stats(block.base),
+        multipliers=display_stats(block.multipliers),
+        final_stats=display_stats(block.final),
+        field_strength=field_strength(bot)
     )
 
 @app.route("/bots")
 @login_required
 def bot_list():
-    user_id = session["user_id"]
-    bots = Bot.query.filter_by(user_id=user_id).all()
+    bots = roster_bots(session["user_id"])
 
-    items = []
-    for bot in bots:
-        base_stats = {
-            "int": bot.hp,
-            "proc": bot.total_proc,
-            "def": bot.defense,   
-            "clk": bot.speed,
-            "logic": bot.logic,
-            "luck": bot.luck,
-            "pwr": bot.energy
-        }
-        effects = algorithm_effects.get(bot.algorithm, {})
-        final_stats = {stat: int(value * effects.get(stat, 1.0)) for stat, value in base_stats.items()}
-        items.append({"bot": bot, "final_stats": final_stats})
+    items = [{"bot": bot, "final_stats": display_stats(derived_stats(bot).final)} for bot in bots]
 
     return render_template("dashboard.html", bots=items, algorithms=algorithms, algorithm_descriptions=algorithm_descriptions)
 
-@app.route("/combat_log/<int:bot1_id>/<int:bot2_id>")
-@login_required
-def combat_log(bot1_id, bot2_id):
-    # Get bots and user
-    bot1 = Bot.query.get_or_404(bot1_id)
-    bot2 = Bot.query.get_or_404(bot2_id)
-    user = User.query.get(session["user_id"])
-
-    # Apply algorithm stats
-    stats1 = apply_algorithm(bot1)
-    stats2 = apply_algorithm(bot2)
-    stats1_base = stats1
-    stats2_base = stats2
-    weapon1_ow = WeaponOwnership.query.filter_by(bot_id=bot1.id, equipped=True).first()
-    weapon2_ow = WeaponOwnership.query.filter_by(bot_id=bot2.id, equipped=True).first()
-
-    # Get weapon ATK
-    weapon1_atk = weapon1_ow.effective_atk() if weapon1_ow else 0
-    weapon2_atk = weapon2_ow.effective_atk() if weapon2_ow else 0
-    
-    # Get algorithm effects
-    effects1 = algorithm_effects.get(bot1.algorithm, {})
-    effects2 = algorithm_effects.get(bot2.algorithm, {})
-    
-    # Calculate final proc: (base + weapon) × algorithm multiplier
-    base_proc1 = bot1.atk + weapon1_atk
-    final_proc1 = int(base_proc1 * effects1.get("proc", 1.0))
-    
-    base_proc2 = bot2.atk + weapon2_atk
-    final_proc2 = int(base_proc2 * effects2.get("proc", 1.0))
-
-    bot1_upgrades = {
-        "armor": bot1.upgrade_armor_plating,
-        "overclock": bot1.upgrade_overclock_unit,
-        "regen": bot1.upgrade_regen_core,
-        "crit": bot1.upgrade_critical_subroutine,
-        "recycler": bot1.upgrade_energy_recycler,
-        "emp": bot1.upgrade_emp_shield,
-    }
-    bot2_upgrades = {
-        "armor": bot2.upgrade_armor_plating,
-        "overclock": bot2.upgrade_overclock_unit,
-        "regen": bot2.upgrade_regen_core,
-        "crit": bot2.upgrade_critical_subroutine,
-        "recycler": bot2.upgrade_energy_recycler,
-        "emp": bot2.upgrade_emp_shield,
-    }
-    bot1_items = build_items_from_flags({
-        "upgrade_armor_plating": bot1.upgrade_armor_plating,
-        "upgrade_overclock_unit": bot1.upgrade_overclock_unit,
-        "upgrade_regen_core": bot1.upgrade_regen_core,
-        "upgrade_critical_subroutine": bot1.upgrade_critical_subroutine,
-        "upgrade_energy_recycler": bot1.upgrade_energy_recycler,
-        "upgrade_emp_shield": bot1.upgrade_emp_shield,
-    })
-    bot2_items = build_items_from_flags({
-        "upgrade_armor_plating": bot2.upgrade_armor_plating,
-        "upgrade_overclock_unit": bot2.upgrade_overclock_unit,
-        "upgrade_regen_core": bot2.upgrade_regen_core,
-        "upgrade_critical_subroutine": bot2.upgrade_critical_subroutine,
-        "upgrade_energy_recycler": bot2.upgrade_energy_recycler,
-        "upgrade_emp_shield": bot2.upgrade_emp_shield,
-    })
-
-    # Convert to BattleBot
-    battleA = BattleBot(
-        name=bot1.name,
-        hp=stats1["hp"],
-        energy=stats1["energy"],
-        proc=final_proc1,  
-        defense=stats1["def"],   # FIX
-        clk=stats1["clk"],
-        luck=stats1["luck"],
-        logic=stats1["logic"],
-        weapon_atk=0,
-        weapon_type=weapon1_ow.weapon.type if weapon1_ow else None,
-        algorithm=bot1.algorithm,
-        items=bot1_items,
-    )
+def battle_snapshot(bot):
+    """The stored BotSnapshot of a bot's battle-start stats (its derived stat block)."""
+    return store_snapshot(derived_stats(bot).snapshot_values())
 
-    battleB = BattleBot(
-        name=bot2.name,
-        hp=stats2["hp"],
-        energy=stats2["energy"],
-        proc=final_proc2,  
-        defense=stats2["def"],   # FIX
-        clk=stats2["clk"],
-        luck=stats2["luck"],
-        logic=stats2["logic"],
-        weapon_atk=0,
-        weapon_type=weapon2_ow.weapon.type if weapon2_ow else None,
-        algorithm=bot2.algorithm,
-        items=bot2_items,
-    )
-
-    # Run the battle
-    result = full_battle(battleA, battleB)
-    winner_name = result["winner"]
-    log = result["log"]
-    is_draw = (winner_name == "draw" or winner_name is None)
-    botA_points = result["botA_points"]
-    botB_points = result["botB_points"]
-    seed = result["seed"]
-
-    # consume one-time upgrades after battle
-    if any(bot1_upgrades.values()):
-        bot1.upgrade_armor_plating = False
-        bot1.upgrade_overclock_unit = False
-        bot1.upgrade_regen_core = False
-        bot1.upgrade_critical_subroutine = False
-        bot1.upgrade_energy_recycler = False
-        bot1.upgrade_emp_shield = False
-
-    if any(bot2_upgrades.values()):
-        bot2.upgrade_armor_plating = False
-        bot2.upgrade_overclock_unit = False
-        bot2.upgrade_regen_core = False
-        bot2.upgrade_critical_subroutine = False
-        bot2.upgrade_energy_recycler = False
-        bot2.upgrade_emp_shield = False
-
-    # save bot win or loss (skip if draw)
-    if not is_draw:
-        if winner_name == bot1.name:
-            bot1.botwins += 1
-            bot2.botlosses += 1
-        else:
-            bot2.botwins += 1
-            bot1.botlosses += 1
-
-    db.session.commit()
-
-    # Determine results
-    if is_draw:
-        bot1_result = "draw"
-        bot2_result = "draw"
-    else:
-        bot1_result = "win" if winner_name == bot1.name else "lose"
-        bot2_result = "win" if winner_name == bot2.name else "lose"
-
-    # BOT XP SYSTEM
-    def bot_xp_to_next_level(level):
-        return 50 + (level - 1) * 25
-
-    def add_bot_xp(bot, amount):
-        bot.xp = int(bot.xp or 0)
-        bot.level = int(bot.level or 1)
-        bot.stat_points = int(bot.stat_points or 0)
-
-        bot.xp += int(amount)
-        levels_gained = 0
-
-        while bot.xp >= bot_xp_to_next_level(bot.level):
-            bot.xp -= bot_xp_to_next_level(bot.level)
-            bot.level += 1
-            levels_gained += 1
-
-            bot.stat_points += 5
-
-        return levels_gained
-
-    # Calculate XP per bot
-    def calculate_bot_xp(battle_bot, result):
-        if result == "win":
-            return 20
-        elif result == "lose":
-            return 5
-        elif result == "draw":
-            return 10 
-        return 0
-
-    # Apply XP
-    bot1_xp = calculate_bot_xp(battleA, bot1_result)
-    bot2_xp = calculate_bot_xp(battleB, bot2_result)
-
-    if bot1.user_id == user.id:
-        add_bot_xp(bot1, bot1_xp)
-
-    elif bot2.user_id == user.id:
-        add_bot_xp(bot2, bot2_xp)
-
-    db.session.commit()
+# Battle tokens battle_select issued to this session (the newest few, so
+# battle pages open in several tabs all stay valid)
+BATTLE_TOKENS_KEPT = 10
 
+def issue_battle_token():
+    battle_token = secrets.token_urlsafe(16)
+    session["battle_tokens"] = (session.get("battle_tokens", []) + [battle_token])[-BATTLE_TOKENS_KEPT:]
+    return battle_token
 
-     # USER XP
-    xp_gained = 0
-    levels_gained = 0
+@app.route("/combat_log/<int:bot1_id>/<int:bot2_id>", methods=["POST"])
+@login_required
+def combat_log(bot1_id, bot2_id):
+    # The token from battle_select makes the POST idempotent: a refresh or
+    # double submit lands on the same job (and stored result) instead of a
+    # second battle. Only tokens issued to this session are accepted, which
+    # also keeps anything longer than History.battle_token out of the database.
+    battle_token = request.form.get("battle_token", "").strip()
+    if battle_token not in session.get("battle_tokens", ()):
+        flash("Battle request expired. Please choose your bots again.", "warning")
+        return redirect(url_for("battle_select"))
+
+    existing = History.query.filter_by(battle_token=battle_token).first()
+    if existing:
+        return redirect(url_for("combat_result", history_id=existing.id))
 
-  # Determine winning bot
-    winning_bot = None
-    losing_bot = None
+    # Check the bots exist before queueing
+    bot1 = Bot.query.get_or_404(bot1_id)
+    bot2 = Bot.query.get_or_404(bot2_id)
 
-    if winner_name == bot1.name:
-        winning_bot = bot1
-        losing_bot = bot2
-    elif winner_name == bot2.name:
-        winning_bot = bot2
-        losing_bot = bot1
+    inline = app.config["BATTLE_JOBS"] == "inline"
+    job, created = enqueue_job(session["user_id"], bot1.id, bot2.id, battle_token, claim=inline)
+    if inline and created:
+        run_claimed(job, run_battle_job)
+        prune_due()
+    return redirect(url_for("battle_job", job_id=job.id))
 
-    if winning_bot and winning_bot.user_id == user.id:
-        xp_gained = 30
-        levels_gained = add_xp(user, xp_gained)
 
-        user.tokens = int(user.tokens or 0) + 5
+def lock_battle_players(user_id, bot1_id, bot2_id):
+    """
+    Lock the player and both bots' owners (in id order) before reading the
+    bots, so battles of the same players settled at once (battle workers,
+    ranked queue threads) do not overwrite each other's XP and ratings.
+    SQLite ignores FOR UPDATE; it gets one worker.
+    """
+    owner_ids = set(db.session.execute(
+        db.select(Bot.user_id).where(Bot.id.in_((bot1_id, bot2_id)))
+    ).scalars())
+    db.session.execute(
+        db.select(User).where(User.id.in_(owner_ids | {user_id})).order_by(User.id).with_for_update()
+    ).scalars().all()
 
-        db.session.commit()
 
-    elif losing_bot and losing_bot.user_id == user.id:
-        xp_gained = 10
-        levels_gained = add_xp(user, xp_gained)
+def run_battle_job(job):
+    """
+    Play a claimed BattleJob and settle it for the player who started it,
+    then mark it done. Runs in the request (inline) or a battle worker.
+    """
+    lock_battle_players(job.user_id, job.bot1_id, job.bot2_id)
 
-        db.session.commit()
-        flash(f"Congratulations {user.username}! You gained {xp_gained} XP and {levels_gained} levels.", "success")
+    bot1 = db.session.get(Bot, job.bot1_id)
+    bot2 = db.session.get(Bot, job.bot2_id)
+    user = db.session.get(User, job.user_id)
+    if bot1 is None or bot2 is None or user is None:
+        fail_job(job, "A bot in this battle no longer exists.")
+        return
 
-    # elo rating changes
-    is_ranked = (bot1.user_id != bot2.user_id)
-    
-    if is_ranked and not is_draw:
-        if winner_name == bot1.name:
-            winner_user = bot1.user
-            loser_user = bot2.user
-        else:
-            winner_user = bot2.user
-            loser_user = bot1.user
-        
-        rating_gain, rating_loss = calculate_elo_change(
-            winner_user.rating,
-            loser_user.rating
-        )
-        
-        old_winner_rating = winner_user.rating
-        old_loser_rating = loser_user.rating
-        
-        winner_user.rating += rating_gain
-        winner_user.wins += 1
-        
-        loser_user.rating += rating_loss
-        loser_user.losses += 1
-        
-        db.session.commit()
-        
-        flash(
-            f"🏆 {winner_user.username} won! Rating: {old_winner_rating} → {winner_user.rating} (+{rating_gain})",
-            "success"
-        )
-        flash(
-            f"💔 {loser_user.username} lost. Rating: {old_loser_rating} → {loser_user.rating} ({rating_loss})",
-            "info"
-        )
+    # Battle-start stats, stored for the history and replays
+    snapshot1 = battle_snapshot(bot1)
+    snapshot2 = battle_snapshot(bot2)
+    battleA = snapshot_battle_bot(snapshot1, bot1.name)
+    battleB = snapshot_battle_bot(snapshot2, bot2.name)
 
-    # Add weapon info to stats dictionaries for template
-    stats1_base["weapon_atk"] = weapon1_atk
-    stats1_base["weapon_name"] = weapon1_ow.weapon.name if weapon1_ow else None
-    stats1_base["weapon_type"] = weapon1_ow.weapon.type if weapon1_ow else None
-    stats1_base["proc"] = final_proc1 
-    stats1["upgrades"] = [
-        label for label, enabled in [
-            ("Armor Plating", bot1_upgrades["armor"]),
-            ("Overclock Unit", bot1_upgrades["overclock"]),
-            ("Regen Core", bot1_upgrades["regen"]),
-            ("Critical Subroutine", bot1_upgrades["crit"]),
-            ("Energy Recycler", bot1_upgrades["recycler"]),
-            ("EMP Shield", bot1_upgrades["emp"]),
-        ] if enabled
-    ]
-    
-    stats2_base["weapon_atk"] = weapon2_atk
-    stats2_base["weapon_name"] = weapon2_ow.weapon.name if weapon2_ow else None
-    stats2_base["weapon_type"] = weapon2_ow.weapon.type if weapon2_ow else None
-    stats2_base["proc"] = final_proc2  
-    stats2["upgrades"] = [
-        label for label, enabled in [
-            ("Armor Plating", bot2_upgrades["armor"]),
-            ("Overclock Unit", bot2_upgrades["overclock"]),
-            ("Regen Core", bot2_upgrades["regen"]),
-            ("Critical Subroutine", bot2_upgrades["crit"]),
-            ("Energy Recycler", bot2_upgrades["recycler"]),
-            ("EMP Shield", bot2_upgrades["emp"]),
-        ] if enabled
-    ]
+    # Run the battle
+    result = full_battle(battleA, battleB)
+    winner_name = result["winner"]
+    winner_side = result["winner_side"]
 
-    
     history = History(
         bot1_id=bot1.id,
         bot2_id=bot2.id,
@@ -1135,81 +887,161 @@ def combat_log(bot1_id, bot2_id):
         bot1_name=bot1.name,
         bot2_name=bot2.name,
         winner=winner_name,
-        seed=seed,
-
-        bot1_hp=stats1_base["hp"],
-        bot1_energy=stats1_base["energy"],
-        bot1_proc=final_proc1,
-        bot1_defense=stats1_base["def"],   
-        bot1_clk=stats1_base["clk"],
-        bot1_luck=stats1_base["luck"],
-        bot1_logic=stats1_base["logic"],
-        bot1_weapon_atk=weapon1_atk,
-        bot1_weapon_name=(weapon1_ow.weapon.name if weapon1_ow else None),
-        bot1_weapon_type=(weapon1_ow.weapon.type if weapon1_ow else None),
-        bot1_algorithm=bot1.algorithm,
-        bot1_upgrade_armor_plating=bot1_upgrades["armor"],
-        bot1_upgrade_overclock_unit=bot1_upgrades["overclock"],
-        bot1_upgrade_regen_core=bot1_upgrades["regen"],
-        bot1_upgrade_critical_subroutine=bot1_upgrades["crit"],
-        bot1_upgrade_energy_recycler=bot1_upgrades["recycler"],
-        bot1_upgrade_emp_shield=bot1_upgrades["emp"],
-
-        bot2_hp=stats2_base["hp"],
-        bot2_energy=stats2_base["energy"],
-        bot2_proc=final_proc2,
-        bot2_defense=stats2_base["def"],   #use def 
-        bot2_clk=stats2_base["clk"],
-        bot2_luck=stats2_base["luck"],
-        bot2_logic=stats2_base["logic"],
-        bot2_weapon_atk=weapon2_atk,
-        bot2_weapon_name=(weapon2_ow.weapon.name if weapon2_ow else None),
-        bot2_weapon_type=(weapon2_ow.weapon.type if weapon2_ow else None),
-        bot2_algorithm=bot2.algorithm,
-        bot2_upgrade_armor_plating=bot2_upgrades["armor"],
-        bot2_upgrade_overclock_unit=bot2_upgrades["overclock"],
-        bot2_upgrade_regen_core=bot2_upgrades["regen"],
-        bot2_upgrade_critical_subroutine=bot2_upgrades["crit"],
-        bot2_upgrade_energy_recycler=bot2_upgrades["recycler"],
-        bot2_upgrade_emp_shield=bot2_upgrades["emp"],
+        seed=result["seed"],
+
+        bot1_snapshot=snapshot1,
+        bot2_snapshot=snapshot2,
+
+        log_data=encode_log(result["log"]),
+        log_version=ENGINE_VERSION,
+        battle_token=job.battle_token,
     )
-    db.session.add(history)
+    try:
+        summary = settle_battle(user, bot1, bot2, winner_side, history)
+    except IntegrityError:
+        # Already settled (a replayed job); just point the job at it
+        db.session.rollback()
+        existing = History.query.filter_by(battle_token=job.battle_token).one()
+        finish_job(job, existing.id)
+        return
+
+    elo = None
+    if summary["elo"]:
+        winner_user, loser_user, old_winner_rating, old_loser_rating, rating_gain, rating_loss = summary["elo"]
+        elo = [winner_user.username, loser_user.username, old_winner_rating, old_loser_rating,
+               winner_user.rating, loser_user.rating, rating_gain, rating_loss]
+    finish_job(job, history.id, json.dumps({
+        "username": user.username,
+        "user_result": summary["user_result"],
+        "xp_gained": summary["xp_gained"],
+        "levels_gained": summary["levels_gained"],
+        "elo": elo,
+    }))
+
+
+@app.route("/battle_job/<int:job_id>")
+@login_required
+def battle_job(job_id):
+    job = BattleJob.query.get_or_404(job_id)
+    if job.user_id != session["user_id"]:
+        flash("You don't have permission to view this battle.", "danger")
+        return redirect(url_for("history"))
+
+    if job.status == FAILED:
+        flash(job.error or "The battle could not be played.", "danger")
+        return redirect(url_for("battle_select"))
+    if job.status != DONE:
+        # Inline mode has no worker to pick up a job whose request died
+        # mid-battle (or one queued in worker mode); the polling page plays it
+        if app.config["BATTLE_JOBS"] == "inline" and reclaim_job(job):
+            run_claimed(job, run_battle_job)
+            return redirect(url_for("battle_job", job_id=job.id))
+        return render_template("battle_job.html", job=job)
+
+    # Settlement messages are shown once, on the way to the result
+    if job.summary:
+        summary = json.loads(job.summary)
+        if summary["user_result"] == "lose":
+            flash(f"Congratulations {summary['username']}! You gained {summary['xp_gained']} XP and {summary['levels_gained']} levels.", "success")
+        if summary["elo"]:
+            winner, loser, old_winner_rating, old_loser_rating, winner_rating, loser_rating, rating_gain, rating_loss = summary["elo"]
+            flash(f"🏆 {winner} won! Rating: {old_winner_rating} → {winner_rating} (+{rating_gain})", "success")
+            flash(f"💔 {loser} lost. Rating: {old_loser_rating} → {loser_rating} ({rating_loss})", "info")
+        job.summary = None
+        db.session.commit()
+    return redirect(url_for("combat_result", history_id=job.history_id))
 
-    db.session.commit()
+
+def settle_queued_battle(first, second, result):
+    """
+    Store and settle a battle played by the ranked queue (runs on one of its
+    threads). Returns the history id, or None if a bot was deleted meanwhile.
+    """
+    with app.app_context():
+        lock_battle_players(first.user_id, first.bot_id, second.bot_id)
+        bot1 = db.session.get(Bot, first.bot_id)
+        bot2 = db.session.get(Bot, second.bot_id)
+        if bot1 is None or bot2 is None:
+            return None
+        # Bots are named as they were when queued; store the current names
+        winner_side = result["winner_side"]
+        winner_name = result["winner"] if winner_side is None else (bot1.name, bot2.name)[winner_side]
+
+        history = History(
+            bot1_id=bot1.id,
+            bot2_id=bot2.id,
+            user1_id=bot1.user_id,
+            user2_id=bot2.user_id,
+            bot1_name=bot1.name,
+            bot2_name=bot2.name,
+            winner=winner_name,
+            seed=result["seed"],
+            bot1_snapshot_id=first.snapshot_id,
+            bot2_snapshot_id=second.snapshot_id,
+            log_data=encode_log(result["log"]),
+            log_version=ENGINE_VERSION,
+        )
+        user = db.session.get(User, first.user_id)
+        settle_battle(user, bot1, bot2, winner_side, history, reward_both=True)
+        return history.id
 
 
-    stats1_display = apply_upgrade_arena_effects(stats1_base, bot1_upgrades)
-    stats2_display = apply_upgrade_arena_effects(stats2_base, bot2_upgrades)
-    stats1_display["weapon_atk"] = stats1_base["weapon_atk"]
-    stats1_display["weapon_name"] = stats1_base["weapon_name"]
-    stats1_display["weapon_type"] = stats1_base["weapon_type"]
-    stats1_display["proc"] = stats1_base["proc"]
-    stats1_display["upgrades"] = stats1["upgrades"]
-    stats2_display["weapon_atk"] = stats2_base["weapon_atk"]
-    stats2_display["weapon_name"] = stats2_base["weapon_name"]
-    stats2_display["weapon_type"] = stats2_base["weapon_type"]
-    stats2_display["proc"] = stats2_base["proc"]
-    stats2_display["upgrades"] = stats2["upgrades"]
+ranked_queue.settle = settle_queued_battle
+ranked_queue.workers = app.config["RANKED_QUEUE_WORKERS"]
 
+@app.route("/queue", methods=["GET", "POST"])
+@login_required
+def ranked_queue_view():
+    user = get_current_user()
+
+    if request.method == "POST":
+        bot = Bot.query.get(request.form.get("bot_id"))
+        if not bot or bot.user_id != user.id:
+            flash("You can only queue with your own bots!", "danger")
+            return redirect(url_for("battle_select"))
+
+        # Stats are frozen now; edits made while waiting apply next time
+        snapshot = battle_snapshot(bot)
+        db.session.commit()
+        values = {field: getattr(snapshot, field) for field in SNAPSHOT_FIELDS}
+        ranked_queue.join(user.id, bot.id, bot.name, user.rating, snapshot.id, values)
+        ranked_queue.start()
+        return redirect(url_for("ranked_queue_view"))
+
+    state, value = ranked_queue.status(user.id)
+    if state == "matched":
+        ranked_queue.leave(user.id)
+        return redirect(url_for("combat_result", history_id=value))
+    if state == "failed":
+        flash("Your queued battle could not be played. Please queue again.", "danger")
+        return redirect(url_for("battle_select"))
+    if state is None:
+        return redirect(url_for("battle_select"))
+
+    waited = int(ranked_queue.clock() - value.joined_at)
     return render_template(
-    "combat_log.html",
-    bot1=bot1,
-    bot2=bot2,
-    stats1=stats1_display,
-    stats2=stats2_display,
-    log=log,
-    winner=winner_name,
-    xp_gained=xp_gained,
-    levels_gained=levels_gained,
-    seed=seed,
-    new_level=user.level if levels_gained else None,
-    is_replay = False
-)
+        "queue.html",
+        entry=value,
+        waited=waited,
+        tolerance=int(ranked_queue.tolerance(value, ranked_queue.clock())),
+        queued=len(ranked_queue),
+    )
+
+@app.route("/queue/leave", methods=["POST"])
+@login_required
+def leave_ranked_queue():
+    if ranked_queue.leave(session["user_id"]):
+        flash("You left the ranked queue.", "info")
+    return redirect(url_for("battle_select"))
+
+# Opponent players offered per battle_select page, and bots shown per player
+OPPONENT_SAMPLE = 10
+OPPONENT_BOTS_PER_USER = 2
 
 @app.route("/battle", methods=["GET", "POST"])
 @login_required
 def battle_select():
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
     
     if request.method == "POST":
         bot1_id = request.form.get("bot1")
@@ -1234,27 +1066,32 @@ def battle_select():
             flash("Please select an opponent's bot!", "warning")
             return redirect(url_for("battle_select"))
         
-        return redirect(url_for('combat_log', bot1_id=bot1_id, bot2_id=bot2_id))
+        # 307 keeps the POST body (including battle_token) on the redirect
+        return redirect(url_for('combat_log', bot1_id=bot1_id, bot2_id=bot2_id), code=307)
     
 
     my_bots = user.bots
     my_rating = user.rating
     
-    # Find suitable opponents (within ±200 rating)
-    min_rating = my_rating - 200
-    max_rating = my_rating + 200
-    
-    opponent_users = User.query.filter(
-        User.id != user.id,
-        User.rating >= min_rating,
-        User.rating <= max_rating
-    ).order_by(User.rating.desc()).limit(10).all()
-    
-   
-    matched_bots = []
-    for opponent in opponent_users:
-        for bot in opponent.bots:
-            matched_bots.append(bot)
+    # A random sample of nearby-rated opponents and a few of each one's
+    # bots (matchmaking.py), so the page and win_chances stay bounded
+    opponent_bot_ids, _ = matchmaking.sample_bots(
+        my_rating, OPPONENT_SAMPLE, OPPONENT_BOTS_PER_USER, exclude=user.id
+    )
+
+    # Those bots in one query, with owner, weapon and equipped weapon
+    # loaded up front so the page does not query per bot
+    matched_bots = (
+        Bot.query.join(Bot.user)
+        .filter(Bot.id.in_(opponent_bot_ids))
+        .options(
+            contains_eager(Bot.user),
+            selectinload(Bot.weapon),
+            selectinload(Bot.equipped_weapon_ownership).joinedload(WeaponOwnership.weapon),
+        )
+        .order_by(User.rating.desc(), User.id, Bot.id)
+        .all()
+    )
     
     opponent_data = []
     for bot in matched_bots:
@@ -1271,7 +1108,7 @@ def battle_select():
             'name': bot.name,
             'level': bot.level,
             'algorithm': bot.algorithm,
-            'owner': User.query.get(bot.user_id).username,
+            'owner': bot.user.username,
             'wins': bot.botwins,
             'losses': bot.botlosses,
             'total_battles': total_battles,
@@ -1284,196 +1121,197 @@ def battle_select():
         my_bots=my_bots,
         matched_bots=matched_bots,
         my_rating=my_rating,
-        opponent_data=opponent_data
+        opponent_data=opponent_data,
+        win_chances=win_chances(my_bots, matched_bots),
+        battle_token=issue_battle_token()
     )
 
-def apply_algorithm(bot):
-    equipped = WeaponOwnership.query.filter_by(bot_id=bot.id, equipped=True).first()
-    weapon_atk = equipped.effective_atk() if equipped else 0
-
-    base_stats = {
-        "hp": bot.hp,
-        "energy": bot.energy,
-        "proc": bot.atk,
-        "def": bot.defense,
-        "clk": bot.speed,
-        "luck": bot.luck,
-        "logic": bot.logic or 0,
-    }
-
-    algo = bot.algorithm
-
-    effects = algorithm_effects.get(algo, {}).copy()
+def history_cursor(battle):
+    """Keyset cursor for the battles after `battle` (newest first)."""
+    return f"{battle.timestamp.isoformat()},{battle.id}"
 
-    # Apply multipliers
-    final_stats = {
-        "hp": int(base_stats["hp"] * effects.get("hp", 1.0)),
-        "energy": int(base_stats["energy"] * effects.get("energy", 1.0)),
-        "proc": int(base_stats["proc"] * effects.get("proc", 1.0)),
-        "def": int(base_stats["def"] * effects.get("def", 1.0)),
-        "clk": int(base_stats["clk"] * effects.get("clk", 1.0)),
-        "luck": int(base_stats["luck"] * effects.get("luck", 1.0)),
-        "logic": int(base_stats["logic"] * effects.get("logic", 1.0)),
-    }
+def parse_history_cursor(cursor):
+    """(timestamp, id) from history_cursor, or None if missing or malformed."""
+    try:
+        timestamp, history_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(timestamp), int(history_id)
+    except (AttributeError, ValueError):
+        return None
 
-    return final_stats
+def history_page(user_id, page_size, before=None):
+    """
+    One page of a user's battles, newest first, older than the
+    (timestamp, id) cursor `before`. Each side of the battle is read as
+    its own index range and the two are merged, so the cost depends on
+    the page size only. Returns (summary rows, next cursor or None).
+    """
+    columns = (History.id, History.timestamp, History.bot1_name, History.bot2_name, History.winner)
+    sides = []
+    for query in (
+        db.select(*columns).where(History.user1_id == user_id),
+        db.select(*columns).where(History.user2_id == user_id, History.user1_id != user_id),
+    ):
+        if before is not None:
+            query = query.where(tuple_(History.timestamp, History.id) < before)
+        query = query.order_by(History.timestamp.desc(), History.id.desc()).limit(page_size + 1)
+        sides.append(db.select(query.subquery()))
+
+    merged = union_all(*sides).subquery()
+    rows = db.session.execute(
+        db.select(merged).order_by(merged.c.timestamp.desc(), merged.c.id.desc()).limit(page_size + 1)
+    ).all()
+
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, history_cursor(rows[-1])
+    return rows, None
 
 @app.route("/history")
 @login_required
 def history():
     user_id = session["user_id"]
-    
-    battles = History.query.filter(
-        or_(
-            History.user1_id == user_id,
-            History.user2_id == user_id
-        )
-    ).order_by(History.timestamp.desc()).all()
-    
-    return render_template("history.html", battles=battles)
+    before = parse_history_cursor(request.args.get("before"))
+
+    battles, next_cursor = history_page(user_id, app.config["HISTORY_PAGE_SIZE"], before)
+
+    return render_template(
+        "history.html",
+        battles=battles,
+        next_cursor=next_cursor,
+        first_page=before is None,
+    )
+
+def history_battle_bots(history):
+    """Fresh BattleBots for a stored battle, from its two snapshots."""
+    return (
+        snapshot_battle_bot(history.bot1_snapshot, history.bot1_name),
+        snapshot_battle_bot(history.bot2_snapshot, history.bot2_name),
+    )
+
+def history_events(history):
+    """
+    Log events of a stored battle, one at a time: the stored log when the
+    current engine produced it, otherwise re-simulated round by round (and
+    the stored log refreshed afterwards). Returns the winner.
+    """
+    if history.log_data and history.log_version == ENGINE_VERSION:
+        yield from decode_log(history.log_data)
+        return history.winner
+
+    battleA, battleB = history_battle_bots(history)
+    # The same stale replay is often asked for again before the refreshed
+    # log is saved (an EventSource reconnect, a second viewer)
+    inputs = battle_memo.inputs(battleA, battleB, history.seed)
+    result = battle_memo.lookup(inputs)
+    if result is not None:
+        yield from result["log"]
+    else:
+        log = []
+        events = iter_battle(battleA, battleB, history.seed)
+        try:
+            while True:
+                event = next(events)
+                log.append(event)
+                yield event
+        except StopIteration as stop:
+            result = stop.value
+        result["log"] = log
+        battle_memo.store(inputs, result)
+
+    history.log_data = encode_log(result["log"])
+    history.log_version = ENGINE_VERSION
+    db.session.commit()
+    return result["winner"]
+
+def snapshot_display_stats(snapshot):
+    """One side's column of combat_log.html's stat table."""
+    stats = {
+        "hp": snapshot.hp,
+        "energy": snapshot.energy,
+        "proc": snapshot.proc,
+        "def": snapshot.defense,
+        "clk": snapshot.clk,
+        "luck": snapshot.luck,
+        "logic": snapshot.logic or 0,
+    }
+    upgrades = upgrade_effects({field: getattr(snapshot, field) for field in UPGRADE_FIELDS})
+    display = apply_upgrade_arena_effects(stats, upgrades)
+    display["proc"] = snapshot.proc
+    display["weapon_atk"] = snapshot.weapon_atk or 0
+    display["weapon_name"] = snapshot.weapon_name
+    display["weapon_type"] = snapshot.weapon_type
+    display["algorithm"] = snapshot.algorithm
+    display["upgrades"] = get_upgrade_labels(snapshot)
+    return display
+
+# Both snapshots in the same query as the History row
+HISTORY_SNAPSHOTS = (joinedload(History.bot1_snapshot), joinedload(History.bot2_snapshot))
+
+def render_battle(history, is_replay):
+    """Render combat_log.html from a stored History row."""
+    return render_template(
+        "combat_log.html",
+        winner=history.winner,
+        stats1=snapshot_display_stats(history.bot1_snapshot),
+        stats2=snapshot_display_stats(history.bot2_snapshot),
+        history=history,
+        is_replay=is_replay,
+    )
+
+@app.route("/combat_log/<int:history_id>")
+@login_required
+def combat_result(history_id):
+    user_id = session["user_id"]
+    history = History.query.options(*HISTORY_SNAPSHOTS).get_or_404(history_id)
+
+    if history.user1_id != user_id and history.user2_id != user_id:
+        flash("You don't have permission to view this battle.", "danger")
+        return redirect(url_for("history"))
+
+    return render_battle(history, is_replay=False)
 
 @app.route("/history/<int:history_id>")
 @login_required
 def view_history(history_id):
     user_id = session["user_id"]
-    history = History.query.get_or_404(history_id)
+    history = History.query.options(*HISTORY_SNAPSHOTS).get_or_404(history_id)
     
     if history.user1_id != user_id and history.user2_id != user_id:
         flash("You don't have permission to view this battle.", "danger")
         return redirect(url_for("history"))
-    
-    stats1 = {
-        "hp": history.bot1_hp,
-        "energy": history.bot1_energy,
-        "proc": history.bot1_proc,
-        "def": history.bot1_defense,  
-        "clk": history.bot1_clk,
-        "luck": history.bot1_luck,
-        "logic": history.bot1_logic or 0,
-        "weapon_atk": history.bot1_weapon_atk if history.bot1_weapon_atk else 0,
-        "weapon_name": history.bot1_weapon_name,
-        "weapon_type": history.bot1_weapon_type,
-        "upgrades": [
-            label for label, enabled in [
-                ("Armor Plating", history.bot1_upgrade_armor_plating),
-                ("Overclock Unit", history.bot1_upgrade_overclock_unit),
-                ("Regen Core", history.bot1_upgrade_regen_core),
-                ("Critical Subroutine", history.bot1_upgrade_critical_subroutine),
-                ("Energy Recycler", history.bot1_upgrade_energy_recycler),
-                ("EMP Shield", history.bot1_upgrade_emp_shield),
-            ] if enabled
-        ]
-    }
-    
-    stats2 = {
-        "hp": history.bot2_hp,
-        "energy": history.bot2_energy,
-        "proc": history.bot2_proc,
-        "def": history.bot2_defense,   
-        "clk": history.bot2_clk,
-        "luck": history.bot2_luck,
-        "logic": history.bot2_logic or 0,
-        "weapon_atk": history.bot2_weapon_atk if history.bot2_weapon_atk else 0,
-        "weapon_name": history.bot2_weapon_name,
-        "weapon_type": history.bot2_weapon_type,
-        "upgrades": [
-            label for label, enabled in [
-                ("Armor Plating", history.bot2_upgrade_armor_plating),
-                ("Overclock Unit", history.bot2_upgrade_overclock_unit),
-                ("Regen Core", history.bot2_upgrade_regen_core),
-                ("Critical Subroutine", history.bot2_upgrade_critical_subroutine),
-                ("Energy Recycler", history.bot2_upgrade_energy_recycler),
-                ("EMP Shield", history.bot2_upgrade_emp_shield),
-            ] if enabled
-        ]
-    }
-    
-    # Recreate BattleBots with stored stats (including logic for accurate replay)
-    battleA = BattleBot(
-        name=history.bot1_name,
-        hp=history.bot1_hp,
-        energy=history.bot1_energy,
-        proc=history.bot1_proc,
-        defense=history.bot1_defense,
-        clk=history.bot1_clk,
-        luck=history.bot1_luck,
-        logic=stats1["logic"],
-        weapon_atk=0,
-        weapon_type=history.bot1_weapon_type,
-        algorithm=history.bot1_algorithm,
-        items=build_items_from_flags({
-            "upgrade_armor_plating": history.bot1_upgrade_armor_plating,
-            "upgrade_overclock_unit": history.bot1_upgrade_overclock_unit,
-            "upgrade_regen_core": history.bot1_upgrade_regen_core,
-            "upgrade_critical_subroutine": history.bot1_upgrade_critical_subroutine,
-            "upgrade_energy_recycler": history.bot1_upgrade_energy_recycler,
-            "upgrade_emp_shield": history.bot1_upgrade_emp_shield,
-        }),
-    )
 
-    battleB = BattleBot(
-        name=history.bot2_name,
-        hp=history.bot2_hp,
-        energy=history.bot2_energy,
-        proc=history.bot2_proc,
-        defense=history.bot2_defense,
-        clk=history.bot2_clk,
-        luck=history.bot2_luck,
-        logic=stats2["logic"],
-        weapon_atk=0,
-        weapon_type=history.bot2_weapon_type,
-        algorithm=history.bot2_algorithm,
-        items=build_items_from_flags({
-            "upgrade_armor_plating": history.bot2_upgrade_armor_plating,
-            "upgrade_overclock_unit": history.bot2_upgrade_overclock_unit,
-            "upgrade_regen_core": history.bot2_upgrade_regen_core,
-            "upgrade_critical_subroutine": history.bot2_upgrade_critical_subroutine,
-            "upgrade_energy_recycler": history.bot2_upgrade_energy_recycler,
-            "upgrade_emp_shield": history.bot2_upgrade_emp_shield,
-        }),
-    )
-    
-    result = full_battle(battleA, battleB, history.seed)
-    winner = result["winner"]
-    log = result["log"]
-
-    upgrades1 = {
-        "armor": history.bot1_upgrade_armor_plating,
-        "overclock": history.bot1_upgrade_overclock_unit,
-        "regen": history.bot1_upgrade_regen_core,
-        "crit": history.bot1_upgrade_critical_subroutine,
-        "recycler": history.bot1_upgrade_energy_recycler,
-        "emp": history.bot1_upgrade_emp_shield,
-    }
-    upgrades2 = {
-        "armor": history.bot2_upgrade_armor_plating,
-        "overclock": history.bot2_upgrade_overclock_unit,
-        "regen": history.bot2_upgrade_regen_core,
-        "crit": history.bot2_upgrade_critical_subroutine,
-        "recycler": history.bot2_upgrade_energy_recycler,
-        "emp": history.bot2_upgrade_emp_shield,
-    }
-    stats1_display = apply_upgrade_arena_effects(stats1, upgrades1)
-    stats2_display = apply_upgrade_arena_effects(stats2, upgrades2)
-    stats1_display["weapon_atk"] = stats1["weapon_atk"]
-    stats1_display["weapon_name"] = stats1["weapon_name"]
-    stats1_display["weapon_type"] = stats1["weapon_type"]
-    stats1_display["proc"] = stats1["proc"]
-    stats1_display["upgrades"] = stats1["upgrades"]
-    stats2_display["weapon_atk"] = stats2["weapon_atk"]
-    stats2_display["weapon_name"] = stats2["weapon_name"]
-    stats2_display["weapon_type"] = stats2["weapon_type"]
-    stats2_display["proc"] = stats2["proc"]
-    stats2_display["upgrades"] = stats2["upgrades"]
+    return render_battle(history, is_replay=True)
 
-    return render_template(
-        "combat_log.html",
-        log=log,
-        winner=winner,
-        stats1=stats1_display,
-        stats2=stats2_display,
-        history=history,
-        is_replay=True
+@app.route("/history/<int:history_id>/stream")
+@login_required
+def stream_history(history_id):
+    """
+    Server-Sent Events: one [css class, text] message per log event (the
+    text from battle.render_event), then an "end" event with the winner.
+    """
+    user_id = session["user_id"]
+    history = History.query.get_or_404(history_id)
+
+    if history.user1_id != user_id and history.user2_id != user_id:
+        return Response(status=403)
+
+    def sse():
+        # Load again inside the stream: the view's session is gone once it returns
+        history = db.session.get(History, history_id)
+        names = (history.bot1_name, history.bot2_name)
+        events = history_events(history)
+        try:
+            while True:
+                event = next(events)
+                line = [EVENT_TEXT[event[0]][0], render_event(event, names)]
+                yield f"data: {json.dumps(line)}\n\n"
+        except StopIteration as stop:
+            yield f"event: end\ndata: {json.dumps({'winner': stop.value})}\n\n"
+
+    return Response(
+        stream_with_context(sse()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 @app.route("/weapons")
@@ -1484,7 +1322,7 @@ def weapons_shop():
 @app.route("/weapon/<int:weapon_id>/level_up", methods=["POST"])
 @login_required
 def level_up_weapon(weapon_id):
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
     ownership = WeaponOwnership.query.filter_by(user_id=user.id, weapon_id=weapon_id).first()
     if not ownership or not ownership.weapon:
         flash("You do not own this weapon.", "warning")
@@ -1505,6 +1343,7 @@ def level_up_weapon(weapon_id):
 
         user.tokens -= level_cost
         ownership.level += 1
+        weapon_changed(ownership.bot_id)
         db.session.commit()
         flash(f"{weapon.name} leveled up! (-{level_cost} tokens)", "success")
     else:
@@ -1517,7 +1356,7 @@ def level_up_weapon(weapon_id):
 @app.route("/buy_weapon/<int:weapon_id>", methods=["POST"])
 @login_required
 def buy_weapon(weapon_id):
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
     weapon = Weapon.query.get_or_404(weapon_id)
 
     existing = WeaponOwnership.query.filter_by(
@@ -1551,7 +1390,7 @@ def gear(bot_id):
     bot = Bot.query.get_or_404(bot_id)
     user_id = bot.user_id 
     owned_weapons = WeaponOwnership.query.filter_by(user_id=user_id).all()
-    user = User.query.get(session["user_id"])
+    user = get_current_user()
     user_tokens = int(user.tokens or 0) if user else 0
 
     if request.method == "POST":
@@ -1564,10 +1403,13 @@ def gear(bot_id):
                 equipped=True
             ).update({"equipped": False, "bot_id": None})
 
+            previous_bot_id = None
             if ownership_id:
                 ownership = WeaponOwnership.query.get_or_404(int(ownership_id))
+                previous_bot_id = ownership.bot_id
                 ownership.bot_id = bot.id
                 ownership.equipped = True
+            weapon_changed(bot.id, previous_bot_id)
 
             db.session.commit()
             flash("Weapon equipped successfully!", "success")
@@ -1588,13 +1430,14 @@ def gear(bot_id):
             current_level = int(ow.level or 1)
             level_cost = int(round(base_price * (1 + 0.6 * (current_level - 1))))
 
-            user = User.query.get(session["user_id"])
+            user = get_current_user()
             if not user or int(user.tokens or 0) < level_cost:
                 flash("Not enough credits to level up this weapon.", "warning")
                 return redirect(url_for("gear", bot_id=bot.id))
 
             user.tokens = int(user.tokens or 0) - level_cost
             ow.level += 1
+            weapon_changed(ow.bot_id)
             db.session.commit()
             flash(f"{ow.weapon.name} leveled up! (-{level_cost} tokens)", "success")
 
@@ -1611,48 +1454,28 @@ def gear(bot_id):
 @app.route("/leaderboard")
 @login_required
 def leaderboard():
-    # Get top 50 players by rating
-    top_players = User.query.filter(
-        User.wins + User.losses > 0  # Only players who have battled
-    ).order_by(User.rating.desc()).limit(50).all()
+    use_window = app.config["LEADERBOARD_RANKING"] == "window" and supports_window_functions(db.engine)
+
+    # Top 50 players by rating (only players who have battled are ranked)
+    top_players = top_ranked_users(50) if use_window else users_in_order(ranking.top(50))
     
-    # Get current user's rank if logged in
+    # Get current user's rank if logged in, with 5 players above and 5 below
     current_user_rank = None
     user_has_matches = False
     nearby_players = []
-    show_nearby = False
+    nearby_start_rank = None
     if "user_id" in session:
-        user = User.query.get(session["user_id"])
+        user = get_current_user()
         user_has_matches = (user.wins + user.losses) > 0
-        if user_has_matches:
-            higher_rated = (User.query.filter(or_(User.wins > 0, User.losses > 0),User.rating > user.rating).count())
-            current_user_rank = higher_rated + 1
+        if user_has_matches and use_window:
+            current_user_rank, nearby_start_rank, nearby_players = window_rank(user.id, 5)
+        elif user_has_matches:
+            # The row just loaded is authoritative for this user
+            ranking.set(user.id, user.rating)
+            current_user_rank, nearby_start_rank, nearby_players = index_rank(user.id, user.rating, 5)
 
     # Only show nearby players if user is NOT in top 50
-    if current_user_rank is not None and current_user_rank > 50:
-        show_nearby = True
-                
-        # Get all players with matches, sorted by rating
-        all_ranked_players = User.query.filter(
-            User.wins + User.losses > 0
-        ).order_by(User.rating.desc()).all()
-                
-        # Find user's position in the list
-        user_index = None
-        for i, player in enumerate(all_ranked_players):
-            if player.id == user.id:
-                user_index = i
-                break
-                
-        if user_index is not None:
-            # Get 5 players above and 5 below
-            start_index = max(0, user_index - 5)
-            end_index = min(len(all_ranked_players), user_index + 6)
-                    
-            nearby_players = all_ranked_players[start_index:end_index]
-                    
-            # Calculate the starting rank number for nearby players
-            nearby_start_rank = start_index + 1
+    show_nearby = current_user_rank is not None and current_user_rank > 50
     
     return render_template(
         "leaderboard.html",
@@ -1667,28 +1490,6 @@ def leaderboard():
 #xp system
 
 
-def xp_to_next_level(level):
-    return 100 + (level - 1) * 50  # progressive leveling
-
-def add_xp(user, amount):
-    """
-    Adds XP to a user and handles leveling.
-    Returns number of levels gained.
-    """
-    user.xp += amount
-    levels_gained = 0
-
-    while user.xp >= xp_to_next_level(user.level):
-        user.xp -= xp_to_next_level(user.level)
-        user.level += 1
-        levels_gained += 1
-
-        # Rewards per level
-        user.tokens = int(user.tokens or 0) + 20 
-
-    db.session.commit()
-    return levels_gained 
-
 @app.route("/database")
 @login_required
 def database():
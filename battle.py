@@ -1,6 +1,14 @@
+import json
 import random
+import re
+import zlib
+from operator import attrgetter
 from constants import ALGORITHM_XP_MULTIPLIER
 
+# Bump whenever battle rules or log text change, so stored replays
+# recorded by an older engine are re-simulated instead of served.
+ENGINE_VERSION = 2
+
 # -----------------------------
 # Character Items
 # -----------------------------
@@ -59,6 +67,38 @@ CHARACTER_ITEMS = [
 # BattleBot Class
 # -----------------------------
 class BattleBot:
+    # Fixed slots keep instances small and attribute access fast, and let
+    # snapshot()/restore() copy the whole state as one tuple.
+    __slots__ = (
+        "name",
+        "side",
+        "hp",
+        "max_hp",
+        "energy",
+        "max_energy",
+        "proc",
+        "defense",
+        "speed",
+        "clk",
+        "luck",
+        "logic",
+        "weapon_atk",
+        "weapon_type",
+        "special_effect",
+        "algorithm",
+        "damage_dealt",
+        "critical_hits",
+        "dodges",
+        "rounds_alive",
+        "extra_attacks",
+        "ability_used",
+        "regen",
+        "energy_gain",
+        "energy_drain",
+        "emp_shield",
+        "_adapt_logic_applied",
+    )
+
     def __init__(
         self,
         name,
@@ -77,6 +117,7 @@ class BattleBot:
         items=None,
     ):
         self.name = name
+        self.side = 0        # 0 = botA, 1 = botB; set by iter_battle, used in log events
         self.hp = hp
         self.max_hp = hp
         self.energy = energy
@@ -116,6 +157,57 @@ class BattleBot:
     def is_alive(self):
         return self.hp > 0 and self.energy > 0
 
+    def snapshot(self):
+        """Whole state as a tuple, e.g. taken right after construction (items applied)."""
+        return _snapshot_fields(self)
+
+    def restore(self, state):
+        """
+        Reset to a state from snapshot(). Lets one prepared bot fight many
+        battles (arena mods, CHAOS-RND and abilities mutate it) without
+        being rebuilt each time.
+        """
+        # same order as __slots__
+        (
+            self.name,
+            self.side,
+            self.hp,
+            self.max_hp,
+            self.energy,
+            self.max_energy,
+            self.proc,
+            self.defense,
+            self.speed,
+            self.clk,
+            self.luck,
+            self.logic,
+            self.weapon_atk,
+            self.weapon_type,
+            self.special_effect,
+            self.algorithm,
+            self.damage_dealt,
+            self.critical_hits,
+            self.dodges,
+            self.rounds_alive,
+            self.extra_attacks,
+            self.ability_used,
+            self.regen,
+            self.energy_gain,
+            self.energy_drain,
+            self.emp_shield,
+            self._adapt_logic_applied,
+        ) = state
+
+    @classmethod
+    def from_snapshot(cls, state):
+        """New bot from a snapshot() tuple, skipping __init__ and item application."""
+        bot = cls.__new__(cls)
+        bot.restore(state)
+        return bot
+
+
+_snapshot_fields = attrgetter(*BattleBot.__slots__)
+
 # -----------------------------
 # Arena Flavor & Effects
 # -----------------------------
@@ -161,11 +253,120 @@ ARENA_EFFECTS = {
     }
 }
 
+# Battle length limits
+MAX_ROUNDS = 10
+# DRAW rule: draw when both bots don’t land any hits for 10 turns in a row
+NO_HIT_TURN_LIMIT = 10
+
+# -----------------------------
+# Battle Log Events
+# -----------------------------
+# The log is a list of (code, side, *args) tuples with int/float args only;
+# side is the bot the event is about (0 = botA, 1 = botB, -1 = none). Text
+# is produced only when the log is shown, from EVENT_TEXT: render_event()
+# here and the same templates in combat_log.html. In a template, {name} /
+# {other} are the bot on `side` / its opponent, {i} is args[i], {i:.2f}
+# formats it and {i:<lookup>} indexes EVENT_LOOKUPS[<lookup>].
+ARENAS = tuple(ARENA_EFFECTS)
+ARENA_INDEX = {arena: i for i, arena in enumerate(ARENAS)}
+CHAOS_STATS = ("hp", "energy", "proc", "defense", "clk", "luck", "logic")
+
+EV_ARENA = 1            # (arena index)
+EV_ROUND = 2            # (round)
+EV_ADAPT = 3            # (old logic, new logic)
+EV_CORE_MELTDOWN = 4
+EV_FORTIFY_MATRIX = 5
+EV_SYSTEM_BALANCE = 6
+EV_EVOLVE_PROTOCOL = 7
+EV_TIME_DILATION = 8
+EV_CHAOS = 9            # (stat, up, old, new) x 2
+EV_WHIFF = 10           # (arena index)
+EV_DODGE = 11
+EV_STATUS = 12          # (hp, energy)
+EV_CRIT = 13
+EV_REGEN = 14           # (hp)
+EV_ENERGY_GAIN = 15     # (energy)
+EV_ENERGY_DRAIN = 16    # (energy)
+EV_OUT_OF_ENERGY = 17
+EV_ATTACK = 18          # (damage)
+EV_EXTRA_ATTACK = 19    # (damage)
+EV_DEFEAT = 20
+EV_WINNER = 21
+EV_NO_HIT = 22          # (no-hit rounds, limit)
+EV_DRAW_NO_HITS = 23    # (limit)
+EV_DRAW_MAX_ROUNDS = 24
+
+# code -> (css type, text template)
+EVENT_TEXT = {
+    EV_ARENA: ("arena", "{0:flavor}"),
+    EV_ROUND: ("round", "(Round {0})"),
+    EV_ADAPT: ("special", "🤖 {name} has adapted! LOGIC increased from {0} to {1}."),
+    EV_CORE_MELTDOWN: ("special", "🔥 {name} activates Core Meltdown, sacrificing defense for raw power!"),
+    EV_FORTIFY_MATRIX: ("special", "🛡️ {name} engages Fortify Matrix, becoming a fortress but slowing down!"),
+    EV_SYSTEM_BALANCE: ("special", "⚖️ {name} restores equilibrium, regaining vitality and energy!"),
+    EV_EVOLVE_PROTOCOL: ("special", "🔄 {name} adapts mid-battle with Evolve Protocol!"),
+    EV_TIME_DILATION: ("special", "⏳ {name} bends time with Time Dilation!"),
+    EV_CHAOS: ("special", "⚙️ CHAOS-RND surges! {name}'s {0:stat} {1:sign}10% ({2} → {3}), {4:stat} {5:sign}10% ({6} → {7})."),
+    EV_WHIFF: ("whiff", "💨 {name} misses in the {0:arena} Arena!"),
+    EV_DODGE: ("dodge", "🌀 {name} dodged the attack!"),
+    EV_STATUS: ("status", "{name} HP: {0:.2f}, Energy: {1:.2f}"),
+    EV_CRIT: ("crit", "💥 Critical Hit! {name} lands a devastating strike!"),
+    EV_REGEN: ("regen", "💚 {name} regenerates {0} HP!"),
+    EV_ENERGY_GAIN: ("energy", "⚡ {name} gains {0} energy!"),
+    EV_ENERGY_DRAIN: ("energy", "🔻 {name} loses {0} energy from Overclock!"),
+    EV_OUT_OF_ENERGY: ("energy", "{name} has been defeated (out of energy)!"),
+    EV_ATTACK: ("attack", "{name} attacks {other} for {0:.2f} damage!"),
+    EV_EXTRA_ATTACK: ("attack", "{name} strikes again for {0:.2f} damage!"),
+    EV_DEFEAT: ("defeat", "{name} has been defeated!"),
+    EV_WINNER: ("battleover", "Battle Over! Winner: {name}"),
+    EV_NO_HIT: ("system", "No hits landed this round. No-hit rounds: {0}/{1}"),
+    EV_DRAW_NO_HITS: ("battleover", "DRAW! No hits landed for {0} rounds in a row."),
+    EV_DRAW_MAX_ROUNDS: ("battleover", " DRAW! Maximum rounds reached."),
+}
+
+EVENT_LOOKUPS = {
+    "flavor": [ARENA_FLAVOR[arena] for arena in ARENAS],
+    "arena": [arena.title() for arena in ARENAS],
+    "stat": [stat.upper() for stat in CHAOS_STATS],
+    "sign": ["-", "+"],
+}
+
+_EVENT_FIELD = re.compile(r"\{(\w+)(?::([^}]+))?\}")
+
 # -----------------------------
 # Utility Functions
 # -----------------------------
-def log_line(log, type, text):
-    log.append((type.strip().lower(), text))
+def log_line(log, code, side=-1, *args):
+    log.append((code, side) + args)
+
+def render_event(event, names):
+    """Text of one log event; names = (botA name, botB name)."""
+    code, side = event[0], event[1]
+    args = event[2:]
+    template = EVENT_TEXT[code][1]
+
+    def field(match):
+        key, spec = match.group(1), match.group(2)
+        if key == "name":
+            return str(names[side])
+        if key == "other":
+            return str(names[1 - side])
+        value = args[int(key)]
+        if spec is None:
+            return str(value)
+        if spec in EVENT_LOOKUPS:
+            return EVENT_LOOKUPS[spec][value]
+        return format(value, spec)
+
+    return _EVENT_FIELD.sub(field, template)
+
+def encode_log(log):
+    """Compress a battle log for storage next to its History row."""
+    raw = json.dumps(log, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(raw.encode("utf-8"), 9)
+
+def decode_log(data):
+    return [tuple(entry) for entry in json.loads(zlib.decompress(data).decode("utf-8"))]
 
 def calculate_turn_order(botA, botB, rng):
     if botA.clk > botB.clk:
@@ -253,33 +454,33 @@ def use_ability(attacker, defender, log, round_num=1, rng=None):
     if attacker.special_effect == "Core Meltdown":
         attacker.proc = int(attacker.proc * 1.15)
         attacker.defense = int(attacker.defense * 0.9)
-        log_line(log, "special",
-                 f"🔥 {attacker.name} activates Core Meltdown, sacrificing defense for raw power!")
+        if log is not None:
+            log_line(log, EV_CORE_MELTDOWN, attacker.side)
 
     elif attacker.special_effect == "Fortify Matrix":
         attacker.defense = int(attacker.defense * 1.2)
         attacker.speed = int(attacker.speed * 0.9)
-        log_line(log, "special",
-                 f"🛡️ {attacker.name} engages Fortify Matrix, becoming a fortress but slowing down!")
+        if log is not None:
+            log_line(log, EV_FORTIFY_MATRIX, attacker.side)
 
     elif attacker.special_effect == "System Balance":
         attacker.hp += int(attacker.hp * 0.1)
         attacker.energy += int(attacker.energy * 0.1)
-        log_line(log, "special",
-                 f"⚖️ {attacker.name} restores equilibrium, regaining vitality and energy!")
+        if log is not None:
+            log_line(log, EV_SYSTEM_BALANCE, attacker.side)
 
     elif attacker.special_effect == "Evolve Protocol":
         stats = ["hp", "proc", "defense", "speed", "luck", "energy"]
         chosen_stats = rng.sample(stats, 2)
         for stat in chosen_stats:
             setattr(attacker, stat, int(getattr(attacker, stat) * 1.10))
-            log_line(log, "special",
-            f"🔄 {attacker.name} adapts mid-battle with Evolve Protocol!")
+            if log is not None:
+                log_line(log, EV_EVOLVE_PROTOCOL, attacker.side)
 
     elif attacker.special_effect == "Time Dilation":
         attacker.extra_attacks = 1
-        log_line(log, "special",
-                 f"⏳ {attacker.name} bends time with Time Dilation!")
+        if log is not None:
+            log_line(log, EV_TIME_DILATION, attacker.side)
         
 def calculate_damage(attacker, defender, log, rng, arena="neutral"):
     effects = ARENA_EFFECTS.get(arena, ARENA_EFFECTS["neutral"])
@@ -290,7 +491,8 @@ def calculate_damage(attacker, defender, log, rng, arena="neutral"):
         whiff_chance = effects["whiff_melee"]
 
     if rng.random() < whiff_chance:
-        log_line(log, "whiff", f"💨 {attacker.name} misses in the {arena_name(arena)} Arena!")
+        if log is not None:
+            log_line(log, EV_WHIFF, attacker.side, ARENA_INDEX.get(arena, ARENA_INDEX["neutral"]))
         return 0.0
 
     # Base damage = effective proc minus defense reduction
@@ -315,8 +517,9 @@ def calculate_damage(attacker, defender, log, rng, arena="neutral"):
         final_dodge = dodge_chance * (100.0 / (100.0 + attacker_logic))
         if rng.random() < final_dodge:
             defender.dodges += 1
-            log_line(log, "dodge", f"🌀 {defender.name} dodged the attack!")
-            log_line(log, "status", f"{defender.name} HP: {defender.hp:.2f}, Energy: {defender.energy:.2f}")
+            if log is not None:
+                log_line(log, EV_DODGE, defender.side)
+                log_line(log, EV_STATUS, defender.side, defender.hp, defender.energy)
             return 0.0
 
     # Critical hit check — defender LOGIC reduces incoming crit chance
@@ -327,7 +530,8 @@ def calculate_damage(attacker, defender, log, rng, arena="neutral"):
     is_crit = rng.random() < (effective_crit_pct / 100.0)
     if is_crit:
         attacker.critical_hits += 1
-        log_line(log, "crit", f"💥 Critical Hit! {attacker.name} lands a devastating strike!")
+        if log is not None:
+            log_line(log, EV_CRIT, attacker.side)
         base_proc *= 2.0
 
     # Track damage dealt
@@ -342,13 +546,16 @@ def battle_round(botA, botB, log, rng, arena="neutral", round_num=1):
     for bot in (botA, botB):
         if bot.regen > 0:
             bot.hp += bot.regen
-            log_line(log, "regen", f"💚 {bot.name} regenerates {bot.regen} HP!")
+            if log is not None:
+                log_line(log, EV_REGEN, bot.side, bot.regen)
         if bot.energy_gain > 0:
             bot.energy += bot.energy_gain
-            log_line(log, "energy", f"⚡ {bot.name} gains {bot.energy_gain} energy!")
+            if log is not None:
+                log_line(log, EV_ENERGY_GAIN, bot.side, bot.energy_gain)
         if bot.energy_drain > 0 and not bot.emp_shield:
             bot.energy -= bot.energy_drain
-            log_line(log, "energy", f"🔻 {bot.name} loses {bot.energy_drain} energy from Overclock!")
+            if log is not None:
+                log_line(log, EV_ENERGY_DRAIN, bot.side, bot.energy_drain)
         bot.energy = max(bot.energy, 0)
     round_had_damage = False
     # Track rounds alive
@@ -358,8 +565,7 @@ def battle_round(botA, botB, log, rng, arena="neutral", round_num=1):
         if getattr(bot, "algorithm", None) != "CHAOS-RND":
             return
 
-        stats = ["hp", "energy", "proc", "defense", "clk", "luck", "logic"]
-        chosen = rng.sample(stats, 2)
+        chosen = rng.sample(CHAOS_STATS, 2)
         changes = []
 
         for stat in chosen:
@@ -373,14 +579,12 @@ def battle_round(botA, botB, log, rng, arena="neutral", round_num=1):
             setattr(bot, stat, new_value)
             changes.append((stat, direction, old_value, new_value))
 
-        # Log a concise summary of changes
-        if changes:
-            parts = []
+        # Log a concise summary of changes (always two stats)
+        if changes and log is not None:
+            args = []
             for stat, direction, old, new in changes:
-                sign = "+" if direction == "up" else "-"
-                parts.append(f"{stat.upper()} {sign}10% ({old} → {new})")
-            msg = f"⚙️ CHAOS-RND surges! {bot.name}'s " + ", ".join(parts) + "."
-            log_line(log, "special", msg)
+                args += (CHAOS_STATS.index(stat), int(direction == "up"), old, new)
+            log_line(log, EV_CHAOS, bot.side, *args)
 
     apply_chaos(botA)
     apply_chaos(botB)
@@ -398,8 +602,9 @@ def battle_round(botA, botB, log, rng, arena="neutral", round_num=1):
         attacker.energy = max(attacker.energy, 0)
 
         if not attacker.is_alive():
-            log_line(log, "energy", f"{attacker.name} has been defeated (out of energy)!")
-            return {"winner": defender.name, "damage": round_had_damage}
+            if log is not None:
+                log_line(log, EV_OUT_OF_ENERGY, attacker.side)
+            return {"winner": defender.name, "winner_side": defender.side, "damage": round_had_damage}
 
         use_ability(attacker, defender, log=log, round_num=round_num, rng=rng)
 
@@ -408,40 +613,50 @@ def battle_round(botA, botB, log, rng, arena="neutral", round_num=1):
             round_had_damage = True
         defender.hp = max(defender.hp - damage, 0)
 
-        log_line(log, "attack", f"{attacker.name} attacks {defender.name} for {damage:.2f} damage!")
-        log_line(log, "status", f"{defender.name} HP: {defender.hp:.2f}, Energy: {defender.energy:.2f}")
+        if log is not None:
+            log_line(log, EV_ATTACK, attacker.side, damage)
+            log_line(log, EV_STATUS, defender.side, defender.hp, defender.energy)
 
         if attacker.extra_attacks > 0 and defender.is_alive():
             attacker.extra_attacks -= 1
             attacker.energy -= 10
             attacker.energy = max(attacker.energy, 0)
             if not attacker.is_alive():
-                log_line(log, "energy", f"{attacker.name} has been defeated (out of energy)!")
-                return {"winner": defender.name, "damage": round_had_damage}
+                if log is not None:
+                    log_line(log, EV_OUT_OF_ENERGY, attacker.side)
+                return {"winner": defender.name, "winner_side": defender.side, "damage": round_had_damage}
             extra_dmg = calculate_damage(attacker, defender, log, rng, arena=arena)
             if extra_dmg > 0:
                 round_had_damage = True
             defender.hp = max(defender.hp - extra_dmg, 0)
-            log_line(log, "attack", f"{attacker.name} strikes again for {extra_dmg:.2f} damage!")
+            if log is not None:
+                log_line(log, EV_EXTRA_ATTACK, attacker.side, extra_dmg)
 
         if not defender.is_alive():
-            log_line(log, "defeat", f"{defender.name} has been defeated!")
-            return {"winner": attacker.name, "damage": True}
+            if log is not None:
+                log_line(log, EV_DEFEAT, defender.side)
+            return {"winner": attacker.name, "winner_side": attacker.side, "damage": True}
 
-    return {"winner": None, "damage": round_had_damage}
+    return {"winner": None, "winner_side": None, "damage": round_had_damage}
 
-def full_battle(botA, botB, seed=None, arena="neutral"):
+def iter_battle(botA, botB, seed=None, arena="neutral", headless=False):
+    """
+    Generator form of full_battle: yields the log events, (code, side,
+    *args) tuples that render_event turns into text via EVENT_TEXT, as each
+    round finishes and returns the result dict (with "log": None), so
+    `result = yield from iter_battle(...)` gives both. Only the current
+    round's events are held in memory. headless=True yields nothing.
+    """
     if seed is None:
         seed = random.randint(0, 999999999)
 
     rng = random.Random(seed)
-    log = []
+    # events of the round in progress; handed out and cleared every round
+    log = None if headless else []
     round_num = 1
     winner = None
-    MAX_ROUNDS = 10
-
-    # DRAW rule: draw when both bots don’t land any hits for 10 turns in a row
-    NO_HIT_TURN_LIMIT = 10
+    # 0 = botA, 1 = botB; unlike the name, never ambiguous
+    winner_side = None
     no_hit_turns = 0
 
     # Apply arena mods ONCE
@@ -449,13 +664,17 @@ def full_battle(botA, botB, seed=None, arena="neutral"):
     apply_arena_modifiers(botA, arena)
     apply_arena_modifiers(botB, arena)
 
-    intro_line = ARENA_FLAVOR.get(
-        arena,
-        f"🏟️ Battle begins in the {arena_name(arena)} Arena!"
-    )
-    log_line(log, "arena", intro_line)
+    botA.side = 0
+    botB.side = 1
+
+    if log is not None:
+        log_line(log, EV_ARENA, -1, ARENA_INDEX.get(arena, ARENA_INDEX["neutral"]))
 
     while botA.is_alive() and botB.is_alive() and round_num <= MAX_ROUNDS:
+        if log:
+            yield from log
+            log.clear()
+
         # ADAPT-X: after 2 full rounds, permanently boost LOGIC by +10%
         if round_num == 3:
             for bot in (botA, botB):
@@ -463,13 +682,11 @@ def full_battle(botA, botB, seed=None, arena="neutral"):
                     old_logic = bot.logic
                     bot.logic = int(bot.logic * 1.10)
                     bot._adapt_logic_applied = True
-                    log_line(
-                        log,
-                        "special",
-                        f"🤖 {bot.name} has adapted! LOGIC increased from {old_logic} to {bot.logic}.",
-                    )
+                    if log is not None:
+                        log_line(log, EV_ADAPT, bot.side, old_logic, bot.logic)
 
-        log_line(log, "round", f"(Round {round_num})")
+        if log is not None:
+            log_line(log, EV_ROUND, -1, round_num)
 
         # Track HP BEFORE the round
         hpA_before = float(botA.hp or 0)
@@ -485,27 +702,23 @@ def full_battle(botA, botB, seed=None, arena="neutral"):
         )
 
         winner = round_result["winner"]
+        winner_side = round_result["winner_side"]
         round_had_damage = round_result["damage"]
 
         if winner is not None:
-            log_line(log, "battleover", f"Battle Over! Winner: {winner}")
+            if log is not None:
+                log_line(log, EV_WINNER, winner_side)
             break
 
         if not round_had_damage:
             no_hit_turns += 1
-            log_line(
-                log,
-                "system",
-                f"No hits landed this round. No-hit rounds: {no_hit_turns}/{NO_HIT_TURN_LIMIT}"
-            )
+            if log is not None:
+                log_line(log, EV_NO_HIT, -1, no_hit_turns, NO_HIT_TURN_LIMIT)
 
             if no_hit_turns >= NO_HIT_TURN_LIMIT:
                 winner = "draw"
-                log_line(
-                    log,
-                    "battleover",
-                    f"DRAW! No hits landed for {NO_HIT_TURN_LIMIT} rounds in a row."
-                )
+                if log is not None:
+                    log_line(log, EV_DRAW_NO_HITS, -1, NO_HIT_TURN_LIMIT)
                 break
         else:
             no_hit_turns = 0
@@ -514,12 +727,16 @@ def full_battle(botA, botB, seed=None, arena="neutral"):
     
     if round_num > MAX_ROUNDS and winner is None:
         winner = "draw"
-        log_line(log, "battleover", " DRAW! Maximum rounds reached.")
+        if log is not None:
+            log_line(log, EV_DRAW_MAX_ROUNDS)
+
+    if log:
+        yield from log
 
-    if winner == "draw" or winner is None:
+    if winner_side is None:
         botA_points = 0
         botB_points = 0
-    elif winner == botA.name:
+    elif winner_side == 0:
         botA_points = calculate_bot_stat_points(botA, "win")
         botB_points = calculate_bot_stat_points(botB, "lose")
     else:
@@ -529,13 +746,38 @@ def full_battle(botA, botB, seed=None, arena="neutral"):
 
     return {
         "winner": winner,
-        "log": log,
+        "winner_side": winner_side,
+        "log": None,
         "seed": seed,
         "botA_points": botA_points,
         "botB_points": botB_points
     }
 
 
+def full_battle(botA, botB, seed=None, arena="neutral", headless=False):
+    """
+    Run a battle between two BattleBots.
+    headless=True skips building the log (result["log"] is None) but
+    consumes the RNG exactly like a logged run, so the winner and points
+    are the same for the same seed.
+    """
+    events = iter_battle(botA, botB, seed, arena, headless)
+    log = None
+    try:
+        if headless:
+            next(events)
+        else:
+            log = []
+            append = log.append
+            while True:
+                append(next(events))
+    except StopIteration as stop:
+        result = stop.value
+
+    result["log"] = log
+    return result
+
+
 # Test battle
 if __name__ == "__main__":
     bot1 = BattleBot(
@@ -570,5 +812,6 @@ if __name__ == "__main__":
     chosen_arena = random.choice(["ironclash", "skyline", "neutral", "frozen"])
     result = full_battle(bot1, bot2, arena=chosen_arena)
     print("Winner:", result["winner"])
-    for t, msg in result["log"]:
-        print(f"[{t}] {msg}")
+    names = (bot1.name, bot2.name)
+    for event in result["log"]:
+        print(f"[{EVENT_TEXT[event[0]][0]}] {render_event(event, names)}")
@@ -0,0 +1,480 @@
+import numpy as np
+
+from battle import ARENA_EFFECTS, MAX_ROUNDS, NO_HIT_TURN_LIMIT
+from battle_sim import ABILITY_EFFECTS, EVOLVE_STATS
+
+# -----------------------------
+# Exact (Markov Chain) Battle Evaluator
+# -----------------------------
+# Every random draw in a battle (turn order on equal CLK, whiff, dodge, crit,
+# ranged variance, Evolve Protocol's stat pick) has a known distribution. So
+# unless CHAOS-RND is involved, a battle is a Markov chain over the
+# combat state of both bots. Instead of sampling battles, this module carries
+# a probability distribution over states {state: probability} through the
+# rounds of full_battle. Each rule of battle_round, calculate_damage and
+# use_ability is applied to every state with every outcome it can have.
+# Equal states reached by different paths are merged, so the work depends on
+# how many distinct states exist, not how many paths lead to them.
+#
+# Ranged variance is the only continuous roll. Without abilities (the
+# normal case) each bot's HP is its own chain, and HP under ranged fire is
+# kept as a distribution over an HP_STEP grid that the uniform variance is
+# integrated into exactly. Melee hits are exact. With abilities, the joint
+# chain splits ranged variance into RANGED_BUCKETS equal-probability
+# buckets, each represented by its midpoint.
+#
+# The split chains take a few ms. The joint chain is far slower: a melee
+# ability matchup reaches 2-20k states and takes 0.5-4 s, and ranged ones
+# go beyond that (minutes). It gives up with ValueError as soon as a round
+# holds more than max_states states, so callers can fall back to
+# simulate_battles.
+
+RANGED_BUCKETS = 4
+# Joint-chain states allowed in one round (under a second of work at the limit)
+MAX_JOINT_STATES = 3000
+HP_STEP = 0.25
+# HP is rounded to this many decimals after each hit, so states that differ
+# only by float rounding (the same hits in another order) are merged
+HP_DIGITS = 6
+
+# State tuple layout: field offset + side (0 = botA, 1 = botB), then no-hit rounds
+HP, ENERGY, PROC, DEFENSE, CLK, LUCK, LOGIC, EXTRA_ATTACKS, ABILITY_USED = range(0, 18, 2)
+NO_HIT = 18
+
+# "speed" is never read during combat, so Evolve Protocol picking it changes nothing
+EVOLVE_FIELDS = {"hp": HP, "proc": PROC, "defense": DEFENSE, "luck": LUCK, "energy": ENERGY}
+EVOLVE_PAIRS = [
+    (first, second)
+    for i, first in enumerate(EVOLVE_STATS)
+    for second in EVOLVE_STATS[i + 1:]
+]
+
+
+def _bot_config(bot, effects, buckets):
+    """Per-bot constants that never change during a battle."""
+    ranged = bot.weapon_type == "ranged"
+    favored = effects["favored"] is not None and bot.weapon_type == effects["favored"]
+    if ranged:
+        variance = [0.85 + 0.30 * (i + 0.5) / buckets for i in range(buckets)]
+    else:
+        variance = [None]
+    return {
+        "whiff": effects["whiff_ranged"] if ranged else effects["whiff_melee"],
+        "bonus": effects["damage_bonus"] if favored else None,
+        "variance": variance,
+        "weapon_atk": bot.weapon_atk if bot.weapon_atk else 0,
+        "regen": bot.regen,
+        "energy_gain": bot.energy_gain,
+        "energy_drain": 0 if bot.emp_shield else bot.energy_drain,
+        "algorithm": getattr(bot, "algorithm", None),
+        "special_effect": bot.special_effect,
+    }
+
+
+def _initial_state(botA, botB, effects):
+    state = [0] * (NO_HIT + 1)
+    for side, bot in enumerate((botA, botB)):
+        state[HP + side] = bot.hp
+        state[ENERGY + side] = bot.energy
+        state[PROC + side] = bot.proc
+        # Apply arena mods ONCE
+        state[DEFENSE + side] = int(bot.defense * effects["def_mod"])
+        state[CLK + side] = int(bot.clk * effects["spd_mod"])
+        state[LUCK + side] = bot.luck
+        state[LOGIC + side] = bot.logic
+        state[EXTRA_ATTACKS + side] = bot.extra_attacks
+        state[ABILITY_USED + side] = bot.ability_used
+    return tuple(state)
+
+
+def _alive(state, side):
+    return state[HP + side] > 0 and state[ENERGY + side] > 0
+
+
+def _add(dist, key, p):
+    dist[key] = dist.get(key, 0.0) + p
+
+
+def _strike_odds(cfg, state, a):
+    """
+    calculate_damage for attacker side a as (hit chance, damage before
+    ranged variance, crit chance), with the same arithmetic.
+    """
+    d = 1 - a
+    att = cfg[a]
+    hit = 1.0 - att["whiff"]
+
+    base_proc = state[PROC + a] + att["weapon_atk"] - (state[DEFENSE + d] * 0.7)
+    base_proc = max(base_proc, 0.0)
+    if att["bonus"] is not None:
+        base_proc *= att["bonus"]
+
+    if state[CLK + d] > state[CLK + a]:
+        clk_gap = state[CLK + d] - state[CLK + a]
+        dodge_chance = (clk_gap * (state[LUCK + d] / 100.0)) / 100.0
+        dodge_chance = max(0.0, min(dodge_chance, 0.35))
+        final_dodge = dodge_chance * (100.0 / (100.0 + float(state[LOGIC + a] or 0)))
+        hit *= 1.0 - min(final_dodge, 1.0)
+
+    crit_pct = float(state[LUCK + a] or 0) * (100.0 / (100.0 + float(state[LOGIC + d] or 0)))
+    crit = max(0.0, min(crit_pct / 100.0, 1.0))
+    return hit, base_proc, crit
+
+
+def _strike(cfg, state, a, cache):
+    """
+    calculate_damage for attacker side a as [(probability, damage)], ranged
+    variance split into buckets. Melee damage values are the exact floats
+    calculate_damage returns.
+    """
+    d = 1 - a
+    key = (
+        a, state[PROC + a], state[DEFENSE + d], state[CLK + a], state[CLK + d],
+        state[LUCK + a], state[LUCK + d], state[LOGIC + a], state[LOGIC + d],
+    )
+    outcomes = cache.get(key)
+    if outcomes is not None:
+        return outcomes
+
+    hit, base_proc, crit = _strike_odds(cfg, state, a)
+    variance = cfg[a]["variance"]
+
+    by_damage = {0.0: 1.0 - hit}
+    share = hit / len(variance)
+    for factor in variance:
+        damage = base_proc if factor is None else base_proc * factor
+        _add(by_damage, float(damage), share * (1.0 - crit))
+        _add(by_damage, float(damage * 2.0), share * crit)
+
+    outcomes = [(p, damage) for damage, p in by_damage.items() if p > 0.0]
+    cache[key] = outcomes
+    return outcomes
+
+
+def _hit_pmf(hit, base_proc, crit):
+    """
+    One ranged calculate_damage on the HP grid: pmf[k] = P(damage in the
+    HP_STEP-wide bin centred on k * HP_STEP). The ranged variance is uniform,
+    so each bin gets the exact share of it that falls inside the bin.
+    """
+    if base_proc <= 0:
+        return np.ones(1)
+    size = int(2.0 * base_proc * 1.15 / HP_STEP) + 2
+    edges = (np.arange(size + 1) - 0.5) * HP_STEP
+
+    def uniform(low, high):
+        return np.diff(np.clip(edges, low, high)) / (high - low)
+
+    pmf = hit * (1.0 - crit) * uniform(base_proc * 0.85, base_proc * 1.15)
+    pmf += hit * crit * uniform(base_proc * 1.7, base_proc * 2.3)
+    pmf[0] += 1.0 - hit
+    return pmf
+
+
+def _use_ability(cfg, state, a, round_num):
+    """use_ability for side a: [(probability, state)]; state is a list and may be reused."""
+    if state[ABILITY_USED + a]:
+        return [(1.0, state)]
+    if not (state[HP + a] < 40 or round_num == 6):
+        return [(1.0, state)]
+
+    state[ABILITY_USED + a] = True
+    effect = cfg[a]["special_effect"]
+
+    if effect == "Core Meltdown":
+        state[PROC + a] = int(state[PROC + a] * 1.15)
+        state[DEFENSE + a] = int(state[DEFENSE + a] * 0.9)
+    elif effect == "Fortify Matrix":
+        state[DEFENSE + a] = int(state[DEFENSE + a] * 1.2)
+    elif effect == "System Balance":
+        state[HP + a] += int(state[HP + a] * 0.1)
+        state[ENERGY + a] += int(state[ENERGY + a] * 0.1)
+    elif effect == "Evolve Protocol":
+        branches = []
+        for pair in EVOLVE_PAIRS:
+            evolved = list(state)
+            for stat in pair:
+                if stat in EVOLVE_FIELDS:
+                    field = EVOLVE_FIELDS[stat] + a
+                    evolved[field] = int(evolved[field] * 1.10)
+            branches.append((1.0 / len(EVOLVE_PAIRS), evolved))
+        return branches
+    elif effect == "Time Dilation":
+        state[EXTRA_ATTACKS + a] = 1
+    return [(1.0, state)]
+
+
+def _turn_orders(state):
+    """calculate_turn_order as [(probability, side attacking first)]."""
+    if state[CLK] > state[CLK + 1]:
+        return ((1.0, 0),)
+    if state[CLK + 1] > state[CLK]:
+        return ((1.0, 1),)
+    return ((0.5, 0), (0.5, 1))  # random order if equal
+
+
+def _attack(cfg, branches, a, round_num, cache, won):
+    """
+    One attack slot of battle_round with side a attacking, applied to
+    {(state, had_damage): probability}. Battles this slot decides are
+    added to won[side]; the rest are returned in the same form.
+    """
+    d = 1 - a
+    out = {}
+    for (state, had_damage), p in branches.items():
+        if not _alive(state, a) or not _alive(state, d):
+            _add(out, (state, had_damage), p)
+            continue
+
+        # baseline energy cost per attack
+        state = list(state)
+        state[ENERGY + a] = max(state[ENERGY + a] - 10, 0)
+        if not _alive(state, a):
+            won[d] += p
+            continue
+
+        for q, evolved in _use_ability(cfg, state, a, round_num):
+            for r, damage in _strike(cfg, evolved, a, cache):
+                after = list(evolved)
+                after[HP + d] = max(round(after[HP + d] - damage, HP_DIGITS), 0)
+                hit = had_damage or damage > 0
+                weight = p * q * r
+
+                if after[EXTRA_ATTACKS + a] > 0 and _alive(after, d):
+                    after[EXTRA_ATTACKS + a] -= 1
+                    after[ENERGY + a] = max(after[ENERGY + a] - 10, 0)
+                    if not _alive(after, a):
+                        won[d] += weight
+                        continue
+                    for r2, extra_damage in _strike(cfg, after, a, cache):
+                        final = list(after)
+                        final[HP + d] = max(round(final[HP + d] - extra_damage, HP_DIGITS), 0)
+                        if not _alive(final, d):
+                            won[a] += weight * r2
+                        else:
+                            _add(out, (tuple(final), hit or extra_damage > 0), weight * r2)
+                elif not _alive(after, d):
+                    won[a] += weight
+                else:
+                    _add(out, (tuple(after), hit), weight)
+    return out
+
+
+def _joint_chain(cfg, state, cache, max_states=MAX_JOINT_STATES):
+    """
+    Markov chain over the combined state of both bots. Works for every rule,
+    but raises ValueError once a round holds more than max_states states.
+    """
+    dist = {state: 1.0}
+    won = [0.0, 0.0]
+    draw = 0.0
+    round_probs = [0.0] * (MAX_ROUNDS + 1)
+    peak_states = 1
+
+    if len(dist) > max_states:
+        raise ValueError(f"joint chain exceeds {max_states} states; use simulate_battles")
+
+    for round_num in range(1, MAX_ROUNDS + 1):
+        # ADAPT-X: after 2 full rounds, permanently boost LOGIC by +10%
+        if round_num == 3:
+            for side in (0, 1):
+                if cfg[side]["algorithm"] == "ADAPT-X":
+                    adapted = {}
+                    for state, p in dist.items():
+                        state = list(state)
+                        state[LOGIC + side] = int(state[LOGIC + side] * 1.10)
+                        _add(adapted, tuple(state), p)
+                    dist = adapted
+
+        ended = won[0] + won[1] + draw
+        following = {}
+
+        for state, p in dist.items():
+            # Apply per-turn item effects
+            state = list(state)
+            for side in (0, 1):
+                state[HP + side] += cfg[side]["regen"]
+                state[ENERGY + side] += cfg[side]["energy_gain"]
+                state[ENERGY + side] -= cfg[side]["energy_drain"]
+                state[ENERGY + side] = max(state[ENERGY + side], 0)
+            state = tuple(state)
+
+            for q, first in _turn_orders(state):
+                branches = {(state, False): p * q}
+                branches = _attack(cfg, branches, first, round_num, cache, won)
+                branches = _attack(cfg, branches, 1 - first, round_num, cache, won)
+
+                for (after, had_damage), r in branches.items():
+                    after = list(after)
+                    after[NO_HIT] = 0 if had_damage else after[NO_HIT] + 1
+                    if (
+                        after[NO_HIT] >= NO_HIT_TURN_LIMIT
+                        or round_num == MAX_ROUNDS
+                        # a bot knocked out by start-of-round effects ends the battle without a winner
+                        or not (_alive(after, 0) and _alive(after, 1))
+                    ):
+                        draw += r
+                    else:
+                        _add(following, tuple(after), r)
+            if len(following) > max_states:
+                raise ValueError(f"joint chain exceeds {max_states} states; use simulate_battles")
+
+        round_probs[round_num] = won[0] + won[1] + draw - ended
+        dist = following
+        peak_states = max(peak_states, len(dist))
+        if not dist:
+            break
+
+    return won, draw, round_probs, peak_states
+
+
+def _hp_hit(dist, regen, strikes):
+    """Regen, then one hit from strikes, on {hp: probability}; knocked-out HP is dropped."""
+    after = {}
+    for value, p in dist.items():
+        value += regen
+        for r, damage in strikes:
+            hp = max(round(value - damage, HP_DIGITS), 0)
+            if hp > 0:
+                _add(after, hp, p * r)
+    return after
+
+
+def _grid_hit(grid, regen, pmf):
+    """Regen, then one hit with damage pmf, on an HP grid; knocked-out HP is dropped."""
+    shift = int(round(regen / HP_STEP))
+    if shift:
+        grid = np.concatenate((np.zeros(shift), grid))
+    # after[j] = sum over k of grid[j + k] * pmf[k]
+    after = np.convolve(grid, pmf[::-1])[len(pmf) - 1:]
+    # the bin centred on 0 HP straddles the knock-out line: half of it survives
+    after[0] *= 0.5
+    return after
+
+
+def _split_chains(cfg, state, cache):
+    """
+    Faster chain for battles without abilities (the normal case: the game
+    never gives BattleBots a special_effect). Then nothing one bot does
+    depends on its own HP, so the two HP values evolve independently: each
+    side gets its own chain over {hp: probability} under the other side's
+    hits. Energy and stats follow a fixed schedule, so the outcome of each
+    round follows from the two survival probabilities. The work is the sum
+    of the two HP supports instead of their product.
+    """
+    stats = list(state)
+    # HP of side d as {hp: probability}, or as an HP grid when its attacker is ranged
+    hp = []
+    for d in (0, 1):
+        if cfg[1 - d]["variance"][0] is None:
+            hp.append({state[HP + d]: 1.0})
+        else:
+            grid = np.zeros(int(round(state[HP + d] / HP_STEP)) + 1)
+            grid[-1] = 1.0
+            hp.append(grid)
+    alive = [1.0, 1.0]  # P(side's HP is still above 0)
+    energy = [state[ENERGY], state[ENERGY + 1]]
+    won = [0.0, 0.0]
+    draw = 0.0
+    round_probs = [0.0] * (MAX_ROUNDS + 1)
+    peak_states = 1
+
+    for round_num in range(1, MAX_ROUNDS + 1):
+        # ADAPT-X: after 2 full rounds, permanently boost LOGIC by +10%
+        if round_num == 3:
+            for side in (0, 1):
+                if cfg[side]["algorithm"] == "ADAPT-X":
+                    stats[LOGIC + side] = int(stats[LOGIC + side] * 1.10)
+
+        both = alive[0] * alive[1]
+
+        # Apply per-turn item effects
+        for side in (0, 1):
+            energy[side] = max(energy[side] + cfg[side]["energy_gain"] - cfg[side]["energy_drain"], 0)
+        if not (energy[0] > 0 and energy[1] > 0):
+            # a bot knocked out by start-of-round effects ends the battle without a winner
+            draw += both
+            round_probs[round_num] = both
+            break
+
+        # each side's HP after this round's hit, had the attack happened
+        survived = [0.0, 0.0]
+        for d in (0, 1):
+            if isinstance(hp[d], dict):
+                hp[d] = _hp_hit(hp[d], cfg[d]["regen"], _strike(cfg, stats, 1 - d, cache))
+                survived[d] = sum(hp[d].values())
+            else:
+                hp[d] = _grid_hit(hp[d], cfg[d]["regen"], _hit_pmf(*_strike_odds(cfg, stats, 1 - d)))
+                survived[d] = float(hp[d].sum())
+            peak_states = max(peak_states, len(hp[d]))
+
+        # baseline energy cost per attack
+        spent = [max(energy[0] - 10, 0), max(energy[1] - 10, 0)]
+        for q, first in _turn_orders(stats):
+            second = 1 - first
+            if spent[first] <= 0:
+                won[second] += q * both
+                continue
+            won[first] += q * alive[first] * (alive[second] - survived[second])
+            if spent[second] <= 0:
+                won[first] += q * alive[first] * survived[second]
+                continue
+            won[second] += q * (alive[first] - survived[first]) * survived[second]
+
+        alive = survived
+        energy = spent
+        going_on = alive[0] * alive[1] if spent[0] > 0 and spent[1] > 0 else 0.0
+        round_probs[round_num] = both - going_on
+        if round_num == MAX_ROUNDS:
+            draw += going_on
+        elif not going_on:
+            break
+
+    return won, draw, round_probs, peak_states
+
+
+def exact_outcome(botA, botB, arena="neutral", ranged_buckets=RANGED_BUCKETS, max_states=MAX_JOINT_STATES):
+    """
+    Exact win/draw/loss probabilities of full_battle(botA, botB, arena=arena)
+    from botA's point of view, without simulating a single battle.
+
+    The bots are read but not modified (items already applied, arena not
+    yet applied), like battle_sim.simulate_battles. CHAOS-RND re-rolls stats
+    every round, which makes the state space explode, so such matchups raise
+    ValueError; use simulate_battles for them. So do matchups that need the
+    joint chain (abilities) once it holds more than max_states states;
+    max_states=0 refuses the joint chain outright.
+    """
+    for bot in (botA, botB):
+        if getattr(bot, "algorithm", None) == "CHAOS-RND":
+            raise ValueError("CHAOS-RND matchups cannot be evaluated exactly; use simulate_battles")
+
+    effects = ARENA_EFFECTS.get(arena, ARENA_EFFECTS["neutral"])
+    cfg = (
+        _bot_config(botA, effects, ranged_buckets),
+        _bot_config(botB, effects, ranged_buckets),
+    )
+    state = _initial_state(botA, botB, effects)
+
+    independent = (
+        NO_HIT_TURN_LIMIT >= MAX_ROUNDS
+        and not any(
+            cfg[side]["special_effect"] in ABILITY_EFFECTS and not state[ABILITY_USED + side]
+            for side in (0, 1)
+        )
+        and not (state[EXTRA_ATTACKS] or state[EXTRA_ATTACKS + 1])
+    )
+    if independent:
+        won, draw, round_probs, peak_states = _split_chains(cfg, state, {})
+    else:
+        won, draw, round_probs, peak_states = _joint_chain(cfg, state, {}, max_states)
+
+    return {
+        "arena": arena,
+        "win_rate": won[0],
+        "draw_rate": draw,
+        "loss_rate": won[1],
+        "round_probs": round_probs,
+        "mean_rounds": sum(n * p for n, p in enumerate(round_probs)),
+        "states": peak_states,
+    }
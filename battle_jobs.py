@@ -0,0 +1,226 @@
+import argparse
+import multiprocessing
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import BattleJob
+
+# -----------------------------
+# Battle Job Queue
+# -----------------------------
+# The battle POST (combat_log) does not play the battle itself. It adds a
+# BattleJob row and sends the player to a page that polls the job. The
+# battle_job table is the queue; there is no external broker. Workers
+# claim the oldest queued job with a conditional UPDATE, so two workers
+# never run the same job. They play it and settle it with
+# app.run_battle_job, then mark it done with the History id.
+#
+# BATTLE_JOBS = "inline" (the default) has the request run its own job
+# straight away, so the app works without workers. With "worker", start
+# workers next to the web app:
+#
+#   python battle_jobs.py --workers 4
+#
+# run_battle_job locks both players' rows while it settles, so parallel
+# workers need PostgreSQL (or another database with SELECT ... FOR UPDATE).
+# SQLite ignores the lock, so on SQLite main() runs a single worker.
+#
+# A job left running by a worker that died is queued again after
+# STALE_AFTER seconds. Replaying it is safe: the History battle_token is
+# unique, so a job that was settled just before the crash is only marked done.
+# Inline mode has no workers: there the battle_job page reclaims such a job
+# (reclaim_job) and plays it in the request, and the battle POST prunes old
+# jobs now and then (prune_due).
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+POLL_INTERVAL = 0.5
+STALE_AFTER = 300
+# Finished jobs are deleted after this many seconds
+JOB_RETENTION = 24 * 3600
+
+
+def enqueue_job(user_id, bot1_id, bot2_id, battle_token, claim=False):
+    """
+    (job, created): the job for `battle_token`, added and committed if it
+    is new. With claim, a new job starts out running, claimed by the caller.
+    """
+    job = BattleJob.query.filter_by(battle_token=battle_token).first()
+    if job:
+        return job, False
+
+    job = BattleJob(user_id=user_id, bot1_id=bot1_id, bot2_id=bot2_id, battle_token=battle_token, status=QUEUED)
+    if claim:
+        job.status = RUNNING
+        job.started_at = datetime.utcnow()
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Same token submitted twice at once; use the other request's job
+        db.session.rollback()
+        return BattleJob.query.filter_by(battle_token=battle_token).one(), False
+    return job, True
+
+
+def claim_job():
+    """Mark the oldest queued job as running and return it (None if there is none)."""
+    while True:
+        candidate = db.session.execute(
+            db.select(BattleJob.id).where(BattleJob.status == QUEUED).order_by(BattleJob.id).limit(1)
+        ).scalar()
+        if candidate is None:
+            return None
+
+        claimed = db.session.execute(
+            db.update(BattleJob)
+            .where(BattleJob.id == candidate, BattleJob.status == QUEUED)
+            .values(status=RUNNING, started_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(BattleJob, candidate)
+        # Another worker took it first; try the next one
+
+
+def finish_job(job, history_id, summary=None):
+    job.status = DONE
+    job.history_id = history_id
+    job.summary = summary
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def fail_job(job, error):
+    job.status = FAILED
+    job.error = error[:200]
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def requeue_stale(older_than=STALE_AFTER):
+    """Queue again the jobs left running for longer than `older_than` seconds."""
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+    count = db.session.execute(
+        db.update(BattleJob)
+        .where(BattleJob.status == RUNNING, BattleJob.started_at < cutoff)
+        .values(status=QUEUED, started_at=None)
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def reclaim_job(job, older_than=STALE_AFTER):
+    """
+    Claim `job` for the caller if it is queued or was left running for
+    longer than `older_than` seconds. True if the caller now owns it.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+    claimed = db.session.execute(
+        db.update(BattleJob)
+        .where(
+            BattleJob.id == job.id,
+            or_(BattleJob.status == QUEUED, and_(BattleJob.status == RUNNING, BattleJob.started_at < cutoff)),
+        )
+        .values(status=RUNNING, started_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return bool(claimed)
+
+
+def prune_jobs(older_than=JOB_RETENTION):
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+    count = db.session.execute(
+        db.delete(BattleJob).where(BattleJob.status.in_((DONE, FAILED)), BattleJob.finished_at < cutoff)
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+_last_prune = None
+
+
+def prune_due(interval=STALE_AFTER):
+    """prune_jobs, at most once every `interval` seconds per process."""
+    global _last_prune
+    now = time.monotonic()
+    if _last_prune is not None and now - _last_prune < interval:
+        return 0
+    _last_prune = now
+    return prune_jobs()
+
+
+def run_claimed(job, run_job):
+    """Run a claimed job; a failure marks it failed instead of raising."""
+    job_id = job.id
+    try:
+        run_job(job)
+    except Exception:
+        traceback.print_exc()
+        db.session.rollback()
+        fail_job(db.session.get(BattleJob, job_id), "The battle could not be played.")
+
+
+def work(poll_interval=POLL_INTERVAL, once=False):
+    """Worker loop: claim and run jobs until stopped (or, with once, until the queue is empty)."""
+    from app import app, run_battle_job
+
+    with app.app_context():
+        requeue_stale()
+        last_upkeep = time.monotonic()
+        while True:
+            job = claim_job()
+            if job is not None:
+                run_claimed(job, run_battle_job)
+                db.session.remove()
+                continue
+            if once:
+                break
+
+            if time.monotonic() - last_upkeep > STALE_AFTER:
+                requeue_stale()
+                prune_jobs()
+                last_upkeep = time.monotonic()
+            db.session.remove()
+            time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run battle workers for queued battle jobs.")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default 1)")
+    parser.add_argument("--poll", type=float, default=POLL_INTERVAL, help="seconds between polls of an empty queue")
+    parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+    args = parser.parse_args()
+
+    from app import app
+
+    workers = args.workers
+    if workers > 1 and app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        print("SQLite cannot lock rows for parallel settlement; running 1 worker")
+        workers = 1
+
+    if workers == 1:
+        work(args.poll, args.once)
+        return
+
+    # The parent never connects, so each worker opens its own connections
+    processes = [
+        multiprocessing.Process(target=work, args=(args.poll, args.once), name=f"battle-worker-{n}")
+        for n in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
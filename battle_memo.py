@@ -0,0 +1,88 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from battle import ENGINE_VERSION
+
+log = logging.getLogger(__name__)
+
+# -----------------------------
+# Battle Result Memo
+# -----------------------------
+# full_battle is a pure function of both bots' starting state (stats,
+# upgrade effects, algorithm, weapon type, name), the arena and the seed.
+# A stored battle whose log predates the current engine is re-simulated
+# when it is replayed, and the same replay is often requested again before
+# the refreshed log is saved (an EventSource reconnect, a second viewer).
+# BattleMemo keeps the last MEMO_SIZE results in an LRU keyed by those
+# inputs as one tuple (BattleBot.snapshot() of each side, seed, arena,
+# headless, ENGINE_VERSION). The dict hashes the tuple and compares it in
+# full on lookup, so a hit only ever comes from identical inputs.
+#
+# Live battles and tournaments do not go through the memo: their seeds are
+# fresh or never repeat, so nothing would ever hit. The counters are logged
+# (INFO, logger "battle_memo") every STATS_LOG_EVERY lookups.
+
+MEMO_SIZE = 1024
+STATS_LOG_EVERY = 1000
+
+
+def battle_inputs(state_a, state_b, seed, arena, headless):
+    """Everything a full_battle result depends on, as one tuple."""
+    return (ENGINE_VERSION, state_a, state_b, seed, arena, bool(headless))
+
+
+class BattleMemo:
+    def __init__(self, maxsize=MEMO_SIZE):
+        self.maxsize = maxsize
+        self._results = OrderedDict()  # battle_inputs -> result
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def inputs(self, botA, botB, seed, arena="neutral", headless=False):
+        """The memo key of a battle of botA and botB; take it before they fight."""
+        return battle_inputs(botA.snapshot(), botB.snapshot(), seed, arena, headless)
+
+    def lookup(self, inputs):
+        """A copy of the stored result for these inputs, or None."""
+        with self._lock:
+            result = self._results.get(inputs)
+            if result is None:
+                self.misses += 1
+            else:
+                self._results.move_to_end(inputs)
+                self.hits += 1
+                result = dict(result)
+            lookups = self.hits + self.misses
+        if lookups % STATS_LOG_EVERY == 0:
+            log.info("battle memo: %s", self.stats())
+        return result
+
+    def store(self, inputs, result):
+        with self._lock:
+            self._results[inputs] = result
+            self._results.move_to_end(inputs)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._results),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+battle_memo = BattleMemo()
@@ -0,0 +1,516 @@
+import random
+
+import numpy as np
+
+from battle import ARENA_EFFECTS, MAX_ROUNDS, NO_HIT_TURN_LIMIT
+
+# -----------------------------
+# Batch (Monte Carlo) Battle Simulator
+# -----------------------------
+# Runs N independent battles of the same two BattleBot configurations at once.
+# All per-bot values live in one (rows, N) float array: row ROW[name] + side,
+# side 0 = botA and side 1 = botB. Each rule of battle_round, calculate_damage
+# and use_ability is applied to every battle in one NumPy step, and finished
+# battles are dropped from the array as they end. Results follow the same
+# probabilities as full_battle, but the RNG stream is NumPy's, so individual
+# battles do not match full_battle for the same seed.
+
+STATE_FIELDS = ("hp", "energy", "proc", "defense", "clk", "luck", "logic", "extra_attacks", "ability_used")
+ROW = {name: 2 * i for i, name in enumerate(STATE_FIELDS)}
+
+CHAOS_STATS = ("hp", "energy", "proc", "defense", "clk", "luck", "logic")
+# Every outcome of apply_chaos (two different stats, each +10% or -10%),
+# all equally likely: the CHAOS_STATS index and factor of each pick
+CHAOS_OUTCOMES = [
+    (first, second, first_factor, second_factor)
+    for first in range(len(CHAOS_STATS))
+    for second in range(len(CHAOS_STATS))
+    if second != first
+    for first_factor in (1.10, 0.90)
+    for second_factor in (1.10, 0.90)
+]
+CHAOS_DRAWS = len(CHAOS_OUTCOMES)
+CHAOS_PICKS = np.array([outcome[:2] for outcome in CHAOS_OUTCOMES], dtype=np.intp).T
+CHAOS_FACTORS = np.array([outcome[2:] for outcome in CHAOS_OUTCOMES]).T
+
+# "speed" is never read during combat, so picking it changes nothing
+EVOLVE_STATS = ("hp", "proc", "defense", "speed", "luck", "energy")
+ABILITY_EFFECTS = ("Core Meltdown", "Fortify Matrix", "System Balance", "Evolve Protocol", "Time Dilation")
+
+CHUNK_SIZE = 8192
+
+# winner codes
+NO_WINNER = -1
+DRAW = 2
+
+
+def _bot_config(bot, effects):
+    """Per-bot constants that never change during a battle."""
+    ranged = bot.weapon_type == "ranged"
+    favored = effects["favored"] is not None and bot.weapon_type == effects["favored"]
+    return {
+        "whiff": effects["whiff_ranged"] if ranged else effects["whiff_melee"],
+        "bonus": effects["damage_bonus"] if favored else 1.0,
+        "ranged": ranged,
+        "weapon_atk": float(bot.weapon_atk or 0),
+        "regen": bot.regen,
+        "energy_gain": bot.energy_gain,
+        "energy_drain": 0 if bot.emp_shield else bot.energy_drain,
+        "algorithm": getattr(bot, "algorithm", None),
+        "special_effect": bot.special_effect,
+    }
+
+
+def _load_state(botA, botB, n):
+    state = np.zeros((len(ROW) * 2, n))
+    for name in CHAOS_STATS:
+        state[ROW[name]] = float(getattr(botA, name) or 0)
+        state[ROW[name] + 1] = float(getattr(botB, name) or 0)
+    return state
+
+
+def _alive(state, side):
+    return (state[ROW["hp"] + side] > 0) & (state[ROW["energy"] + side] > 0)
+
+
+def _stat_rows(stats, side):
+    # state row of each stat, -1 for stats that are not simulated
+    return np.array([ROW[stat] + side if stat in ROW else -1 for stat in stats])
+
+
+# state row of each CHAOS_STATS entry, per side
+CHAOS_ROWS = (_stat_rows(CHAOS_STATS, 0), _stat_rows(CHAOS_STATS, 1))
+
+
+def _pick_two(rows, rolls):
+    """Two distinct entries of rows per battle (like rng.sample(stats, 2))."""
+    count = rows.shape[0]
+    first = (rolls[0] * count).astype(np.intp)
+    second = (rolls[1] * (count - 1)).astype(np.intp)
+    second += second >= first
+    return rows[first], rows[second]
+
+
+def _apply_chaos(state, side, cols, rng):
+    # CHAOS-RND: two different stats each go +10% or -10%, never below 1.
+    # One roll picks one of the equally likely CHAOS_OUTCOMES, and as state
+    # is C-contiguous each (row, col) is one index into its flat view
+    draws = (rng.random(cols.shape[0]) * CHAOS_DRAWS).astype(np.intp)
+    flat = state.reshape(-1, copy=False)
+    offsets = CHAOS_ROWS[side] * state.shape[1]
+    for picks, factors in zip(CHAOS_PICKS, CHAOS_FACTORS):
+        index = offsets[picks].take(draws)
+        index += cols
+        values = flat[index]
+        values *= factors.take(draws)
+        np.trunc(values, out=values)
+        np.maximum(values, 1, out=values)
+        flat[index] = values
+
+
+def _use_ability(state, cfg, side, mask, round_num, rng):
+    effect = cfg[side]["special_effect"]
+    used = state[ROW["ability_used"] + side]
+    trigger = mask & (used == 0) & ((state[ROW["hp"] + side] < 40) | (round_num == 6))
+    if not trigger.any():
+        return
+    used[trigger] = 1
+
+    def scale(stat, factor):
+        row = state[ROW[stat] + side]
+        row[trigger] = np.trunc(row[trigger] * factor)
+
+    if effect == "Core Meltdown":
+        scale("proc", 1.15)
+        scale("defense", 0.9)
+    elif effect == "Fortify Matrix":
+        # only SPD drops, which is never read during combat
+        scale("defense", 1.2)
+    elif effect == "System Balance":
+        for stat in ("hp", "energy"):
+            row = state[ROW[stat] + side]
+            row[trigger] += np.trunc(row[trigger] * 0.1)
+    elif effect == "Evolve Protocol":
+        cols = np.flatnonzero(trigger)
+        rolls = rng.random((2, cols.shape[0]))
+        for rows in _pick_two(_stat_rows(EVOLVE_STATS, side), rolls):
+            picked = rows >= 0
+            rows, picked_cols = rows[picked], cols[picked]
+            state[rows, picked_cols] = np.trunc(state[rows, picked_cols] * 1.10)
+    elif effect == "Time Dilation":
+        state[ROW["extra_attacks"] + side][trigger] = 1
+
+
+# Masked numpy writes (np.where, np.copyto(where=...)) cost several times
+# plain arithmetic on this data, because the masks are random. The turn
+# code therefore folds each mask into the arithmetic (damage is 0 outside
+# the mask, energy is charged 10 * mask) and only writes winners with putmask.
+
+
+def _strike(state, cfg, attacker, mask, rolls):
+    """
+    Vectorized calculate_damage: the damage `attacker` (0 = botA, 1 = botB)
+    deals in each battle, 0 outside mask.
+    """
+    defender = 1 - attacker
+    att = cfg[attacker]
+
+    def stat(name, side):
+        return state[ROW[name] + side]
+
+    hit = mask & (rolls[0] >= att["whiff"])
+
+    base = stat("proc", attacker) + att["weapon_atk"] - stat("defense", defender) * 0.7
+    base = np.maximum(base, 0.0) * att["bonus"]
+    # Ranged variance
+    if att["ranged"]:
+        base *= 0.85 + 0.30 * rolls[1]
+
+    # Dodge check — attacker LOGIC reduces defender's effective dodge
+    # (without a CLK advantage the dodge chance is 0, which never dodges)
+    clk_gap = stat("clk", defender) - stat("clk", attacker)
+    dodge_chance = np.minimum(np.maximum((clk_gap * (stat("luck", defender) / 100.0)) / 100.0, 0.0), 0.35)
+    final_dodge = dodge_chance * (100.0 / (100.0 + stat("logic", attacker)))
+    hit &= rolls[2] >= final_dodge
+
+    # Critical hit check — defender LOGIC reduces incoming crit chance
+    crit_pct = stat("luck", attacker) * (100.0 / (100.0 + stat("logic", defender)))
+    base *= 1.0 + (rolls[3] < crit_pct / 100.0)
+
+    return base * hit
+
+
+def _charge_energy(state, side, mask):
+    """Spend 10 energy in the battles in mask (never below 0)."""
+    energy = state[ROW["energy"] + side]
+    energy -= 10.0 * mask
+    np.maximum(energy, 0, out=energy)
+    return energy
+
+
+def _take_turn(state, cfg, attacker, mask, round_num, rolls, rng, winner, had_damage):
+    """
+    One attack slot of battle_round with `attacker` (0 = botA, 1 = botB)
+    attacking; only battles in mask take the turn.
+    """
+    defender = 1 - attacker
+
+    energy = _charge_energy(state, attacker, mask)
+    drained = mask & (energy <= 0)
+    np.putmask(winner, drained, defender)
+    mask = mask & ~drained
+
+    if cfg[attacker]["special_effect"] in ABILITY_EFFECTS:
+        _use_ability(state, cfg, attacker, mask, round_num, rng)
+
+    damage = _strike(state, cfg, attacker, mask, rolls)
+    had_damage |= damage > 0
+    hp = state[ROW["hp"] + defender]
+    hp -= damage
+    np.maximum(hp, 0, out=hp)
+
+    extra_attacks = state[ROW["extra_attacks"] + attacker]
+    extra = mask & (extra_attacks > 0) & (hp > 0)
+    if extra.any():
+        extra_attacks -= extra
+        energy = _charge_energy(state, attacker, extra)
+        drained = extra & (energy <= 0)
+        np.putmask(winner, drained, defender)
+        mask = mask & ~drained
+        extra = extra & ~drained
+
+        extra_damage = _strike(state, cfg, attacker, extra, rng.random((4, mask.shape[0])))
+        had_damage |= extra_damage > 0
+        hp -= extra_damage
+        np.maximum(hp, 0, out=hp)
+
+    defeated = mask & (hp <= 0)
+    np.putmask(winner, defeated, attacker)
+
+
+def _run_chunk(state, cfg, rng, result, rounds):
+    """Play out every battle column in state, writing outcomes into result/rounds."""
+    # Bots that start knocked out never fight (0 rounds, draw)
+    active = _alive(state, 0) & _alive(state, 1)
+    rounds[~active] = 0
+    live = np.flatnonzero(active)  # battle number of each column still in state
+    state = state.take(live, axis=1)
+    no_hit_turns = np.zeros(live.shape[0], dtype=np.int16)
+    running = np.ones(live.shape[0], dtype=bool)
+
+    for round_num in range(1, MAX_ROUNDS + 1):
+        m = live.shape[0]
+
+        # ADAPT-X: after 2 full rounds, permanently boost LOGIC by +10%
+        if round_num == 3:
+            for side in (0, 1):
+                if cfg[side]["algorithm"] == "ADAPT-X":
+                    state[ROW["logic"] + side] = np.trunc(state[ROW["logic"] + side] * 1.10)
+
+        # Apply per-turn item effects
+        for side in (0, 1):
+            state[ROW["hp"] + side] += cfg[side]["regen"]
+            energy = state[ROW["energy"] + side]
+            energy += cfg[side]["energy_gain"] - cfg[side]["energy_drain"]
+            np.maximum(energy, 0, out=energy)
+
+        cols = np.arange(m)
+        for side in (0, 1):
+            if cfg[side]["algorithm"] == "CHAOS-RND":
+                _apply_chaos(state, side, cols, rng)
+
+        # Like battle_round, both turns are skipped when the item effects
+        # drained a bot; the battle then ends as a draw after this round
+        alive = _alive(state, 0) & _alive(state, 1)
+        drained = running & ~alive
+        if drained.any():
+            rounds[live[drained]] = round_num
+
+        clkA, clkB = state[ROW["clk"]], state[ROW["clk"] + 1]
+        a_first = (clkA > clkB) | ((clkA == clkB) & (rng.random(m) < 0.5))
+
+        # One gather per round drops the finished battles and puts the ones
+        # where botA goes first in front, so each group plays its turns on
+        # plain row slices with one fixed attacker per slot
+        play = running & alive
+        a_group, b_group = np.flatnonzero(play & a_first), np.flatnonzero(play & ~a_first)
+        split = a_group.shape[0]
+        if split + b_group.shape[0] < m or (split and b_group.shape[0]):
+            order = np.concatenate((a_group, b_group))
+            state, live, no_hit_turns = state.take(order, axis=1), live[order], no_hit_turns[order]
+            m = order.shape[0]
+            if m == 0:
+                break
+
+        rolls = rng.random((8, m))
+        winner = np.full(m, NO_WINNER, dtype=np.intp)
+        had_damage = np.zeros(m, dtype=bool)
+        for cols, first in ((slice(0, split), 0), (slice(split, m), 1)):
+            if cols.start == cols.stop:
+                continue
+            group, group_rolls = state[:, cols], rolls[:, cols]
+            group_winner, group_damage = winner[cols], had_damage[cols]
+            everyone = np.ones(cols.stop - cols.start, dtype=bool)
+            _take_turn(group, cfg, first, everyone, round_num, group_rolls[0:4], rng, group_winner, group_damage)
+            second = (group_winner == NO_WINNER) & _alive(group, 0) & _alive(group, 1)
+            _take_turn(group, cfg, 1 - first, second, round_num, group_rolls[4:8], rng, group_winner, group_damage)
+
+        decided = winner != NO_WINNER
+        no_hit_turns = np.where(had_damage, 0, no_hit_turns + 1)
+        finished = decided | (no_hit_turns >= NO_HIT_TURN_LIMIT)
+
+        result[live[decided]] = winner[decided]
+        rounds[live[finished]] = round_num
+        running = ~finished
+
+
+# -----------------------------
+# Ability-free fast path
+# -----------------------------
+# Without special abilities nothing changes a bot's stats in the middle of
+# a round, so both strikes of a round can be rolled at once and the turn
+# order only decides which of them counts when the first one (or running
+# out of energy) ends the battle. Each strike is one draw from {miss, hit,
+# critical hit} (plus ranged variance), so it takes one roll instead of
+# three. Without CHAOS-RND every stat but HP is also the same in all
+# running battles, so _run_plain_chunk keeps those stats in a single
+# column shared by every battle and HP in its own (2, m) array.
+
+
+def _strike_odds(stats, cfg, attacker):
+    """
+    (damage of a plain hit, P(hit), P(critical hit)) of one calculate_damage
+    by `attacker`, one entry per column of `stats`.
+    """
+    defender = 1 - attacker
+    att = cfg[attacker]
+
+    def stat(name, side):
+        return stats[ROW[name] + side]
+
+    base = stat("defense", defender) * -0.7
+    base += stat("proc", attacker)
+    base += att["weapon_atk"]
+    np.maximum(base, 0.0, out=base)
+    if att["bonus"] != 1.0:
+        base *= att["bonus"]
+
+    # P(hit) = P(no whiff) * (1 - final dodge chance)
+    dodge = stat("clk", defender) - stat("clk", attacker)
+    dodge *= stat("luck", defender)
+    np.maximum(dodge, 0.0, out=dodge)
+    np.minimum(dodge, 3500.0, out=dodge)  # 35% once divided by 100 * 100
+    dodge /= stat("logic", attacker) + 100.0
+    no_whiff = 1.0 - min(max(att["whiff"], 0.0), 1.0)
+    p_hit = dodge
+    p_hit *= -no_whiff / 100.0
+    p_hit += no_whiff
+
+    # P(critical hit) = P(hit) * effective crit chance (LUCK / (100 + LOGIC))
+    crit = stat("luck", attacker) / (stat("logic", defender) + 100.0)
+    np.maximum(crit, 0.0, out=crit)
+    np.minimum(crit, 1.0, out=crit)
+    crit *= p_hit
+    return base, p_hit, crit
+
+
+def _plain_damage(odds, ranged, rng, m):
+    """Damage of one strike in each of m battles (0 for a miss or dodge)."""
+    base, p_hit, p_crit = odds
+    roll = rng.random(m)
+    # 1 for a hit, 2 for a critical hit
+    hits = (roll < p_hit).view(np.uint8)
+    if np.any(p_crit > 0):
+        hits += (roll < p_crit).view(np.uint8)
+    damage = hits * base
+    if ranged:
+        damage *= 0.85 + 0.30 * rng.random(m)
+    return damage
+
+
+def _run_plain_chunk(state, cfg, rng, result, rounds):
+    """_run_chunk for bots without special abilities."""
+    chaos = any(side["algorithm"] == "CHAOS-RND" for side in cfg)
+    if not (_alive(state[:, :1], 0) & _alive(state[:, :1], 1)).all():
+        # Bots that start knocked out never fight (0 rounds, draw)
+        rounds[:] = 0
+        return
+
+    # With CHAOS-RND, HP is a view of the state rows; otherwise state
+    # keeps one column for all battles and HP is copied out per battle
+    live = np.arange(state.shape[1])
+    state = state[:ROW["extra_attacks"]]  # ability rows are never used here
+    if chaos:
+        hp = state[ROW["hp"]:ROW["hp"] + 2]
+    else:
+        hp = state[ROW["hp"]:ROW["hp"] + 2].copy()
+        state = state[:, :1].copy()
+    no_hit_turns = np.zeros(live.shape[0], dtype=np.int16)
+    odds = None
+
+    for round_num in range(1, MAX_ROUNDS + 1):
+        m = live.shape[0]
+        if m == 0:
+            return
+
+        # ADAPT-X: after 2 full rounds, permanently boost LOGIC by +10%
+        if round_num == 3:
+            for side in (0, 1):
+                if cfg[side]["algorithm"] == "ADAPT-X":
+                    state[ROW["logic"] + side] = np.trunc(state[ROW["logic"] + side] * 1.10)
+                    odds = None
+
+        # Apply per-turn item effects
+        energy = state[ROW["energy"]:ROW["energy"] + 2]
+        for side in (0, 1):
+            hp[side] += cfg[side]["regen"]
+            energy[side] += cfg[side]["energy_gain"] - cfg[side]["energy_drain"]
+        np.maximum(energy, 0, out=energy)
+
+        if chaos:
+            cols = np.arange(m)
+            for side in (0, 1):
+                if cfg[side]["algorithm"] == "CHAOS-RND":
+                    _apply_chaos(state, side, cols, rng)
+            odds = None
+        if odds is None:
+            odds = (_strike_odds(state, cfg, 0), _strike_odds(state, cfg, 1))
+
+        # Like battle_round, both turns are skipped when the item effects
+        # drained a bot; the battle then ends as a draw after this round
+        alive = _alive(state, 0) & _alive(state, 1) if chaos else energy.min() > 0
+
+        clkA, clkB = state[ROW["clk"]], state[ROW["clk"] + 1]
+        a_first = (clkA > clkB) | ((clkA == clkB) & (rng.random(m) < 0.5))
+
+        # Each attack costs 10 energy; a bot left with none loses on its turn
+        can_a, can_b = energy[0] > 10, energy[1] > 10
+        energy -= 10
+        np.maximum(energy, 0, out=energy)
+
+        to_b = _plain_damage(odds[0], cfg[0]["ranged"], rng, m)
+        to_a = _plain_damage(odds[1], cfg[1]["ranged"], rng, m)
+        hp[0] -= to_a
+        hp[1] -= to_b
+        np.maximum(hp, 0, out=hp)
+        a_down, b_down = hp[0] <= 0, hp[1] <= 0
+
+        # The first strike decides the battle when it lands the knockout;
+        # the second only counts when the first did not
+        if np.all(can_a) and np.all(can_b):
+            a_wins = b_down & (a_first | ~a_down)
+            b_wins = a_down & ~(a_first & b_down)
+        else:
+            a_wins = np.where(a_first, can_a & (b_down | ~can_b), ~can_b | (can_a & ~a_down & b_down))
+            b_wins = np.where(a_first, ~can_a | (can_b & ~b_down & a_down), can_b & (a_down | ~can_a))
+        a_wins &= alive
+        b_wins &= alive
+
+        had_damage = (to_a > 0) | (to_b > 0)
+        no_hit_turns = (no_hit_turns + 1) * ~had_damage
+        finished = a_wins | b_wins | ~alive | (no_hit_turns >= NO_HIT_TURN_LIMIT)
+
+        result[live[a_wins]] = 0
+        result[live[b_wins]] = 1
+        rounds[live[finished]] = round_num
+        if finished.any():
+            # compress keeps the rows C-contiguous (boolean indexing would not)
+            keep = ~finished
+            live, no_hit_turns = live[keep], no_hit_turns[keep]
+            if chaos:
+                state = state.compress(keep, axis=1)
+                hp = state[ROW["hp"]:ROW["hp"] + 2]
+            else:
+                hp = hp.compress(keep, axis=1)
+
+
+def simulate_battles(botA, botB, n=10000, seed=None, arena="neutral"):
+    """
+    Run n battles of botA vs botB in one vectorized pass.
+
+    The bots are read but not modified, so the same prepared BattleBots
+    (items already applied, arena not yet applied) can be reused.
+    Returns aggregate counts from botA's point of view plus the
+    distribution of battle lengths in rounds.
+    """
+    if seed is None:
+        seed = random.randint(0, 999999999)
+
+    rng = np.random.default_rng(seed)
+    effects = ARENA_EFFECTS.get(arena, ARENA_EFFECTS["neutral"])
+    cfg = (_bot_config(botA, effects), _bot_config(botB, effects))
+    template = _load_state(botA, botB, min(n, CHUNK_SIZE))
+
+    # Apply arena mods ONCE
+    for stat, mod in (("clk", effects["spd_mod"]), ("defense", effects["def_mod"])):
+        rows = template[ROW[stat]:ROW[stat] + 2]
+        rows[:] = np.trunc(rows * mod)
+
+    plain = not any(side["special_effect"] in ABILITY_EFFECTS for side in cfg)
+    run = _run_plain_chunk if plain else _run_chunk
+
+    result = np.full(n, DRAW, dtype=np.int8)
+    rounds = np.full(n, MAX_ROUNDS, dtype=np.int16)
+
+    # small chunks keep the working set in cache, which matters more than batch size
+    for start in range(0, n, CHUNK_SIZE):
+        stop = min(start + CHUNK_SIZE, n)
+        run(template[:, :stop - start].copy(), cfg, rng, result[start:stop], rounds[start:stop])
+
+    wins = int(np.count_nonzero(result == 0))
+    losses = int(np.count_nonzero(result == 1))
+    draws = n - wins - losses
+
+    return {
+        "battles": n,
+        "seed": seed,
+        "arena": arena,
+        "wins": wins,
+        "losses": losses,
+        "draws": draws,
+        "win_rate": wins / n if n else 0.0,
+        "draw_rate": draws / n if n else 0.0,
+        "loss_rate": losses / n if n else 0.0,
+        "round_counts": np.bincount(rounds, minlength=MAX_ROUNDS + 1).tolist(),
+        "mean_rounds": float(rounds.mean()) if n else 0.0,
+    }
@@ -0,0 +1,268 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from battle import (
+    BattleBot,
+    full_battle,
+    battle_round,
+    calculate_damage,
+    apply_items,
+    apply_arena_modifiers,
+    ARENA_EFFECTS,
+    CHARACTER_ITEMS,
+    ENGINE_VERSION,
+)
+from constants import algorithms, algorithm_effects
+
+# -----------------------------
+# Battle Engine Benchmarks
+# -----------------------------
+# Reproducible timings for full_battle, battle_round, calculate_damage and
+# apply_items. The archetype matrix covers every algorithm x melee/ranged x
+# (no upgrade, each CHARACTER_ITEMS upgrade). Bots are built the way
+# combat_log builds them: algorithm multipliers on a fixed base stat line,
+# no special_effect. Every call uses a fixed seed, so two runs do the same
+# work and their JSON reports can be compared across commits:
+#
+#   python bench_battle.py --output before.json
+#   python bench_battle.py --compare before.json
+
+BASE_STATS = {"hp": 200, "energy": 150, "proc": 40, "def": 30, "clk": 25, "luck": 15, "logic": 15}
+WEAPON_TYPES = ("melee", "ranged")
+WEAPON_ATK = 12
+ARENAS = tuple(ARENA_EFFECTS)
+PERCENTILES = (50, 90, 99)
+
+
+def archetypes():
+    """[(label, BattleBot snapshot)] for every algorithm x weapon type x upgrade (or none)."""
+    result = []
+    for algorithm in algorithms:
+        effects = algorithm_effects.get(algorithm, {})
+        stats = {stat: int(value * effects.get(stat, 1.0)) for stat, value in BASE_STATS.items()}
+        proc = int((BASE_STATS["proc"] + WEAPON_ATK) * effects.get("proc", 1.0))
+        for weapon_type in WEAPON_TYPES:
+            for item in (None,) + tuple(CHARACTER_ITEMS):
+                label = f"{algorithm}/{weapon_type}/{item['name'] if item else 'none'}"
+                bot = BattleBot(
+                    name=label,
+                    hp=stats["hp"],
+                    energy=stats["energy"],
+                    proc=proc,
+                    defense=stats["def"],
+                    clk=stats["clk"],
+                    luck=stats["luck"],
+                    logic=stats["logic"],
+                    weapon_atk=0,
+                    weapon_type=weapon_type,
+                    algorithm=algorithm,
+                    items=[{"id": item["id"]}] if item else None,
+                )
+                result.append((label, bot.snapshot()))
+    return result
+
+
+def _matches(types):
+    """Each archetype vs every upgrade-free archetype, in every arena, with a fixed seed."""
+    plain = [state for label, state in types if label.endswith("/none")]
+    matches = []
+    for _, state in types:
+        for opponent in plain:
+            for arena in ARENAS:
+                matches.append((state, opponent, arena, len(matches)))
+    return matches
+
+
+def _summary(samples_ns, calls):
+    samples_ns.sort()
+    total = sum(samples_ns)
+    stats = {
+        "calls": calls,
+        "calls_per_sec": round(calls / (total / 1e9), 1) if total else None,
+        "mean_us": round(total / calls / 1e3, 3),
+    }
+    for p in PERCENTILES:
+        index = min(len(samples_ns) - 1, int(len(samples_ns) * p / 100))
+        stats[f"p{p}_us"] = round(samples_ns[index] / 1e3, 3)
+    return stats
+
+
+def bench_full_battle(matches, repeat, headless):
+    bot_a = BattleBot.from_snapshot(matches[0][0])
+    bot_b = BattleBot.from_snapshot(matches[0][1])
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(repeat):
+        for state_a, state_b, arena, seed in matches:
+            bot_a.restore(state_a)
+            bot_b.restore(state_b)
+            start = clock()
+            full_battle(bot_a, bot_b, seed=seed, arena=arena, headless=headless)
+            samples.append(clock() - start)
+    stats = _summary(samples, len(samples))
+    stats["battles_per_sec"] = stats.pop("calls_per_sec")
+    return stats
+
+
+def bench_battle_round(matches, repeat):
+    """First round of every match (arena already applied, as in full_battle)."""
+    bot_a = BattleBot.from_snapshot(matches[0][0])
+    bot_b = BattleBot.from_snapshot(matches[0][1])
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(repeat):
+        for state_a, state_b, arena, seed in matches:
+            bot_a.restore(state_a)
+            bot_b.restore(state_b)
+            apply_arena_modifiers(bot_a, arena)
+            apply_arena_modifiers(bot_b, arena)
+            rng = random.Random(seed)
+            log = []
+            start = clock()
+            battle_round(bot_a, bot_b, log, rng, arena=arena, round_num=1)
+            samples.append(clock() - start)
+    return _summary(samples, len(samples))
+
+
+def bench_calculate_damage(matches, repeat):
+    bot_a = BattleBot.from_snapshot(matches[0][0])
+    bot_b = BattleBot.from_snapshot(matches[0][1])
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(repeat):
+        for state_a, state_b, arena, seed in matches:
+            bot_a.restore(state_a)
+            bot_b.restore(state_b)
+            rng = random.Random(seed)
+            log = []
+            start = clock()
+            calculate_damage(bot_a, bot_b, log, rng, arena=arena)
+            samples.append(clock() - start)
+    return _summary(samples, len(samples))
+
+
+def bench_apply_items(types, repeat):
+    """Every upgrade (and all of them at once) applied to every upgrade-free archetype."""
+    plain = [state for label, state in types if label.endswith("/none")]
+    item_sets = [[{"id": item["id"]}] for item in CHARACTER_ITEMS]
+    item_sets.append([{"id": item["id"]} for item in CHARACTER_ITEMS])
+    bot = BattleBot.from_snapshot(plain[0])
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(repeat * 10):
+        for state in plain:
+            for items in item_sets:
+                bot.restore(state)
+                start = clock()
+                apply_items(bot, items)
+                samples.append(clock() - start)
+    return _summary(samples, len(samples))
+
+
+def bench_allocations(matches, headless):
+    """tracemalloc per battle: peak bytes above the starting point and net blocks left behind."""
+    bot_a = BattleBot.from_snapshot(matches[0][0])
+    bot_b = BattleBot.from_snapshot(matches[0][1])
+    peaks = []
+    blocks = 0
+    tracemalloc.start()
+    try:
+        for state_a, state_b, arena, seed in matches:
+            bot_a.restore(state_a)
+            bot_b.restore(state_b)
+            before_blocks = sys.getallocatedblocks()
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            result = full_battle(bot_a, bot_b, seed=seed, arena=arena, headless=headless)
+            _, peak = tracemalloc.get_traced_memory()
+            del result
+            blocks += sys.getallocatedblocks() - before_blocks
+            peaks.append(peak - current)
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return {
+        "battles": len(matches),
+        "peak_bytes_mean": round(sum(peaks) / len(peaks), 1),
+        "peak_bytes_p99": peaks[min(len(peaks) - 1, int(len(peaks) * 0.99))],
+        "net_blocks_per_battle": round(blocks / len(matches), 3),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(repeat=3, quick=False):
+    """Run every benchmark and return the report dict (what --output writes)."""
+    types = archetypes()
+    matches = _matches(types)
+    if quick:
+        matches = matches[::10]
+
+    return {
+        "engine_version": ENGINE_VERSION,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "archetypes": len(types),
+            "arenas": list(ARENAS),
+            "matches": len(matches),
+            "repeat": repeat,
+        },
+        "results": {
+            "full_battle": bench_full_battle(matches, repeat, headless=False),
+            "full_battle_headless": bench_full_battle(matches, repeat, headless=True),
+            "battle_round": bench_battle_round(matches, repeat),
+            "calculate_damage": bench_calculate_damage(matches, repeat),
+            "apply_items": bench_apply_items(types, repeat),
+            "allocations": bench_allocations(matches, headless=False),
+            "allocations_headless": bench_allocations(matches, headless=True),
+        },
+    }
+
+
+def compare(previous, current):
+    """Print current vs previous for every shared numeric metric."""
+    for name, stats in current["results"].items():
+        old = previous.get("results", {}).get(name, {})
+        for key, value in stats.items():
+            before = old.get(key)
+            if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+                print(f"{name:24} {key:22} {before:>14} -> {value:<14} ({value / before:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the battle engine.")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the match set (default 3)")
+    parser.add_argument("--quick", action="store_true", help="use every 10th match only")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmarks(repeat=args.repeat, quick=args.quick)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
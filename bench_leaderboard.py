@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import time
+
+# Throwaway database; must be set before app is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_leaderboard.db")
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + DB_PATH)
+
+from app import app
+from extensions import db
+from models import User
+from ranking import RankingIndex, index_rank, ranked_filter, supports_window_functions, window_rank
+import ranking as ranking_module
+
+# -----------------------------
+# Leaderboard Rank Benchmarks
+# -----------------------------
+# p50/p95 latency of one "rank + 5 above / 5 below" lookup at several
+# ranked-user counts, for each leaderboard path:
+#
+#   scan    the original code: count higher-rated users, load every ranked
+#           user in order and search the list (only up to --scan-max users,
+#           it takes seconds per call beyond that)
+#   index   the in-process RankingIndex (already loaded; the load itself is
+#           reported once as index_load_ms)
+#   window  one RANK()/ROW_NUMBER() statement (SQLite 3.25+ / PostgreSQL)
+#
+#   python bench_leaderboard.py --output before.json
+#   python bench_leaderboard.py --sizes 10000 100000 --compare before.json
+
+SIZES = (10_000, 100_000, 1_000_000)
+RADIUS = 5
+PERCENTILES = (50, 95)
+
+
+def seed_users(count):
+    """Replace every user with `count` ranked users (ratings 400-1399)."""
+    db.session.execute(db.delete(User))
+    db.session.execute(
+        db.text(
+            """
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :count)
+            INSERT INTO user (id, username, email, password, xp, tokens, level, rating, wins, losses, banned)
+            SELECT i, 'user' || i, 'user' || i || '@example.com', '-', 0, 0, 1,
+                   400 + (i * 7919) % 1000, 1 + i % 3, i % 2, 0
+            FROM n
+            """
+        ),
+        {"count": count},
+    )
+    db.session.commit()
+    db.session.execute(db.text("ANALYZE"))
+
+
+def scan_rank(user_id, rating, radius):
+    """The leaderboard before the ranking index: O(N) per request."""
+    rank = User.query.filter(ranked_filter(), User.rating > rating).count() + 1
+    players = User.query.filter(ranked_filter()).order_by(User.rating.desc()).all()
+    for index, player in enumerate(players):
+        if player.id == user_id:
+            start = max(0, index - radius)
+            return rank, start + 1, players[start:index + radius + 1]
+    return None, None, []
+
+
+def _summary(samples_ms):
+    samples_ms.sort()
+    stats = {"calls": len(samples_ms), "mean_ms": round(sum(samples_ms) / len(samples_ms), 3)}
+    for p in PERCENTILES:
+        index = min(len(samples_ms) - 1, int(len(samples_ms) * p / 100))
+        stats[f"p{p}_ms"] = round(samples_ms[index], 3)
+    return stats
+
+
+def _time(lookup, user_ids, ratings):
+    samples = []
+    for user_id in user_ids:
+        start = time.perf_counter()
+        lookup(user_id, ratings[user_id], RADIUS)
+        samples.append((time.perf_counter() - start) * 1e3)
+        # No identity-map hits carried over between lookups
+        db.session.remove()
+    return _summary(samples)
+
+
+def bench_size(count, samples, scan_max, seed=0):
+    seed_users(count)
+    ratings = dict(db.session.execute(db.select(User.id, User.rating)).all())
+    user_ids = random.Random(seed).sample(sorted(ratings), min(samples, count))
+
+    index = RankingIndex()
+    start = time.perf_counter()
+    index.reload()
+    load_ms = (time.perf_counter() - start) * 1e3
+    ranking_module.ranking = index
+
+    results = {"index_load_ms": round(load_ms, 3), "index": _time(index_rank, user_ids, ratings)}
+    if supports_window_functions(db.engine):
+        results["window"] = _time(lambda user_id, rating, radius: window_rank(user_id, radius), user_ids, ratings)
+    if count <= scan_max:
+        results["scan"] = _time(scan_rank, user_ids[:max(5, samples // 10)], ratings)
+
+    # Index and window agree on the first sampled user; the scan (no id
+    # tie-break) agrees on the rank
+    user_id = user_ids[0]
+    rank, first, players = index_rank(user_id, ratings[user_id], RADIUS)
+    expected = (rank, first, [player.id for player in players])
+    if "window" in results:
+        rank, first, players = window_rank(user_id, RADIUS)
+        assert (rank, first, [player.id for player in players]) == expected, "window and index disagree"
+    if "scan" in results:
+        assert scan_rank(user_id, ratings[user_id], RADIUS)[0] == expected[0], "scan and index disagree"
+    return results
+
+
+def run_benchmarks(sizes=SIZES, samples=30, scan_max=100_000):
+    """Run every size and return the report dict (what --output writes)."""
+    results = {}
+    with app.app_context():
+        db.create_all()
+        for count in sizes:
+            results[str(count)] = bench_size(count, samples, scan_max)
+            db.session.remove()
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "config": {"sizes": list(sizes), "samples": samples, "radius": RADIUS, "scan_max": scan_max},
+        "results": results,
+    }
+
+
+def compare(previous, current):
+    """Print current vs previous p95 for every shared size and path."""
+    for size, paths in current["results"].items():
+        old_paths = previous.get("results", {}).get(size, {})
+        for path, stats in paths.items():
+            before = old_paths.get(path)
+            if isinstance(stats, dict) and isinstance(before, dict) and before.get("p95_ms"):
+                print(f"{size:>9} {path:8} p95 {before['p95_ms']:>10} -> {stats['p95_ms']:<10} "
+                      f"({stats['p95_ms'] / before['p95_ms']:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark leaderboard rank lookups.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="ranked user counts")
+    parser.add_argument("--samples", type=int, default=30, help="lookups per path and size (default 30)")
+    parser.add_argument("--scan-max", type=int, default=100_000, help="largest size to run the full scan at")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmarks(sizes=args.sizes, samples=args.samples, scan_max=args.scan_max)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import json
+import platform
+import random
+import time
+
+import ranked_queue as ranked_queue_module
+from ranked_queue import RankedQueue, TICK_INTERVAL
+
+# -----------------------------
+# Ranked Queue Load Generator
+# -----------------------------
+# Keeps --players players in a RankedQueue (every tick, the players that
+# were paired are replaced by new arrivals). It reports:
+#
+#   tick_ms     wall time of one pair_batch() call over the full queue
+#   wait_s      pairing latency: queue time from joining to being paired
+#   gap         rating difference of each pair
+#
+# By default the ticks run on a virtual clock, so the waits are in queue
+# time and a run takes only as long as its pair_batch() calls. With --live
+# the real asyncio service runs instead (serve() with its process pool,
+# battles skipped unless --simulate) for --duration seconds of wall time.
+#
+#   python bench_queue.py
+#   python bench_queue.py --live --duration 20 --simulate
+
+PERCENTILES = (50, 95, 99)
+RATING_MEAN = 1000
+RATING_SPREAD = 250
+
+# A fixed mid-level bot for --simulate (values as stored in a BotSnapshot)
+BENCH_VALUES = {
+    "hp": 150, "energy": 100, "proc": 30, "defense": 20, "clk": 20, "luck": 15, "logic": 15,
+    "weapon_atk": 0, "weapon_name": None, "weapon_type": None, "algorithm": "VEX-01",
+    "upgrade_armor_plating": False, "upgrade_overclock_unit": False, "upgrade_regen_core": False,
+    "upgrade_critical_subroutine": False, "upgrade_energy_recycler": False, "upgrade_emp_shield": False,
+}
+
+
+def skip_battle(values_a, name_a, values_b, name_b):
+    """Stand-in for simulate_pair when only pairing is measured."""
+    return {"winner": name_a, "winner_side": 0, "seed": 0, "log": None}
+
+
+class TimedQueue(RankedQueue):
+    """A RankedQueue that records every pairing."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.tick_ms = []
+        self.waits = []
+        self.gaps = []
+
+    def pair_batch(self, now=None):
+        now = self.clock() if now is None else now
+        start = time.perf_counter()
+        pairs = super().pair_batch(now)
+        self.tick_ms.append((time.perf_counter() - start) * 1e3)
+        for first, second in pairs:
+            self.waits.extend((now - first.joined_at, now - second.joined_at))
+            self.gaps.append(abs(first.rating - second.rating))
+        return pairs
+
+
+class Arrivals:
+    def __init__(self, queue, seed):
+        self.queue = queue
+        self.rng = random.Random(seed)
+        self.next_id = 1
+
+    def top_up(self, players, spread=0.0):
+        """
+        Join new players until the queue holds `players`, with join times
+        spread evenly over the last `spread` seconds.
+        """
+        while len(self.queue) < players:
+            rating = int(self.rng.gauss(RATING_MEAN, RATING_SPREAD))
+            entry = self.queue.join(self.next_id, self.next_id, f"bot{self.next_id}", rating, None, BENCH_VALUES)
+            entry.joined_at -= self.rng.uniform(0, spread)
+            self.next_id += 1
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+    stats = {"count": len(samples), "mean": round(sum(samples) / len(samples), 3)}
+    for p in PERCENTILES:
+        stats[f"p{p}"] = round(samples[min(len(samples) - 1, int(len(samples) * p / 100))], 3)
+    stats["max"] = round(samples[-1], 3)
+    return stats
+
+
+def run_virtual(players, ticks, seed=0):
+    now = [0.0]
+    queue = TimedQueue(clock=lambda: now[0])
+    arrivals = Arrivals(queue, seed)
+    for _ in range(ticks):
+        # The players paired last tick were replaced since then
+        arrivals.top_up(players, spread=TICK_INTERVAL)
+        queue.pair_batch()
+        now[0] += TICK_INTERVAL
+    return queue
+
+
+async def _run_live(queue, arrivals, players, duration):
+    server = asyncio.get_running_loop().create_task(queue.serve())
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        arrivals.top_up(players)
+        await asyncio.sleep(queue.tick / 2)
+    server.cancel()
+    try:
+        await server
+    except asyncio.CancelledError:
+        pass
+
+
+def run_live(players, duration, simulate, workers, seed=0):
+    settled = []
+
+    def settle(first, second, result):
+        now = time.monotonic()
+        settled.extend((now - first.joined_at, now - second.joined_at))
+        return 1
+
+    queue = TimedQueue(
+        settle=settle,
+        simulate=ranked_queue_module.simulate_pair if simulate else skip_battle,
+        workers=workers,
+    )
+    asyncio.run(_run_live(queue, Arrivals(queue, seed), players, duration))
+    queue.settled = settled
+    return queue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pairing latency of the ranked queue under load.")
+    parser.add_argument("--players", type=int, default=10_000, help="players kept in the queue (default 10000)")
+    parser.add_argument("--ticks", type=int, default=120, help="virtual-clock ticks to run (default 120)")
+    parser.add_argument("--live", action="store_true", help="run the real asyncio service instead")
+    parser.add_argument("--duration", type=float, default=20, help="--live run time in seconds (default 20)")
+    parser.add_argument("--simulate", action="store_true", help="--live: play every battle in the process pool")
+    parser.add_argument("--workers", type=int, default=2, help="--live: simulation processes (default 2)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.live:
+        queue = run_live(args.players, args.duration, args.simulate, args.workers)
+    else:
+        queue = run_virtual(args.players, args.ticks)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "players": args.players, "mode": "live" if args.live else "virtual",
+            "ticks": len(queue.tick_ms), "tick_interval_s": queue.tick,
+            "simulate": args.simulate if args.live else False,
+        },
+        "tick_ms": _summary(queue.tick_ms),
+        "wait_s": _summary(queue.waits),
+        "gap": _summary(queue.gaps),
+    }
+    if args.live:
+        report["settled_s"] = _summary(queue.settled)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
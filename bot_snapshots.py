@@ -0,0 +1,91 @@
+import hashlib
+import json
+
+from sqlalchemy.exc import IntegrityError
+
+from battle import BattleBot
+from constants import CHARACTER_ITEMS
+from extensions import db
+from models import BotSnapshot
+from settlement import UPGRADE_FIELDS
+
+# -----------------------------
+# Battle Snapshot Storage
+# -----------------------------
+# A History row does not copy both bots' battle-start stats. It points at
+# two bot_snapshot rows instead. A snapshot is keyed by a hash of its
+# values, so a bot that fights many battles without changing stats,
+# weapon or upgrades reuses the same row every time.
+
+STAT_FIELDS = ("hp", "energy", "proc", "defense", "clk", "luck", "logic", "weapon_atk", "weapon_name", "weapon_type", "algorithm")
+SNAPSHOT_FIELDS = STAT_FIELDS + UPGRADE_FIELDS
+
+
+def snapshot_values(values):
+    """Canonical [value per SNAPSHOT_FIELDS] (missing logic/weapon ATK -> 0, upgrade flags -> bool)."""
+    result = []
+    for field in SNAPSHOT_FIELDS:
+        value = values.get(field)
+        if field in UPGRADE_FIELDS:
+            value = bool(value)
+        elif field in ("logic", "weapon_atk"):
+            value = int(value or 0)
+        elif value is not None and field not in ("weapon_name", "weapon_type", "algorithm"):
+            value = int(value)
+        result.append(value)
+    return result
+
+
+def snapshot_hash(values):
+    """Content hash of snapshot_values(); the migration that backfilled History computes the same."""
+    return hashlib.blake2b(json.dumps(values).encode(), digest_size=16).hexdigest()
+
+
+def content_hash(values):
+    """The content_hash of the snapshot holding `values` (a dict of SNAPSHOT_FIELDS)."""
+    return snapshot_hash(snapshot_values(values))
+
+
+def store_snapshot(values):
+    """
+    The BotSnapshot holding `values` (a dict of SNAPSHOT_FIELDS), added
+    to the session if no battle has used these stats before. Does not commit.
+    """
+    canonical = snapshot_values(values)
+    key = snapshot_hash(canonical)
+
+    snapshot = BotSnapshot.query.filter_by(content_hash=key).first()
+    if snapshot:
+        return snapshot
+
+    snapshot = BotSnapshot(content_hash=key, **dict(zip(SNAPSHOT_FIELDS, canonical)))
+    try:
+        with db.session.begin_nested():
+            db.session.add(snapshot)
+    except IntegrityError:
+        # Stored by a concurrent battle in the meantime
+        snapshot = BotSnapshot.query.filter_by(content_hash=key).one()
+    return snapshot
+
+
+def upgrade_flags(snapshot):
+    return {field: bool(getattr(snapshot, field)) for field in UPGRADE_FIELDS}
+
+
+def snapshot_battle_bot(snapshot, name):
+    """A fresh BattleBot with a snapshot's stats (weapon ATK is already in proc)."""
+    enabled = {field for field, on in upgrade_flags(snapshot).items() if on}
+    return BattleBot(
+        name=name,
+        hp=snapshot.hp,
+        energy=snapshot.energy,
+        proc=snapshot.proc,
+        defense=snapshot.defense,
+        clk=snapshot.clk,
+        luck=snapshot.luck,
+        logic=snapshot.logic or 0,
+        weapon_atk=0,
+        weapon_type=snapshot.weapon_type,
+        algorithm=snapshot.algorithm,
+        items=[{"id": item["id"]} for item in CHARACTER_ITEMS if item.get("flag") in enabled],
+    )
@@ -0,0 +1,226 @@
+import threading
+from collections import OrderedDict
+
+from sqlalchemy.orm import joinedload
+
+from battle import ARENA_EFFECTS
+from constants import algorithm_effects
+from extensions import db
+from models import Bot, WeaponOwnership
+from settlement import UPGRADE_FIELDS
+
+# -----------------------------
+# Derived Bot Stats
+# -----------------------------
+# A bot's stat block: the base stats (proc = ATK + equipped weapon ATK),
+# the algorithm_effects multiplier of each stat and the final values,
+# int(base * multiplier). The roster pages, bot_details and battle setup
+# (battle_snapshot, tournament.snapshot_bots) all read it from here.
+#
+# Blocks are cached per process in an LRU keyed by stats_key(bot): the
+# bot's id, its stats_version and its own stat columns. The columns are in
+# the Bot row already, so edit_bot, an upgrade purchase or a consumed
+# upgrade change the key by themselves. The weapon lives in another table:
+# equipping, unequipping or levelling a weapon calls weapon_changed() for
+# the bots involved, which bumps their stats_version in the database, so
+# every process misses its old block.
+
+CACHE_SIZE = 4096
+
+# Stat -> Bot column (proc also adds the equipped weapon's ATK)
+STAT_COLUMNS = {
+    "hp": "hp",
+    "energy": "energy",
+    "proc": "atk",
+    "def": "defense",
+    "clk": "speed",
+    "luck": "luck",
+    "logic": "logic",
+}
+
+# Labels the roster pages and bot_details show, in display order
+DISPLAY_LABELS = {
+    "int": "hp",
+    "proc": "proc",
+    "def": "def",
+    "clk": "clk",
+    "logic": "logic",
+    "ent": "luck",
+    "pwr": "energy",
+}
+
+
+def display_stats(stats):
+    """A stat dict keyed by the display labels (INT, PROC, ..., PWR)."""
+    return {label: stats[stat] for label, stat in DISPLAY_LABELS.items()}
+
+
+# Upgrade flag -> key in apply_upgrade_arena_effects' `upgrades`
+UPGRADE_EFFECTS = {
+    "upgrade_armor_plating": "armor",
+    "upgrade_overclock_unit": "overclock",
+    "upgrade_regen_core": "regen",
+    "upgrade_critical_subroutine": "crit",
+    "upgrade_energy_recycler": "recycler",
+    "upgrade_emp_shield": "emp",
+}
+
+
+def upgrade_effects(flags):
+    """apply_upgrade_arena_effects' `upgrades` from {upgrade field: installed}."""
+    return {key: flags[field] for field, key in UPGRADE_EFFECTS.items()}
+
+
+def apply_upgrade_arena_effects(stats, upgrades, arena="neutral"):
+    effective = stats.copy()
+
+    if upgrades.get("armor"):
+        effective["def"] = int((effective.get("def") or 0) * 1.10)
+    if upgrades.get("overclock"):
+        effective["clk"] = int((effective.get("clk") or 0) * 1.10)
+    if upgrades.get("crit"):
+        effective["luck"] = int((effective.get("luck") or 0) + 5)
+
+    effects = ARENA_EFFECTS.get(arena, ARENA_EFFECTS["neutral"])
+    effective["clk"] = int((effective.get("clk") or 0) * effects.get("spd_mod", 1.0))
+    effective["def"] = int((effective.get("def") or 0) * effects.get("def_mod", 1.0))
+
+    return effective
+
+
+class StatBlock:
+    __slots__ = ("bot_id", "algorithm", "base", "multipliers", "final",
+                 "weapon_atk", "weapon_name", "weapon_type", "upgrades")
+
+    def __init__(self, bot, weapon_ow):
+        self.bot_id = bot.id
+        self.algorithm = bot.algorithm
+        self.weapon_atk = weapon_ow.effective_atk() if weapon_ow else 0
+        self.weapon_name = weapon_ow.weapon.name if weapon_ow else None
+        self.weapon_type = weapon_ow.weapon.type if weapon_ow else None
+        self.upgrades = {field: getattr(bot, field) for field in UPGRADE_FIELDS}
+
+        effects = algorithm_effects.get(bot.algorithm, {})
+        self.base = {stat: int(getattr(bot, column) or 0) for stat, column in STAT_COLUMNS.items()}
+        self.base["proc"] += self.weapon_atk
+        self.multipliers = {stat: effects.get(stat, 1.0) for stat in STAT_COLUMNS}
+        self.final = {stat: int(self.base[stat] * self.multipliers[stat]) for stat in STAT_COLUMNS}
+
+    def effective(self, arena="neutral"):
+        """Final stats with the one-time upgrades and the arena applied."""
+        return apply_upgrade_arena_effects(self.final, upgrade_effects(self.upgrades), arena)
+
+    def snapshot_values(self):
+        """The values stored in a BotSnapshot for a battle with this block."""
+        values = {
+            "hp": self.final["hp"],
+            "energy": self.final["energy"],
+            "proc": self.final["proc"],
+            "defense": self.final["def"],
+            "clk": self.final["clk"],
+            "luck": self.final["luck"],
+            "logic": self.final["logic"],
+            "weapon_atk": self.weapon_atk,
+            "weapon_name": self.weapon_name,
+            "weapon_type": self.weapon_type,
+            "algorithm": self.algorithm,
+        }
+        values.update(self.upgrades)
+        return values
+
+
+def stats_key(bot):
+    return (
+        bot.id,
+        bot.stats_version or 0,
+        bot.algorithm,
+        *(getattr(bot, column) for column in STAT_COLUMNS.values()),
+        *(bool(getattr(bot, field)) for field in UPGRADE_FIELDS),
+    )
+
+
+class StatCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._blocks = OrderedDict()  # stats_key -> StatBlock
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def lookup(self, bot):
+        key = stats_key(bot)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+            return block
+
+    def store(self, bot, weapon_ow):
+        block = StatBlock(bot, weapon_ow)
+        key = stats_key(bot)
+        with self._lock:
+            self._blocks[key] = block
+            self._blocks.move_to_end(key)
+            while len(self._blocks) > self.maxsize:
+                self._blocks.popitem(last=False)
+        return block
+
+    def forget(self, *bot_ids):
+        """Drop this process's blocks of these bots."""
+        bot_ids = set(bot_ids)
+        with self._lock:
+            for key in [key for key in self._blocks if key[0] in bot_ids]:
+                del self._blocks[key]
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+stat_cache = StatCache()
+
+
+def derived_stats(bot):
+    """The bot's StatBlock, built (with bot.equipped_weapon) only on a cache miss."""
+    block = stat_cache.lookup(bot)
+    if block is None:
+        block = stat_cache.store(bot, bot.equipped_weapon)
+    return block
+
+
+def derived_stats_many(bots):
+    """bot_id -> StatBlock for many bots, with one weapon query for all the misses."""
+    blocks = {}
+    missing = []
+    for bot in bots:
+        block = stat_cache.lookup(bot)
+        if block is None:
+            missing.append(bot)
+        else:
+            blocks[bot.id] = block
+
+    if missing:
+        equipped = {}
+        for ow in WeaponOwnership.query.options(joinedload(WeaponOwnership.weapon)).filter(
+            WeaponOwnership.bot_id.in_([bot.id for bot in missing]),
+            WeaponOwnership.equipped.is_(True),
+        ):
+            equipped.setdefault(ow.bot_id, ow)
+        for bot in missing:
+            blocks[bot.id] = stat_cache.store(bot, equipped.get(bot.id))
+    return blocks
+
+
+def weapon_changed(*bot_ids):
+    """
+    Bump stats_version of the bots whose equipped weapon changed (ids may be
+    None), so no process serves their old block. Commits with the caller.
+    """
+    bot_ids = {bot_id for bot_id in bot_ids if bot_id is not None}
+    if not bot_ids:
+        return
+    db.session.execute(
+        db.update(Bot).where(Bot.id.in_(bot_ids)).values(stats_version=Bot.stats_version + 1)
+    )
+    stat_cache.forget(*bot_ids)
@@ -0,0 +1,208 @@
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+# Throwaway database; must be set before app is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "query_plans.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import app
+from extensions import db
+from models import User, Bot, Weapon, WeaponOwnership
+from seed_weapons import seed_weapons
+
+# -----------------------------
+# Query Plan Check
+# -----------------------------
+# Seeds a sqlite database with a large battle history, drives the main
+# routes with the test client and runs EXPLAIN QUERY PLAN on every
+# statement they issue. A plain "SCAN <table>" (no index) on one of the
+# large tables fails the check:
+#
+#   python check_query_plans.py
+#   python check_query_plans.py --history-rows 100000 --verbose
+
+LARGE_TABLES = {"history", "user", "bots", "weapon_ownership"}
+SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+def seed(users, history_rows):
+    """`users` rated users with one armed bot each, `history_rows` battles between them, plus the player."""
+    db.create_all()
+    seed_weapons()
+    weapon_ids = [weapon.id for weapon in Weapon.query.order_by(Weapon.id)]
+    password = generate_password_hash("pw")
+
+    # Bulk rows straight in SQL; user n owns bot n
+    statements = [
+        (
+            """
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :users)
+            INSERT INTO user (id, username, email, password, xp, tokens, level, rating, wins, losses, banned)
+            SELECT i, 'user' || i, 'user' || i || '@example.com', :password, 0, 0, 1,
+                   400 + (i * 7919) % 600, (i * 31) % 7, (i * 17) % 5, 0
+            FROM n
+            """,
+            {"users": users, "password": password},
+        ),
+        (
+            """
+            INSERT INTO bots (id, name, algorithm, hp, atk, defense, speed, logic, luck, energy,
+                              xp, level, stat_points, user_id, weapon_id, botwins, botlosses)
+            SELECT id, 'Bot' || id, 'VEX-01', 100, 10, 10, 10, 10, 10, 100, 0, 1, 0, id, NULL, 0, 0
+            FROM user
+            """,
+            {},
+        ),
+        (
+            """
+            INSERT INTO weapon_ownership (user_id, weapon_id, level, bot_id, equipped)
+            SELECT id, :first_weapon + id % :weapon_count, 1, id, 1 FROM user
+            """,
+            {"first_weapon": weapon_ids[0], "weapon_count": len(weapon_ids)},
+        ),
+        (
+            """
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :rows)
+            INSERT INTO history (bot1_id, bot2_id, user1_id, user2_id, bot1_name, bot2_name,
+                                 winner, timestamp, seed)
+            SELECT a, b, a, b, 'Bot' || a, 'Bot' || b, 'Bot' || a,
+                   strftime('%Y-%m-%d %H:%M:%f000', '2026-01-01', '+' || i || ' seconds'), i
+            FROM (SELECT i, 1 + i % :users AS a, 1 + (i * 7919 + 1) % :users AS b FROM n)
+            WHERE a != b
+            """,
+            {"rows": history_rows, "users": users},
+        ),
+    ]
+    for sql, params in statements:
+        db.session.execute(db.text(sql), params)
+
+    player = User(username="player", email="player@example.com", password=password,
+                  rating=700, wins=3, losses=2, tokens=100000)
+    db.session.add(player)
+    db.session.flush()
+    bot = Bot(name="Mine", algorithm="VEX-01", user_id=player.id)
+    db.session.add(bot)
+    db.session.flush()
+    db.session.add(WeaponOwnership(user_id=player.id, weapon_id=weapon_ids[0], bot_id=bot.id, equipped=True))
+
+    # A veteran: one battle in 50 is the player's, from either side
+    db.session.execute(
+        db.text(
+            """
+            UPDATE history SET
+                user1_id = CASE WHEN id % 2 THEN :player ELSE user1_id END,
+                bot1_id = CASE WHEN id % 2 THEN :bot ELSE bot1_id END,
+                user2_id = CASE WHEN id % 2 THEN user2_id ELSE :player END,
+                bot2_id = CASE WHEN id % 2 THEN bot2_id ELSE :bot END
+            WHERE id % 50 = 0 OR id % 50 = 1
+            """
+        ),
+        {"player": player.id, "bot": bot.id},
+    )
+    db.session.commit()
+    db.session.execute(db.text("ANALYZE"))
+    return player.id, bot.id, weapon_ids[-1]
+
+
+def record_routes(client, bot_id, opponent_id, weapon_id):
+    """[(route, statement, parameters)] for one pass over the main routes."""
+    recorded = []
+    route = [None]
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            recorded.append((route[0], statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for path in ["/dashboard", "/bots", f"/bot/{bot_id}", "/store", "/history", "/leaderboard"]:
+            route[0] = "GET " + path
+            response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+
+        route[0] = "GET /history?before"
+        older = re.search(rb'href="(/history\?before=[^"]+)"', client.get("/history").data)
+        response = client.get(older.group(1).decode().replace("&amp;", "&"))
+        assert response.status_code == 200, response.status_code
+
+        route[0] = "GET /battle"
+        page = client.get("/battle")
+        token = re.search(rb'name="battle_token" value="([^"]+)"', page.data).group(1).decode()
+        route[0] = "POST /combat_log"
+        response = client.post(f"/combat_log/{bot_id}/{opponent_id}",
+                               data={"bot1": bot_id, "bot2": opponent_id, "battle_token": token})
+        assert response.status_code == 302, response.status_code
+
+        route[0] = "POST /buy_weapon"
+        response = client.post(f"/buy_weapon/{weapon_id}")
+        assert response.status_code == 302, response.status_code
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return recorded
+
+
+def query_plans(recorded):
+    """[(route, statement, plan lines)] for every SELECT/UPDATE/DELETE in `recorded`."""
+    plans = []
+    with app.app_context():
+        connection = db.session.connection().connection.driver_connection
+        for route, statement, parameters in recorded:
+            if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+                continue
+            plan = [row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + statement, parameters)]
+            plans.append((route, statement, plan))
+    return plans
+
+
+def is_full_scan(plan):
+    for detail in plan:
+        match = SCAN.match(detail)
+        if match and match.group(1) in LARGE_TABLES:
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if the main routes full-scan large tables.")
+    parser.add_argument("--users", type=int, default=20000, help="seeded users (default 20000)")
+    parser.add_argument("--history-rows", type=int, default=1_000_000, help="seeded battles (default 1000000)")
+    parser.add_argument("--verbose", action="store_true", help="print every statement's plan")
+    args = parser.parse_args()
+
+    app.config["TESTING"] = True
+    with app.app_context():
+        player_id, bot_id, weapon_id = seed(args.users, args.history_rows)
+        opponent_id = (
+            Bot.query.join(Bot.user)
+            .filter(User.id != player_id, User.rating.between(600, 800))
+            .order_by(Bot.id)
+            .first()
+            .id
+        )
+
+    client = app.test_client()
+    response = client.post("/login", data={"username": "player", "password": "pw"})
+    assert response.status_code == 302
+
+    plans = query_plans(record_routes(client, bot_id, opponent_id, weapon_id))
+    failures = [entry for entry in plans if is_full_scan(entry[2])]
+
+    for route, statement, plan in plans if args.verbose else failures:
+        label = "FULL SCAN" if is_full_scan(plan) else "ok"
+        print(f"{label} [{route}] {' '.join(statement.split())}")
+        for detail in plan:
+            print("    " + detail)
+    print(f"{len(plans)} statements checked, {len(failures)} full table scans")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import random
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import or_
+
+from extensions import db
+from models import Bot, User
+
+# -----------------------------
+# Matchmaking Index
+# -----------------------------
+# Players who own at least one bot (and are not banned), kept in buckets of
+# BUCKET_WIDTH rating points. battle_select asks for `k` opponents near
+# the player's rating. It gets a uniform random sample of everyone in the
+# buckets covering ±MATCH_WINDOW, not always the same top of the range. When that window
+# holds fewer than `k` players it doubles until it does (or covers every
+# bucket). A sample only touches the buckets in the window plus k picks,
+# whatever the number of players; sample_bots() then draws a bounded
+# number of each picked player's bots. Like ranking.py, the index lives in
+# each process: it is updated in place on rating changes and bot
+# creation/deletion, and reloaded every RECONCILE_INTERVAL seconds on a
+# background thread, swapped in with the changes made meanwhile replayed.
+
+BUCKET_WIDTH = 50
+MATCH_WINDOW = 200
+RECONCILE_INTERVAL = 300
+
+
+def _bucket(rating):
+    return int(rating or 0) // BUCKET_WIDTH
+
+
+class MatchmakingIndex:
+    def __init__(self, reconcile_interval=RECONCILE_INTERVAL):
+        self.reconcile_interval = reconcile_interval
+        self._clear()
+        self._loaded_at = None
+        self._pending = None  # changes made while a background reload runs
+        self._lock = threading.RLock()
+
+    def _clear(self):
+        self._buckets = {}  # bucket -> [user_id], unordered
+        self._slots = {}  # user_id -> (bucket, index in its list)
+        self._bots = defaultdict(set)  # user_id -> bot ids
+        self._owners = {}  # bot_id -> user_id
+
+    def reload(self):
+        """Rebuild from the database. Needs an app context."""
+        rows = db.session.execute(
+            db.select(Bot.id, User.id, User.rating)
+            .join(User, Bot.user_id == User.id)
+            .where(or_(User.banned.is_(False), User.banned.is_(None)))
+        ).all()
+        fresh = MatchmakingIndex(self.reconcile_interval)
+        for bot_id, user_id, rating in rows:
+            fresh._add_bot(bot_id, user_id, rating)
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._buckets, self._slots = fresh._buckets, fresh._slots
+            self._bots, self._owners = fresh._bots, fresh._owners
+            for change, args in pending or ():
+                change(*args)
+            self._loaded_at = time.monotonic()
+
+    def _reload_in_background(self, app):
+        try:
+            with app.app_context():
+                self.reload()
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _ensure_fresh(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            self.reload()
+        elif time.monotonic() - loaded_at > self.reconcile_interval:
+            with self._lock:
+                if self._pending is not None:
+                    return  # already reloading
+                self._pending = []
+            threading.Thread(
+                target=self._reload_in_background,
+                args=(current_app._get_current_object(),),
+                daemon=True,
+                name="matchmaking-reload",
+            ).start()
+
+    # Bucket lists are unordered, so removal swaps in the last member (O(1))
+
+    def _place(self, user_id, rating):
+        bucket = _bucket(rating)
+        members = self._buckets.setdefault(bucket, [])
+        self._slots[user_id] = (bucket, len(members))
+        members.append(user_id)
+
+    def _unplace(self, user_id):
+        bucket, index = self._slots.pop(user_id)
+        members = self._buckets[bucket]
+        last = members.pop()
+        if last != user_id:
+            members[index] = last
+            self._slots[last] = (bucket, index)
+        if not members:
+            del self._buckets[bucket]
+
+    def _add_bot(self, bot_id, user_id, rating):
+        if user_id not in self._slots:
+            self._place(user_id, rating)
+        self._bots[user_id].add(bot_id)
+        self._owners[bot_id] = user_id
+
+    def add_bot(self, bot_id, user_id, rating):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self.add_bot, (bot_id, user_id, rating)))
+            self._add_bot(bot_id, user_id, rating)
+
+    def remove_bot(self, bot_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self.remove_bot, (bot_id,)))
+            user_id = self._owners.pop(bot_id, None)
+            if user_id is None:
+                return
+            bots = self._bots[user_id]
+            bots.discard(bot_id)
+            if not bots:
+                del self._bots[user_id]
+                self._unplace(user_id)
+
+    def set_rating(self, user_id, rating):
+        """Move a player to their new rating's bucket (no-op if they have no bots here)."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self.set_rating, (user_id, rating)))
+            if user_id not in self._slots:
+                return
+            if _bucket(rating) == self._slots[user_id][0]:
+                return
+            self._unplace(user_id)
+            self._place(user_id, rating)
+
+    def remove_user(self, user_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self.remove_user, (user_id,)))
+            if user_id in self._slots:
+                self._unplace(user_id)
+            for bot_id in self._bots.pop(user_id, ()):
+                self._owners.pop(bot_id, None)
+
+    def sample(self, rating, k, exclude=None, window=MATCH_WINDOW, rng=random):
+        """
+        Up to k user ids drawn uniformly from the players in the buckets
+        covering ±window of `rating` (never `exclude`), the window doubling
+        while it holds fewer than k. Returns (user_ids, window used).
+        """
+        self._ensure_fresh()
+        with self._lock:
+            if not self._buckets:
+                return [], window
+            lowest, highest = min(self._buckets), max(self._buckets)
+            excluded_bucket = self._slots[exclude][0] if exclude in self._slots else None
+            while True:
+                first, last = _bucket(rating - window), _bucket(rating + window)
+                members = [self._buckets[bucket] for bucket in range(first, last + 1) if bucket in self._buckets]
+                total = sum(len(bucket) for bucket in members)
+                available = total - (excluded_bucket is not None and first <= excluded_bucket <= last)
+                if available >= k or (first <= lowest and last >= highest):
+                    break
+                window *= 2
+
+            # One extra pick in case `exclude` is drawn
+            picks = []
+            for position in rng.sample(range(total), min(total, k + 1)):
+                for bucket in members:
+                    if position < len(bucket):
+                        picks.append(bucket[position])
+                        break
+                    position -= len(bucket)
+            return [user_id for user_id in picks if user_id != exclude][:k], window
+
+    def sample_bots(self, rating, k, per_user, exclude=None, window=MATCH_WINDOW, rng=random):
+        """
+        Bots of up to k players from sample(): at most per_user of each
+        player's bots, drawn at random, so at most k * per_user in all
+        however many bots a player owns. Returns (bot_ids, window used).
+        """
+        user_ids, window = self.sample(rating, k, exclude=exclude, window=window, rng=rng)
+        bot_ids = []
+        with self._lock:
+            for user_id in user_ids:
+                bots = self._bots.get(user_id, ())
+                bot_ids.extend(rng.sample(sorted(bots), min(len(bots), per_user)))
+        return bot_ids, window
+
+
+matchmaking = MatchmakingIndex()
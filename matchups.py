@@ -0,0 +1,228 @@
+import argparse
+import hashlib
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import func, or_
+
+from battle import ARENA_EFFECTS
+from battle_exact import exact_outcome
+from battle_sim import simulate_battles
+from bot_snapshots import content_hash, snapshot_battle_bot
+from bot_stats import derived_stats_many
+from extensions import db
+from models import Bot, User, Matchup
+
+# -----------------------------
+# Matchup Matrix Cache
+# -----------------------------
+# The matchup table stores simulated win probabilities for every pair of
+# active bots in every arena. Rows are keyed by each bot's battle-start
+# stats rather than by bot id: the bot_snapshots content hash, the same
+# key as the BotSnapshot a battle of the bot stores. When a bot is edited, re-equipped
+# or gains/spends upgrades, its hash changes and only that bot's row and
+# column are recomputed; every other entry stays valid. refresh_matchups()
+# is the background job (python matchups.py). It evaluates pairs without
+# CHAOS-RND exactly with battle_exact (running the joint chain for
+# abilities only up to battle_exact.MAX_JOINT_STATES) and simulates the
+# rest. Pages only read the table; a pair the job has not reached yet
+# shows as not simulated.
+
+ARENAS = tuple(ARENA_EFFECTS)
+SIM_BATTLES = 1000
+REFRESH_INTERVAL = 60
+# keep IN (...) lists under SQLite's bound-parameter limit
+BATCH_SIZE = 500
+
+
+def stat_snapshots(bots):
+    """
+    bot_id -> the bot's battle-start snapshot values (a dict of
+    SNAPSHOT_FIELDS from its bot_stats block), as combat_log stores them.
+    """
+    bots = list(bots)
+    blocks = derived_stats_many(bots)
+    return {bot.id: blocks[bot.id].snapshot_values() for bot in bots}
+
+
+def bot_hashes(bots):
+    return {bot_id: content_hash(values) for bot_id, values in stat_snapshots(bots).items()}
+
+
+def _battle_bot(values, name):
+    return snapshot_battle_bot(SimpleNamespace(**values), name)
+
+
+def _exact(values):
+    """Whether a snapshot's matchups can go through battle_exact (no CHAOS-RND)."""
+    return values["algorithm"] != "CHAOS-RND"
+
+
+def active_bots():
+    return (
+        Bot.query.join(User, Bot.user_id == User.id)
+        .filter(or_(User.banned.is_(False), User.banned.is_(None)))
+        .order_by(Bot.id)
+        .all()
+    )
+
+
+def _pair_seed(bot_hash, opponent_hash, arena):
+    key = f"{bot_hash}:{opponent_hash}:{arena}".encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=4).digest(), "big")
+
+
+def _batches(values):
+    values = list(values)
+    for start in range(0, len(values), BATCH_SIZE):
+        yield values[start:start + BATCH_SIZE]
+
+
+def refresh_matchups(battles=SIM_BATTLES, arenas=ARENAS):
+    """
+    Bring the matchup table up to date with the current active bots.
+    Entries for stat hashes no longer in use are deleted. Every hash
+    without entries gets its row and column (each arena) evaluated and
+    committed in one go: exactly when neither bot is CHAOS-RND (stored
+    with battles=0), otherwise by simulating `battles` battles.
+    Returns (new_hashes, entries_written).
+    """
+    snapshots = {}
+    for values in stat_snapshots(active_bots()).values():
+        snapshots.setdefault(content_hash(values), values)
+
+    cached = {h for (h,) in db.session.query(Matchup.bot_hash).distinct()}
+
+    stale = cached - snapshots.keys()
+    for batch in _batches(stale):
+        Matchup.query.filter(
+            or_(Matchup.bot_hash.in_(batch), Matchup.opponent_hash.in_(batch))
+        ).delete(synchronize_session=False)
+    db.session.commit()
+
+    # Prepared once; simulate_battles does not modify them
+    prepared = {h: _battle_bot(snapshot, h) for h, snapshot in snapshots.items()}
+    done = cached & snapshots.keys()
+    new_hashes = [h for h in snapshots if h not in done]
+    written = 0
+
+    for new_hash in new_hashes:
+        done.add(new_hash)
+        pairs = set()
+        for other in done:
+            pairs.add((new_hash, other))
+            pairs.add((other, new_hash))
+
+        now = datetime.utcnow()
+        rows = []
+        for bot_hash, opponent_hash in pairs:
+            exact = _exact(snapshots[bot_hash]) and _exact(snapshots[opponent_hash])
+            for arena in arenas:
+                result = None
+                if exact:
+                    try:
+                        result = exact_outcome(prepared[bot_hash], prepared[opponent_hash], arena=arena)
+                    except ValueError:
+                        pass  # joint chain too large
+                solved = result is not None
+                if not solved:
+                    result = simulate_battles(
+                        prepared[bot_hash],
+                        prepared[opponent_hash],
+                        n=battles,
+                        seed=_pair_seed(bot_hash, opponent_hash, arena),
+                        arena=arena,
+                    )
+                rows.append({
+                    "arena": arena,
+                    "bot_hash": bot_hash,
+                    "opponent_hash": opponent_hash,
+                    "win_rate": result["win_rate"],
+                    "draw_rate": result["draw_rate"],
+                    "battles": 0 if solved else battles,
+                    "updated_at": now,
+                })
+        db.session.execute(db.insert(Matchup), rows)
+        db.session.commit()
+        written += len(rows)
+
+    return len(new_hashes), written
+
+
+def win_chances(my_bots, opponents, arena="neutral"):
+    """
+    {my_bot_id: {opponent_id: win_rate}} from the cache, one query.
+    Pairs the refresh job has not covered yet are missing.
+    """
+    my_bots = list(my_bots)
+    opponents = list(opponents)
+    if not my_bots or not opponents:
+        return {}
+
+    hashes = bot_hashes({bot.id: bot for bot in my_bots + opponents}.values())
+    mine = {hashes[bot.id] for bot in my_bots}
+    theirs = {hashes[bot.id] for bot in opponents}
+
+    rates = {
+        (bot_hash, opponent_hash): win_rate
+        for bot_hash, opponent_hash, win_rate in db.session.query(
+            Matchup.bot_hash, Matchup.opponent_hash, Matchup.win_rate
+        ).filter(
+            Matchup.bot_hash.in_(mine),
+            Matchup.arena == arena,
+            Matchup.opponent_hash.in_(theirs),
+        )
+    }
+
+    chances = {}
+    for bot in my_bots:
+        row = {}
+        for opponent in opponents:
+            rate = rates.get((hashes[bot.id], hashes[opponent.id]))
+            if rate is not None:
+                row[opponent.id] = rate
+        chances[bot.id] = row
+    return chances
+
+
+def field_strength(bot):
+    """
+    {arena: (average win rate, opponents)} for bot against the active field.
+    The bot's mirror match is left out. The table keeps it for other bots
+    with the same stats, but it says nothing about the field.
+    """
+    bot_hash = bot_hashes([bot])[bot.id]
+    return {
+        arena: (avg, count)
+        for arena, avg, count in db.session.query(
+            Matchup.arena, func.avg(Matchup.win_rate), func.count(Matchup.id)
+        ).filter(
+            Matchup.bot_hash == bot_hash,
+            Matchup.opponent_hash != bot_hash,
+        ).group_by(Matchup.arena)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the matchup matrix cache up to date.")
+    parser.add_argument("--once", action="store_true", help="refresh once and exit")
+    parser.add_argument("--interval", type=int, default=REFRESH_INTERVAL, help="seconds between refreshes")
+    parser.add_argument("--battles", type=int, default=SIM_BATTLES, help="simulated battles per pair and arena")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        while True:
+            started = time.perf_counter()
+            new_hashes, written = refresh_matchups(battles=args.battles)
+            print(f"{new_hashes} new stat hashes, {written} entries in {time.perf_counter() - started:.2f}s")
+            db.session.remove()
+            if args.once:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
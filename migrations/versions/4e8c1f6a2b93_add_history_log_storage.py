@@ -0,0 +1,27 @@
+"""store compressed combat log on history
+
+Revision ID: 4e8c1f6a2b93
+Revises: e5b9a0c3d7f2
+Create Date: 2026-10-18 09:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4e8c1f6a2b93"
+down_revision = "e5b9a0c3d7f2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("history", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("log_data", sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column("log_version", sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("history", schema=None) as batch_op:
+        batch_op.drop_column("log_version")
+        batch_op.drop_column("log_data")
@@ -0,0 +1,188 @@
+"""move history stat snapshots into a shared bot_snapshot table
+
+Revision ID: 5f8b3d1e7a29
+Revises: 7c4e2a9f1b36
+Create Date: 2026-10-18 12:00:00.000000
+"""
+import hashlib
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5f8b3d1e7a29"
+down_revision = "7c4e2a9f1b36"
+branch_labels = None
+depends_on = None
+
+# History rows handled per round trip during the backfill
+BATCH_SIZE = 5000
+
+# Same order and canonical form as bot_snapshots.SNAPSHOT_FIELDS / snapshot_values
+STAT_COLUMNS = (
+    ("hp", sa.Integer),
+    ("energy", sa.Integer),
+    ("proc", sa.Integer),
+    ("defense", sa.Integer),
+    ("clk", sa.Integer),
+    ("luck", sa.Integer),
+    ("logic", sa.Integer),
+    ("weapon_atk", sa.Integer),
+    ("weapon_name", lambda: sa.String(length=50)),
+    ("weapon_type", lambda: sa.String(length=20)),
+    ("algorithm", lambda: sa.String(length=50)),
+)
+UPGRADE_COLUMNS = (
+    "upgrade_armor_plating",
+    "upgrade_overclock_unit",
+    "upgrade_regen_core",
+    "upgrade_critical_subroutine",
+    "upgrade_energy_recycler",
+    "upgrade_emp_shield",
+)
+SNAPSHOT_COLUMNS = tuple(name for name, _ in STAT_COLUMNS) + UPGRADE_COLUMNS
+TEXT_COLUMNS = ("weapon_name", "weapon_type", "algorithm")
+SIDES = ("bot1", "bot2")
+
+
+def _columns():
+    """Fresh sa.Column objects for one snapshot's values."""
+    columns = [sa.Column(name, type_(), nullable=True) for name, type_ in STAT_COLUMNS]
+    columns += [sa.Column(name, sa.Boolean(), nullable=True) for name in UPGRADE_COLUMNS]
+    return columns
+
+
+def _canonical(values):
+    result = []
+    for name, value in zip(SNAPSHOT_COLUMNS, values):
+        if name in UPGRADE_COLUMNS:
+            value = bool(value)
+        elif name in ("logic", "weapon_atk"):
+            value = int(value or 0)
+        elif value is not None and name not in TEXT_COLUMNS:
+            value = int(value)
+        result.append(value)
+    return result
+
+
+def _hash(values):
+    return hashlib.blake2b(json.dumps(values).encode(), digest_size=16).hexdigest()
+
+
+def _history_table(*names):
+    return sa.table("history", sa.column("id", sa.Integer), *(sa.column(name) for name in names))
+
+
+def _snapshot_table():
+    return sa.table(
+        "bot_snapshot",
+        sa.column("id", sa.Integer),
+        sa.column("content_hash", sa.String),
+        *(sa.column(name) for name in SNAPSHOT_COLUMNS),
+    )
+
+
+def upgrade():
+    op.create_table(
+        "bot_snapshot",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("content_hash", sa.String(length=32), nullable=False),
+        *_columns(),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("content_hash"),
+    )
+    with op.batch_alter_table("history", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("bot1_snapshot_id", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("bot2_snapshot_id", sa.Integer(), nullable=True))
+
+    _backfill_snapshots()
+
+    with op.batch_alter_table("history", schema=None) as batch_op:
+        for side in SIDES:
+            batch_op.create_foreign_key(
+                f"fk_history_{side}_snapshot_id_bot_snapshot", "bot_snapshot", [f"{side}_snapshot_id"], ["id"]
+            )
+            for name in SNAPSHOT_COLUMNS:
+                batch_op.drop_column(f"{side}_{name}")
+
+
+def _backfill_snapshots():
+    """Point every history row at deduplicated snapshots, BATCH_SIZE rows at a time."""
+    bind = op.get_bind()
+    side_columns = {side: [f"{side}_{name}" for name in SNAPSHOT_COLUMNS] for side in SIDES}
+    history = _history_table(*side_columns["bot1"], *side_columns["bot2"], "bot1_snapshot_id", "bot2_snapshot_id")
+    snapshot = _snapshot_table()
+    snapshot_ids = {}
+
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(history.c.id, *(history.c[name] for name in side_columns["bot1"] + side_columns["bot2"]))
+            .where(history.c.id > last_id)
+            .order_by(history.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        width = len(SNAPSHOT_COLUMNS)
+        new_snapshots = {}
+        updates = []
+        for row in rows:
+            hashes = []
+            for offset in (1, 1 + width):
+                values = _canonical(row[offset:offset + width])
+                content_hash = _hash(values)
+                if content_hash not in snapshot_ids and content_hash not in new_snapshots:
+                    new_snapshots[content_hash] = dict(zip(SNAPSHOT_COLUMNS, values), content_hash=content_hash)
+                hashes.append(content_hash)
+            updates.append((row[0], hashes))
+
+        if new_snapshots:
+            bind.execute(sa.insert(snapshot), list(new_snapshots.values()))
+            for chunk_start in range(0, len(new_snapshots), 500):
+                chunk = list(new_snapshots)[chunk_start:chunk_start + 500]
+                for snapshot_id, content_hash in bind.execute(
+                    sa.select(snapshot.c.id, snapshot.c.content_hash).where(snapshot.c.content_hash.in_(chunk))
+                ):
+                    snapshot_ids[content_hash] = snapshot_id
+
+        bind.execute(
+            history.update()
+            .where(history.c.id == sa.bindparam("history_id"))
+            .values(bot1_snapshot_id=sa.bindparam("bot1"), bot2_snapshot_id=sa.bindparam("bot2")),
+            [
+                {"history_id": history_id, "bot1": snapshot_ids[hash1], "bot2": snapshot_ids[hash2]}
+                for history_id, (hash1, hash2) in updates
+            ],
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("history", schema=None) as batch_op:
+        for side in SIDES:
+            for column in _columns():
+                column.name = f"{side}_{column.name}"
+                batch_op.add_column(column)
+
+    bind = op.get_bind()
+    snapshot = _snapshot_table()
+    for side in SIDES:
+        history = _history_table(f"{side}_snapshot_id", *(f"{side}_{name}" for name in SNAPSHOT_COLUMNS))
+        bind.execute(
+            history.update().values({
+                f"{side}_{name}": sa.select(snapshot.c[name])
+                .where(snapshot.c.id == history.c[f"{side}_snapshot_id"])
+                .scalar_subquery()
+                for name in SNAPSHOT_COLUMNS
+            })
+        )
+
+    with op.batch_alter_table("history", schema=None) as batch_op:
+        for side in SIDES:
+            batch_op.drop_constraint(f"fk_history_{side}_snapshot_id_bot_snapshot", type_="foreignkey")
+            batch_op.drop_column(f"{side}_snapshot_id")
+    op.drop_table("bot_snapshot")
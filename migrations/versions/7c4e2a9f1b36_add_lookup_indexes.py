@@ -0,0 +1,55 @@
+"""add indexes for history, ownership and rating lookups
+
+Revision ID: 7c4e2a9f1b36
+Revises: d1f4a9b2c685
+Create Date: 2026-10-18 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7c4e2a9f1b36"
+down_revision = "d1f4a9b2c685"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("history", schema=None) as batch_op:
+        batch_op.create_index("ix_history_user1_id_timestamp", ["user1_id", "timestamp", "id"], unique=False)
+        batch_op.create_index("ix_history_user2_id_timestamp", ["user2_id", "timestamp", "id"], unique=False)
+
+    with op.batch_alter_table("weapon_ownership", schema=None) as batch_op:
+        batch_op.create_index("ix_weapon_ownership_bot_id_equipped", ["bot_id", "equipped"], unique=False)
+        batch_op.create_index("ix_weapon_ownership_user_id_weapon_id", ["user_id", "weapon_id"], unique=False)
+
+    with op.batch_alter_table("bots", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_bots_user_id"), ["user_id"], unique=False)
+
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.create_index("ix_user_rating", ["rating"], unique=False)
+        batch_op.create_index(
+            "ix_user_rating_ranked",
+            ["rating"],
+            unique=False,
+            sqlite_where=sa.text("wins + losses > 0"),
+            postgresql_where=sa.text("wins + losses > 0"),
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("user", schema=None) as batch_op:
+        batch_op.drop_index("ix_user_rating_ranked")
+        batch_op.drop_index("ix_user_rating")
+
+    with op.batch_alter_table("bots", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_bots_user_id"))
+
+    with op.batch_alter_table("weapon_ownership", schema=None) as batch_op:
+        batch_op.drop_index("ix_weapon_ownership_user_id_weapon_id")
+        batch_op.drop_index("ix_weapon_ownership_bot_id_equipped")
+
+    with op.batch_alter_table("history", schema=None) as batch_op:
+        batch_op.drop_index("ix_history_user2_id_timestamp")
+        batch_op.drop_index("ix_history_user1_id_timestamp")
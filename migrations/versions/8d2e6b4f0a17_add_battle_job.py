@@ -0,0 +1,43 @@
+"""add battle_job table for background battle workers
+
+Revision ID: 8d2e6b4f0a17
+Revises: 5f8b3d1e7a29
+Create Date: 2026-10-18 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8d2e6b4f0a17"
+down_revision = "5f8b3d1e7a29"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "battle_job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("battle_token", sa.String(length=32), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("bot1_id", sa.Integer(), nullable=False),
+        sa.Column("bot2_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(length=10), nullable=False),
+        sa.Column("history_id", sa.Integer(), nullable=True),
+        sa.Column("summary", sa.Text(), nullable=True),
+        sa.Column("error", sa.String(length=200), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("battle_token"),
+    )
+    with op.batch_alter_table("battle_job", schema=None) as batch_op:
+        batch_op.create_index("ix_battle_job_status_id", ["status", "id"], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table("battle_job", schema=None) as batch_op:
+        batch_op.drop_index("ix_battle_job_status_id")
+    op.drop_table("battle_job")
@@ -0,0 +1,27 @@
+"""add battle_token to history for idempotent battle submits
+
+Revision ID: 9a3d5c7e1f04
+Revises: 4e8c1f6a2b93
+Create Date: 2026-10-18 10:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9a3d5c7e1f04"
+down_revision = "4e8c1f6a2b93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("history", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("battle_token", sa.String(length=32), nullable=True))
+        batch_op.create_index(batch_op.f("ix_history_battle_token"), ["battle_token"], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table("history", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_history_battle_token"))
+        batch_op.drop_column("battle_token")
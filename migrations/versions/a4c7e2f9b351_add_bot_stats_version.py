@@ -0,0 +1,25 @@
+"""add bot stats_version for cached stat blocks
+
+Revision ID: a4c7e2f9b351
+Revises: 8d2e6b4f0a17
+Create Date: 2026-10-18 15:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a4c7e2f9b351"
+down_revision = "8d2e6b4f0a17"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("bots", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("stats_version", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade():
+    with op.batch_alter_table("bots", schema=None) as batch_op:
+        batch_op.drop_column("stats_version")
@@ -0,0 +1,41 @@
+"""add tournament_result table
+
+Revision ID: c6e2f8a4d913
+Revises: 9a3d5c7e1f04
+Create Date: 2026-10-18 11:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c6e2f8a4d913"
+down_revision = "9a3d5c7e1f04"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "tournament_result",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("run_id", sa.String(length=32), nullable=False),
+        sa.Column("master_seed", sa.BigInteger(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), nullable=True),
+        sa.Column("bot_id", sa.Integer(), nullable=True),
+        sa.Column("bot_name", sa.String(length=50), nullable=False),
+        sa.Column("arena", sa.String(length=20), nullable=False),
+        sa.Column("wins", sa.Integer(), nullable=True),
+        sa.Column("losses", sa.Integer(), nullable=True),
+        sa.Column("draws", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["bot_id"], ["bots.id"], ondelete="SET NULL"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("tournament_result", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_tournament_result_run_id"), ["run_id"], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table("tournament_result", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_tournament_result_run_id"))
+    op.drop_table("tournament_result")
@@ -0,0 +1,39 @@
+"""add matchup cache table
+
+Revision ID: d1f4a9b2c685
+Revises: c6e2f8a4d913
+Create Date: 2026-10-18 12:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d1f4a9b2c685"
+down_revision = "c6e2f8a4d913"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "matchup",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("arena", sa.String(length=20), nullable=False),
+        sa.Column("bot_hash", sa.String(length=32), nullable=False),
+        sa.Column("opponent_hash", sa.String(length=32), nullable=False),
+        sa.Column("win_rate", sa.Float(), nullable=False),
+        sa.Column("draw_rate", sa.Float(), nullable=False),
+        sa.Column("battles", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("bot_hash", "arena", "opponent_hash", name="uq_matchup_pair"),
+    )
+    with op.batch_alter_table("matchup", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_matchup_opponent_hash"), ["opponent_hash"], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table("matchup", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_matchup_opponent_hash"))
+    op.drop_table("matchup")
@@ -21,6 +21,18 @@ class User(db.Model, UserMixin):
 
     bots = db.relationship("Bot", backref="user", lazy=True)
 
+    # battle_select looks up a rating range; leaderboard only ranks players
+    # who have battled, so its index skips everyone else
+    __table_args__ = (
+        db.Index("ix_user_rating", "rating"),
+        db.Index(
+            "ix_user_rating_ranked",
+            "rating",
+            sqlite_where=db.text("wins + losses > 0"),
+            postgresql_where=db.text("wins + losses > 0"),
+        ),
+    )
+
     @property
     def win_rate(self):
         total = self.wins + self.losses
@@ -55,7 +67,7 @@ class Bot(db.Model):
     extra_attacks = db.Column(db.Integer, default=0)
     ability_used = db.Column(db.Boolean, default=False)
     special_damage = db.Column(db.Integer, default=0)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True, index=True)
 
     weapon_id = db.Column(db.Integer, db.ForeignKey("weapons.id"), nullable=True)
     weapon = db.relationship("Weapon", backref="bots", lazy=True)
@@ -70,7 +82,8 @@ class Bot(db.Model):
     upgrade_energy_recycler = db.Column(db.Boolean, default=False)
     upgrade_emp_shield = db.Column(db.Boolean, default=False)
 
-   
+    # Bumped when the equipped weapon changes (see bot_stats)
+    stats_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     @property
     def equipped_weapon(self):
@@ -109,43 +122,52 @@ class History(db.Model):
 
     seed = db.Column(db.Integer, nullable=False)
 
-    # Bot 1 stats snapshot
-    bot1_hp = db.Column(db.Integer)
-    bot1_energy = db.Column(db.Integer)
-    bot1_proc = db.Column(db.Integer)
-    bot1_defense = db.Column(db.Integer)
-    bot1_clk = db.Column(db.Integer)
-    bot1_luck = db.Column(db.Integer)
-    bot1_logic = db.Column(db.Integer, default=0)
-    bot1_weapon_atk = db.Column(db.Integer, default=0)
-    bot1_weapon_name = db.Column(db.String(50))
-    bot1_weapon_type = db.Column(db.String(20))
-    bot1_algorithm = db.Column(db.String(50))
-    bot1_upgrade_armor_plating = db.Column(db.Boolean, default=False)
-    bot1_upgrade_overclock_unit = db.Column(db.Boolean, default=False)
-    bot1_upgrade_regen_core = db.Column(db.Boolean, default=False)
-    bot1_upgrade_critical_subroutine = db.Column(db.Boolean, default=False)
-    bot1_upgrade_energy_recycler = db.Column(db.Boolean, default=False)
-    bot1_upgrade_emp_shield = db.Column(db.Boolean, default=False)
-    
-    # Bot 2 stats snapshot
-    bot2_hp = db.Column(db.Integer)
-    bot2_energy = db.Column(db.Integer)
-    bot2_proc = db.Column(db.Integer)
-    bot2_defense = db.Column(db.Integer)
-    bot2_clk = db.Column(db.Integer)
-    bot2_luck = db.Column(db.Integer)
-    bot2_logic = db.Column(db.Integer, default=0)
-    bot2_weapon_atk = db.Column(db.Integer, default=0)
-    bot2_weapon_name = db.Column(db.String(50))
-    bot2_weapon_type = db.Column(db.String(20))
-    bot2_algorithm = db.Column(db.String(50))
-    bot2_upgrade_armor_plating = db.Column(db.Boolean, default=False)
-    bot2_upgrade_overclock_unit = db.Column(db.Boolean, default=False)
-    bot2_upgrade_regen_core = db.Column(db.Boolean, default=False)
-    bot2_upgrade_critical_subroutine = db.Column(db.Boolean, default=False)
-    bot2_upgrade_energy_recycler = db.Column(db.Boolean, default=False)
-    bot2_upgrade_emp_shield = db.Column(db.Boolean, default=False)
+    # Battle-start stats of each side, shared with every other battle that
+    # saw the same stats (see bot_snapshots.py)
+    bot1_snapshot_id = db.Column(db.Integer, db.ForeignKey("bot_snapshot.id"), nullable=True)
+    bot2_snapshot_id = db.Column(db.Integer, db.ForeignKey("bot_snapshot.id"), nullable=True)
+    bot1_snapshot = db.relationship("BotSnapshot", foreign_keys=[bot1_snapshot_id])
+    bot2_snapshot = db.relationship("BotSnapshot", foreign_keys=[bot2_snapshot_id])
+
+    # Stored replay: compressed log (battle.encode_log) + engine version that produced it
+    log_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    log_version = db.Column(db.Integer, nullable=True)
+
+    # One-time token from battle_select; a resubmitted form maps back to this row
+    battle_token = db.Column(db.String(32), unique=True, index=True, nullable=True)
+
+    # /history: a user's battles from either side, newest first
+    __table_args__ = (
+        db.Index("ix_history_user1_id_timestamp", "user1_id", "timestamp", "id"),
+        db.Index("ix_history_user2_id_timestamp", "user2_id", "timestamp", "id"),
+    )
+
+
+class BotSnapshot(db.Model):
+    __tablename__ = "bot_snapshot"
+
+    # Content-addressed: content_hash is bot_snapshots.snapshot_hash of the
+    # columns below, so identical stats are stored once
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(32), unique=True, nullable=False)
+
+    hp = db.Column(db.Integer)
+    energy = db.Column(db.Integer)
+    proc = db.Column(db.Integer)
+    defense = db.Column(db.Integer)
+    clk = db.Column(db.Integer)
+    luck = db.Column(db.Integer)
+    logic = db.Column(db.Integer, default=0)
+    weapon_atk = db.Column(db.Integer, default=0)
+    weapon_name = db.Column(db.String(50))
+    weapon_type = db.Column(db.String(20))
+    algorithm = db.Column(db.String(50))
+    upgrade_armor_plating = db.Column(db.Boolean, default=False)
+    upgrade_overclock_unit = db.Column(db.Boolean, default=False)
+    upgrade_regen_core = db.Column(db.Boolean, default=False)
+    upgrade_critical_subroutine = db.Column(db.Boolean, default=False)
+    upgrade_energy_recycler = db.Column(db.Boolean, default=False)
+    upgrade_emp_shield = db.Column(db.Boolean, default=False)
 
 
 class WeaponOwnership(db.Model):
@@ -166,6 +188,11 @@ class WeaponOwnership(db.Model):
     weapon = db.relationship("Weapon")
     bot = db.relationship("Bot", backref="equipped_weapon_ownership")
 
+    __table_args__ = (
+        db.Index("ix_weapon_ownership_bot_id_equipped", "bot_id", "equipped"),
+        db.Index("ix_weapon_ownership_user_id_weapon_id", "user_id", "weapon_id"),
+    )
+
     def effective_atk(self):
         if not self.weapon:
             return 0
@@ -196,3 +223,75 @@ class Weapon(db.Model):
         }
         stats = tier_stats.get(self.tier, {"base": 5, "per_level": 1})
         return stats["base"] + (level - 1) * stats["per_level"]
+
+
+class TournamentResult(db.Model):
+    __tablename__ = "tournament_result"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # One run = one round-robin (tournament.py); all rows of a run share run_id
+    run_id = db.Column(db.String(32), nullable=False, index=True)
+    master_seed = db.Column(db.BigInteger, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Rows outlive their bot (bot_name keeps the label); deleting it clears bot_id
+    bot_id = db.Column(db.Integer, db.ForeignKey("bots.id", ondelete="SET NULL"), nullable=True)
+    bot_name = db.Column(db.String(50), nullable=False)
+    arena = db.Column(db.String(20), nullable=False)
+
+    wins = db.Column(db.Integer, default=0)
+    losses = db.Column(db.Integer, default=0)
+    draws = db.Column(db.Integer, default=0)
+
+
+class Matchup(db.Model):
+    __tablename__ = "matchup"
+
+    # Simulated result of bot_hash (as bot1) vs opponent_hash in one arena.
+    # Hashes are bot_snapshots.content_hash of a bot's battle-start stats
+    # (the BotSnapshot key), so rows stay valid until the bot's stats,
+    # weapon or upgrades change.
+    # battles is 0 when the rates were computed exactly (battle_exact).
+    id = db.Column(db.Integer, primary_key=True)
+    arena = db.Column(db.String(20), nullable=False)
+    bot_hash = db.Column(db.String(32), nullable=False)
+    opponent_hash = db.Column(db.String(32), nullable=False, index=True)
+
+    win_rate = db.Column(db.Float, nullable=False)
+    draw_rate = db.Column(db.Float, nullable=False)
+    battles = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("bot_hash", "arena", "opponent_hash", name="uq_matchup_pair"),
+    )
+
+
+class BattleJob(db.Model):
+    __tablename__ = "battle_job"
+
+    # One battle POST waiting for (or played by) a battle worker, see
+    # battle_jobs.py. Ids are plain integers, not foreign keys: a job is
+    # short-lived, and deleting a bot, user or battle never has to touch it.
+    id = db.Column(db.Integer, primary_key=True)
+    battle_token = db.Column(db.String(32), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    bot1_id = db.Column(db.Integer, nullable=False)
+    bot2_id = db.Column(db.Integer, nullable=False)
+
+    # queued -> running -> done / failed
+    status = db.Column(db.String(10), nullable=False, default="queued")
+    history_id = db.Column(db.Integer, nullable=True)
+    # JSON of the settlement (XP, ELO) shown to the player once it is done
+    summary = db.Column(db.Text, nullable=True)
+    error = db.Column(db.String(200), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Workers claim the oldest queued job
+    __table_args__ = (
+        db.Index("ix_battle_job_status_id", "status", "id"),
+    )
@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from sortedcontainers import SortedList
+
+from battle import full_battle
+from bot_snapshots import snapshot_battle_bot
+
+# -----------------------------
+# Ranked Queue Service
+# -----------------------------
+# A player queues one bot and waits. Every TICK_INTERVAL seconds an asyncio
+# loop pairs the waiting players in one batch. It goes oldest first, and
+# each player is paired with the nearest-rated player still waiting, if
+# that player is within the older one's tolerance. The tolerance starts at
+# BASE_TOLERANCE and grows by WIDEN_PER_SECOND for every second waited, up
+# to MAX_TOLERANCE. Waiting players are kept in a SortedList by rating, so
+# finding the nearest one is O(log N).
+#
+# Each bot's stats are frozen as a BotSnapshot when it joins. A matched pair
+# is simulated in a process pool (full_battle needs no database). The
+# result then goes to a `settle` callback on a thread, which writes History
+# and applies the settlement (app.settle_queued_battle) and returns the
+# history id. The players' status pages poll until it is there.
+#
+# The queue lives in the process that serves the requests. Players who
+# queue on different web workers never see each other, so ranked queueing
+# needs the app to run as a single process.
+
+TICK_INTERVAL = 0.5
+BASE_TOLERANCE = 50
+WIDEN_PER_SECOND = 10
+MAX_TOLERANCE = 400
+QUEUE_WORKERS = 2
+
+
+class QueueEntry:
+    __slots__ = ("user_id", "bot_id", "bot_name", "rating", "snapshot_id", "values", "joined_at", "seq")
+
+    def __init__(self, user_id, bot_id, bot_name, rating, snapshot_id, values, joined_at, seq):
+        self.user_id = user_id
+        self.bot_id = bot_id
+        self.bot_name = bot_name
+        self.rating = rating
+        self.snapshot_id = snapshot_id
+        self.values = values  # {SNAPSHOT_FIELDS: value}
+        self.joined_at = joined_at
+        self.seq = seq
+
+    @property
+    def key(self):
+        return (self.rating, self.seq)
+
+
+def simulate_pair(values_a, name_a, values_b, name_b):
+    """Run one queued battle from two snapshots' values (runs in a pool worker)."""
+    botA = snapshot_battle_bot(SimpleNamespace(**values_a), name_a)
+    botB = snapshot_battle_bot(SimpleNamespace(**values_b), name_b)
+    return full_battle(botA, botB)
+
+
+class RankedQueue:
+    def __init__(self, settle=None, simulate=simulate_pair, workers=QUEUE_WORKERS,
+                 tick=TICK_INTERVAL, clock=time.monotonic):
+        self.settle = settle
+        self.simulate = simulate
+        self.workers = workers
+        self.tick = tick
+        self.clock = clock
+        self._waiting = {}  # user_id -> QueueEntry, oldest first
+        self._by_rating = SortedList(key=lambda entry: entry.key)
+        self._outcomes = {}  # user_id -> ("matched", history_id) / ("failed", None)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._waiting)
+
+    def join(self, user_id, bot_id, bot_name, rating, snapshot_id, values):
+        """Queue a bot, replacing the player's earlier entry if they had one."""
+        entry = QueueEntry(user_id, bot_id, bot_name, rating or 0, snapshot_id, values, self.clock(), next(self._seq))
+        with self._lock:
+            self._remove(user_id)
+            self._outcomes.pop(user_id, None)
+            self._waiting[user_id] = entry
+            self._by_rating.add(entry)
+        return entry
+
+    def leave(self, user_id):
+        """Drop the player's entry (and any finished outcome). True if they were waiting."""
+        with self._lock:
+            self._outcomes.pop(user_id, None)
+            return self._remove(user_id) is not None
+
+    def _remove(self, user_id):
+        entry = self._waiting.pop(user_id, None)
+        if entry is not None:
+            self._by_rating.remove(entry)
+        return entry
+
+    def status(self, user_id):
+        """("waiting", entry), ("matched", history_id), ("failed", None) or (None, None)."""
+        with self._lock:
+            if user_id in self._waiting:
+                return "waiting", self._waiting[user_id]
+            return self._outcomes.get(user_id, (None, None))
+
+    def tolerance(self, entry, now):
+        return min(MAX_TOLERANCE, BASE_TOLERANCE + WIDEN_PER_SECOND * (now - entry.joined_at))
+
+    def pair_batch(self, now=None):
+        """Take every pair that can be made right now out of the queue."""
+        now = self.clock() if now is None else now
+        pairs = []
+        with self._lock:
+            for entry in list(self._waiting.values()):
+                if entry.user_id not in self._waiting:
+                    continue  # paired earlier in this batch
+                position = self._by_rating.index(entry)
+                best = None
+                for neighbour in (position - 1, position + 1):
+                    if 0 <= neighbour < len(self._by_rating):
+                        other = self._by_rating[neighbour]
+                        if best is None or abs(other.rating - entry.rating) < abs(best.rating - entry.rating):
+                            best = other
+                if best is not None and abs(best.rating - entry.rating) <= self.tolerance(entry, now):
+                    self._remove(entry.user_id)
+                    self._remove(best.user_id)
+                    pairs.append((entry, best))
+        return pairs
+
+    def _finish(self, pair, outcome):
+        with self._lock:
+            for entry in pair:
+                self._outcomes[entry.user_id] = outcome
+
+    async def _play(self, loop, pool, pair):
+        first, second = pair
+        try:
+            result = await loop.run_in_executor(
+                pool, self.simulate, first.values, first.bot_name, second.values, second.bot_name
+            )
+            history_id = await loop.run_in_executor(None, self.settle, first, second, result)
+        except Exception:
+            self._finish(pair, ("failed", None))
+            raise
+        self._finish(pair, ("matched", history_id) if history_id else ("failed", None))
+
+    async def serve(self):
+        """Pair every tick and play the pairs, until cancelled."""
+        loop = asyncio.get_running_loop()
+        tasks = set()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                for pair in self.pair_batch():
+                    task = loop.create_task(self._play(loop, pool, pair))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await asyncio.sleep(self.tick)
+
+    def start(self):
+        """Run serve() on a daemon thread with its own event loop (once)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True, name="ranked-queue")
+                self._thread.start()
+
+
+ranked_queue = RankedQueue()
@@ -0,0 +1,193 @@
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+from sortedcontainers import SortedList
+
+from extensions import db
+from models import User
+
+# -----------------------------
+# In-Process Ranking Index
+# -----------------------------
+# Every ranked user (wins + losses > 0) as a (-rating, id) key in a
+# SortedList, so the leaderboard gets ranks, the top N and a user's
+# neighbours in O(log N) instead of loading every ranked row. The index is
+# loaded from the database on first use and updated in place when
+# settle_battle applies an ELO change. Each process has its own copy, so
+# it is reloaded every RECONCILE_INTERVAL seconds to pick up changes made
+# by other workers (or outside the app). Only the first load runs in the
+# request; later ones run on a background thread while requests keep
+# reading the old copy, and the new one is swapped in under the lock.
+# Changes made during a reload are replayed onto the new copy.
+#
+# The window-function path (LEADERBOARD_RANKING = "window") asks the
+# database instead: RANK() for the user's rank and ROW_NUMBER() for the
+# rows around them, in one statement. It is always current across workers
+# but still ranks every user per call, so it is O(N) in the database.
+# It needs SQLite 3.25+ or PostgreSQL; older SQLite builds stay on the
+# index. bench_leaderboard.py compares the two (and the old full scan).
+
+RECONCILE_INTERVAL = 300
+WINDOW_FUNCTIONS_SQLITE = (3, 25, 0)
+
+
+class RankingIndex:
+    def __init__(self, reconcile_interval=RECONCILE_INTERVAL):
+        self.reconcile_interval = reconcile_interval
+        self._keys = SortedList()
+        self._ratings = {}
+        self._loaded_at = None
+        self._pending = None  # changes made while a background reload runs
+        self._lock = threading.RLock()
+
+    def reload(self):
+        """Rebuild from the database. Needs an app context."""
+        # Ordered so it is read from the rating index
+        rows = db.session.execute(
+            db.select(User.id, User.rating).where(User.wins + User.losses > 0).order_by(User.rating.desc())
+        ).all()
+        ratings = {user_id: rating or 0 for user_id, rating in rows}
+        keys = SortedList((-rating, user_id) for user_id, rating in ratings.items())
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._ratings, self._keys = ratings, keys
+            for change, args in pending or ():
+                change(*args)
+            self._loaded_at = time.monotonic()
+
+    def _reload_in_background(self, app):
+        try:
+            with app.app_context():
+                self.reload()
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _ensure_fresh(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            self.reload()
+        elif time.monotonic() - loaded_at > self.reconcile_interval:
+            with self._lock:
+                if self._pending is not None:
+                    return  # already reloading
+                self._pending = []
+            threading.Thread(
+                target=self._reload_in_background,
+                args=(current_app._get_current_object(),),
+                daemon=True,
+                name="ranking-reload",
+            ).start()
+
+    def set(self, user_id, rating):
+        """Add a ranked user or move them to a new rating."""
+        rating = rating or 0
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self.set, (user_id, rating)))
+            old = self._ratings.get(user_id)
+            if old == rating:
+                return
+            if old is not None:
+                self._keys.remove((-old, user_id))
+            self._ratings[user_id] = rating
+            self._keys.add((-rating, user_id))
+
+    def discard(self, user_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self.discard, (user_id,)))
+            old = self._ratings.pop(user_id, None)
+            if old is not None:
+                self._keys.remove((-old, user_id))
+
+    def __len__(self):
+        self._ensure_fresh()
+        return len(self._keys)
+
+    def rank(self, rating):
+        """1 + the number of ranked users rated strictly higher (ties share a rank)."""
+        self._ensure_fresh()
+        with self._lock:
+            return self._keys.bisect_left((-(rating or 0),)) + 1
+
+    def top(self, n):
+        """Ids of the n highest-rated users, best first (ties by id)."""
+        self._ensure_fresh()
+        with self._lock:
+            return [user_id for _, user_id in self._keys.islice(0, n)]
+
+    def around(self, user_id, radius):
+        """
+        (position, ids) of the ranked users from `radius` places above
+        `user_id` to `radius` below, position being the 0-based index of
+        the first one. (None, []) if the user is not ranked.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            rating = self._ratings.get(user_id)
+            if rating is None:
+                return None, []
+            index = self._keys.index((-rating, user_id))
+            start = max(0, index - radius)
+            return start, [key[1] for key in self._keys.islice(start, index + radius + 1)]
+
+
+ranking = RankingIndex()
+
+
+def users_in_order(user_ids):
+    """User rows for `user_ids`, in that order, in one query."""
+    if not user_ids:
+        return []
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+def ranked_filter():
+    return User.wins + User.losses > 0
+
+
+def index_rank(user_id, rating, radius):
+    """(rank, first position, users) for a ranked user and the `radius` users either side, from the index."""
+    start, user_ids = ranking.around(user_id, radius)
+    if start is None:
+        return None, None, []
+    return ranking.rank(rating), start + 1, users_in_order(user_ids)
+
+
+def supports_window_functions(engine):
+    return engine.dialect.name != "sqlite" or sqlite3.sqlite_version_info >= WINDOW_FUNCTIONS_SQLITE
+
+
+def top_ranked_users(n):
+    return User.query.filter(ranked_filter()).order_by(User.rating.desc(), User.id).limit(n).all()
+
+
+def window_rank(user_id, radius):
+    """
+    Same as index_rank, in one statement: RANK() gives the user's rank
+    (ties share it), ROW_NUMBER() the 1-based positions around them.
+    """
+    ranked = (
+        db.select(
+            User.id,
+            db.func.rank().over(order_by=User.rating.desc()).label("rank"),
+            db.func.row_number().over(order_by=(User.rating.desc(), User.id)).label("position"),
+        )
+        .where(ranked_filter())
+        .cte("ranked")
+    )
+    me = db.select(ranked.c.rank, ranked.c.position).where(ranked.c.id == user_id).cte("me")
+
+    rows = db.session.execute(
+        db.select(User, ranked.c.position, me.c.rank)
+        .join(ranked, ranked.c.id == User.id)
+        .join(me, ranked.c.position.between(me.c.position - radius, me.c.position + radius))
+        .order_by(ranked.c.position)
+    ).all()
+    if not rows:
+        return None, None, []
+    return rows[0][2], rows[0][1], [row[0] for row in rows]
@@ -0,0 +1,195 @@
+from extensions import db
+from models import User
+from matchmaking import matchmaking
+from ranking import ranking
+
+# -----------------------------
+# Battle Settlement
+# -----------------------------
+# Everything that changes after a battle: bot wins/losses, one-time upgrade
+# consumption, bot XP, user XP/tokens, ELO and the History row. It is all
+# worked out on the already-loaded ORM objects and written in one commit, so
+# each touched row gets a single UPDATE and a battle is either fully settled
+# or not at all. Rating changes are then applied to the in-process ranking
+# and matchmaking indexes (ranking.py, matchmaking.py).
+
+BOT_XP_REWARDS = {"win": 20, "lose": 5, "draw": 10}
+USER_XP_WIN = 30
+USER_XP_LOSS = 10
+WIN_TOKENS = 5
+LEVEL_UP_TOKENS = 20
+
+UPGRADE_FIELDS = (
+    "upgrade_armor_plating",
+    "upgrade_overclock_unit",
+    "upgrade_regen_core",
+    "upgrade_critical_subroutine",
+    "upgrade_energy_recycler",
+    "upgrade_emp_shield",
+)
+
+
+def calculate_elo_change(winner_rating, loser_rating, k_factor=32):
+    """
+    Calculate ELO rating changes for winner and loser.
+
+    Args:
+        winner_rating: Current rating of the winner
+        loser_rating: Current rating of the loser
+        k_factor: How much ratings change per game (default 32)
+
+    Returns:
+        (winner_change, loser_change) - both as integers
+    """
+    # Calculate expected win probability for the winner
+    expected_win = 1 / (1 + 10 ** ((loser_rating - winner_rating) / 400))
+
+    # Calculate rating changes
+    winner_change = int(k_factor * (1 - expected_win))
+    loser_change = int(k_factor * (0 - (1 - expected_win)))
+
+    return winner_change, loser_change
+
+
+def bot_xp_to_next_level(level):
+    return 50 + (level - 1) * 25
+
+
+def xp_to_next_level(level):
+    return 100 + (level - 1) * 50  # progressive leveling
+
+
+def add_bot_xp(bot, amount):
+    """Add XP to a bot, levelling it up (+5 stat points per level). Returns levels gained."""
+    xp = int(bot.xp or 0) + int(amount)
+    level = int(bot.level or 1)
+    levels_gained = 0
+
+    while xp >= bot_xp_to_next_level(level):
+        xp -= bot_xp_to_next_level(level)
+        level += 1
+        levels_gained += 1
+
+    bot.xp = xp
+    if levels_gained:
+        bot.level = level
+        bot.stat_points = int(bot.stat_points or 0) + 5 * levels_gained
+    return levels_gained
+
+
+def add_xp(user, amount):
+    """
+    Adds XP to a user and handles leveling.
+    Returns number of levels gained. Does not commit.
+    """
+    xp = user.xp + amount
+    level = user.level
+    levels_gained = 0
+
+    while xp >= xp_to_next_level(level):
+        xp -= xp_to_next_level(level)
+        level += 1
+        levels_gained += 1
+
+    user.xp = xp
+    if levels_gained:
+        user.level = level
+        # Rewards per level
+        user.tokens = int(user.tokens or 0) + LEVEL_UP_TOKENS * levels_gained
+    return levels_gained
+
+
+def settle_battle(user, bot1, bot2, winner_side, history, reward_both=False):
+    """
+    Apply the outcome of one battle for `user` (the player who started it)
+    and commit it together with `history` in a single transaction.
+    winner_side is the full_battle result's: 0 = bot1, 1 = bot2, None = draw
+    (bots may share a name, so the winner's name can't tell them apart). With
+    reward_both (queued ranked battles) both owners get bot/user XP and
+    tokens, not only `user`.
+
+    Returns a summary dict: user_result ("win"/"lose", None on a draw),
+    xp_gained, levels_gained and, for ranked
+    battles with a winner, elo = (winner_user, loser_user, old_winner_rating,
+    old_loser_rating, rating_gain, rating_loss).
+    """
+    # Owners come from the identity map (the current user is already loaded),
+    # so nothing lazy-loads bot.user mid-settlement.
+    owners = {user.id: user}
+    for bot in (bot1, bot2):
+        if bot.user_id not in owners:
+            owners[bot.user_id] = db.session.get(User, bot.user_id)
+
+    # consume one-time upgrades
+    for bot in (bot1, bot2):
+        if any(getattr(bot, field) for field in UPGRADE_FIELDS):
+            for field in UPGRADE_FIELDS:
+                setattr(bot, field, False)
+
+    if winner_side is None:
+        bot1_result = bot2_result = "draw"
+        winning_bot = losing_bot = None
+    elif winner_side == 0:
+        bot1_result, bot2_result = "win", "lose"
+        winning_bot, losing_bot = bot1, bot2
+    else:
+        bot1_result, bot2_result = "lose", "win"
+        winning_bot, losing_bot = bot2, bot1
+
+    # bot wins/losses (skip if draw)
+    if winning_bot:
+        winning_bot.botwins += 1
+        losing_bot.botlosses += 1
+
+    # bot XP goes to each rewarded player's own bot only
+    rewarded = list(owners.values()) if reward_both else [user]
+    for player in rewarded:
+        if bot1.user_id == player.id:
+            add_bot_xp(bot1, BOT_XP_REWARDS[bot1_result])
+        elif bot2.user_id == player.id:
+            add_bot_xp(bot2, BOT_XP_REWARDS[bot2_result])
+
+    # user XP / tokens
+    user_result = None
+    xp_gained = 0
+    levels_gained = 0
+    for player in rewarded:
+        result = None
+        gained = 0
+        levels = 0
+        if winning_bot and winning_bot.user_id == player.id:
+            result = "win"
+            gained = USER_XP_WIN
+            levels = add_xp(player, gained)
+            player.tokens = int(player.tokens or 0) + WIN_TOKENS
+        elif losing_bot and losing_bot.user_id == player.id:
+            result = "lose"
+            gained = USER_XP_LOSS
+            levels = add_xp(player, gained)
+        if player is user:
+            user_result, xp_gained, levels_gained = result, gained, levels
+
+    # elo rating changes (ranked = different owners)
+    elo = None
+    if winning_bot and bot1.user_id != bot2.user_id:
+        winner_user = owners[winning_bot.user_id]
+        loser_user = owners[losing_bot.user_id]
+
+        rating_gain, rating_loss = calculate_elo_change(winner_user.rating, loser_user.rating)
+        elo = (winner_user, loser_user, winner_user.rating, loser_user.rating, rating_gain, rating_loss)
+
+        winner_user.rating += rating_gain
+        winner_user.wins += 1
+        loser_user.rating += rating_loss
+        loser_user.losses += 1
+
+    db.session.add(history)
+    db.session.commit()
+
+    if elo:
+        ranking.set(winner_user.id, winner_user.rating)
+        ranking.set(loser_user.id, loser_user.rating)
+        matchmaking.set_rating(winner_user.id, winner_user.rating)
+        matchmaking.set_rating(loser_user.id, loser_user.rating)
+
+    return {"user_result": user_result, "xp_gained": xp_gained, "levels_gained": levels_gained, "elo": elo}
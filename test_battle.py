@@ -1,4 +1,4 @@
-from battle import BattleBot, full_battle, CHARACTER_ITEMS
+from battle import BattleBot, full_battle, render_event, CHARACTER_ITEMS, EVENT_TEXT
 
 # Create two bots with base stats
 bot1 = BattleBot(
@@ -39,5 +39,5 @@ print("Winner:", result["winner"])
 print("Alpha Points:", result["botA_points"])
 print("Beta Points:", result["botB_points"])
 print("\n--- Battle Log ---")
-for entry_type, text in result["log"]:
-    print(f"[{entry_type.upper()}] {text}")
\ No newline at end of file
+for event in result["log"]:
+    print(f"[{EVENT_TEXT[event[0]][0].upper()}] {render_event(event, (bot1.name, bot2.name))}")
\ No newline at end of file
@@ -0,0 +1,100 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+# Use a throwaway database; must be set before app is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "battle_jobs.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+
+from app import app
+from battle_jobs import (
+    DONE, FAILED, QUEUED, RUNNING, STALE_AFTER, JOB_RETENTION,
+    enqueue_job, claim_job, finish_job, reclaim_job, requeue_stale, prune_jobs, run_claimed,
+)
+from extensions import db
+from models import BattleJob
+
+
+def fresh_tables():
+    db.drop_all()
+    db.create_all()
+
+
+def enqueue(token, **kwargs):
+    job, created = enqueue_job(1, 10, 20, token, **kwargs)
+    assert created
+    return job.id
+
+
+def age(job_id, seconds):
+    """Pretend the job was claimed `seconds` ago."""
+    job = db.session.get(BattleJob, job_id)
+    job.started_at = datetime.utcnow() - timedelta(seconds=seconds)
+    db.session.commit()
+
+
+def test_jobs_are_claimed_once_in_order():
+    with app.app_context():
+        fresh_tables()
+        first, second = enqueue("token-1"), enqueue("token-2")
+
+        # A resubmitted token maps back to its job
+        job, created = enqueue_job(1, 10, 20, "token-1")
+        assert (job.id, created) == (first, False)
+
+        assert claim_job().id == first
+        assert claim_job().id == second
+        assert claim_job() is None
+        assert db.session.get(BattleJob, first).status == RUNNING
+
+
+def test_stale_job_is_reclaimed():
+    with app.app_context():
+        fresh_tables()
+        job_id = enqueue("token-1", claim=True)
+        job = db.session.get(BattleJob, job_id)
+
+        # Still fresh: its worker may be playing it
+        assert not reclaim_job(job)
+        assert requeue_stale() == 0
+
+        # Its worker died: one caller gets it back, a second one does not
+        age(job_id, STALE_AFTER + 60)
+        assert reclaim_job(job)
+        assert not reclaim_job(job)
+        job = db.session.get(BattleJob, job_id)
+        assert job.status == RUNNING and datetime.utcnow() - job.started_at < timedelta(seconds=STALE_AFTER)
+
+        # Workers requeue it instead, and then claim it like any other job
+        age(job_id, STALE_AFTER + 60)
+        assert requeue_stale() == 1
+        assert db.session.get(BattleJob, job_id).status == QUEUED
+        assert claim_job().id == job_id
+
+
+def test_failed_run_and_pruning():
+    with app.app_context():
+        fresh_tables()
+        done_id, failed_id = enqueue("token-1", claim=True), enqueue("token-2", claim=True)
+        finish_job(db.session.get(BattleJob, done_id), history_id=5)
+
+        def crash(job):
+            raise RuntimeError("engine crashed")
+
+        run_claimed(db.session.get(BattleJob, failed_id), crash)
+        assert db.session.get(BattleJob, failed_id).status == FAILED
+        assert db.session.get(BattleJob, done_id).status == DONE
+
+        assert prune_jobs() == 0
+        for job in BattleJob.query.all():
+            job.finished_at = datetime.utcnow() - timedelta(seconds=JOB_RETENTION + 60)
+        db.session.commit()
+        assert prune_jobs() == 2
+        assert BattleJob.query.count() == 0
+
+
+if __name__ == "__main__":
+    test_jobs_are_claimed_once_in_order()
+    test_stale_job_is_reclaimed()
+    test_failed_run_and_pruning()
+    print("battle jobs are claimed once and stale ones come back")
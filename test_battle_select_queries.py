@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+# Use a throwaway database; must be set before app is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "battle_select_queries.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import app
+from extensions import db
+from models import User, Bot, Weapon, WeaponOwnership
+from seed_weapons import seed_weapons
+
+# SQL statements one GET /battle may run, whatever the roster size
+MAX_STATEMENTS = 10
+
+
+def build_roster(opponents, bots_per_opponent):
+    """The player plus `opponents` users in rating range, each with armed bots."""
+    db.create_all()
+    seed_weapons()
+    weapons = Weapon.query.all()
+
+    player = User(username="player", email="player@example.com", password=generate_password_hash("pw"), rating=600)
+    db.session.add(player)
+    db.session.flush()
+    db.session.add(Bot(name="Mine", algorithm="VEX-01", user_id=player.id))
+
+    for i in range(opponents):
+        user = User(username=f"rival{i}", email=f"rival{i}@example.com", password=generate_password_hash("pw"), rating=550 + i)
+        db.session.add(user)
+        db.session.flush()
+        for j in range(bots_per_opponent):
+            weapon = weapons[(i + j) % len(weapons)]
+            bot = Bot(name=f"Rival{i}-{j}", algorithm="ADAPT-X", user_id=user.id, weapon_id=weapon.id)
+            db.session.add(bot)
+            db.session.flush()
+            db.session.add(WeaponOwnership(user_id=user.id, weapon_id=weapon.id, bot_id=bot.id, equipped=True))
+    db.session.commit()
+
+
+def count_battle_page_statements(client):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/battle")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    return statements
+
+
+def test_battle_select_statement_count():
+    app.config["TESTING"] = True
+    with app.app_context():
+        build_roster(opponents=10, bots_per_opponent=5)
+
+    client = app.test_client()
+    response = client.post("/login", data={"username": "player", "password": "pw"})
+    assert response.status_code == 302
+
+    statements = count_battle_page_statements(client)
+    assert len(statements) <= MAX_STATEMENTS, (
+        f"GET /battle ran {len(statements)} SQL statements (limit {MAX_STATEMENTS}):\n" + "\n".join(statements)
+    )
+
+
+if __name__ == "__main__":
+    test_battle_select_statement_count()
+    print("GET /battle stays within", MAX_STATEMENTS, "SQL statements")
@@ -0,0 +1,97 @@
+import math
+
+from battle import BattleBot, full_battle
+from battle_sim import simulate_battles
+
+# Battles per engine; the scalar engine is the slow one
+SCALAR_BATTLES = 1500
+SIM_BATTLES = 20000
+
+# Allowed gap between the two engines' rates, in standard errors
+TOLERANCE_SIGMA = 4.5
+
+
+def bot(name, **stats):
+    values = dict(hp=200, energy=150, proc=40, defense=30, speed=10, clk=25, luck=15, logic=15,
+                  weapon_atk=12, weapon_type="melee")
+    values.update(stats)
+    return BattleBot(name=name, **values)
+
+
+# name -> function building a fresh (botA, botB) pair
+MATCHUPS = {
+    "mirror melee": lambda: (bot("A", algorithm="VEX-01"), bot("B", algorithm="BASL-09")),
+    "chaos vs ranged": lambda: (
+        bot("A", algorithm="CHAOS-RND"),
+        bot("B", algorithm="EQUA-12", weapon_type="ranged"),
+    ),
+    "adapt ranged": lambda: (
+        bot("A", algorithm="ADAPT-X", weapon_type="ranged"),
+        bot("B", algorithm="ADAPT-X", weapon_type="ranged", clk=30),
+    ),
+    "abilities": lambda: (
+        bot("A", special_effect="Core Meltdown"),
+        bot("B", special_effect="Time Dilation", proc=30, clk=20),
+    ),
+    "chaos abilities": lambda: (
+        bot("A", algorithm="CHAOS-RND", special_effect="Evolve Protocol"),
+        bot("B", special_effect="System Balance", clk=30),
+    ),
+    # Both bots run out of energy within a few rounds, on either turn order
+    "energy out": lambda: (bot("A", energy=45), bot("B", energy=50, clk=30, weapon_type="ranged")),
+    "chaos energy out": lambda: (bot("A", energy=45, algorithm="CHAOS-RND"), bot("B", energy=45)),
+    # Overclock drains botA's energy before it attacks: both engines must
+    # skip the turns of that round and call the battle a draw
+    "overclock drain": lambda: (
+        BattleBot(name="A", hp=200, energy=50, proc=10, defense=30, speed=10, clk=30, luck=10, items=[{"id": 102}]),
+        BattleBot(name="B", hp=200, energy=200, proc=10, defense=10, speed=10, clk=10, luck=10),
+    ),
+}
+
+
+def scalar_rates(make_bots, arena="neutral"):
+    counts = {"A": 0, "B": 0, "draw": 0}
+    for seed in range(SCALAR_BATTLES):
+        botA, botB = make_bots()
+        winner = full_battle(botA, botB, seed=seed, arena=arena, headless=True)["winner"]
+        counts[winner or "draw"] += 1
+    return {
+        "win_rate": counts["A"] / SCALAR_BATTLES,
+        "loss_rate": counts["B"] / SCALAR_BATTLES,
+        "draw_rate": counts["draw"] / SCALAR_BATTLES,
+    }
+
+
+def assert_engines_agree(name, make_bots, arena="neutral"):
+    expected = scalar_rates(make_bots, arena)
+    botA, botB = make_bots()
+    simulated = simulate_battles(botA, botB, n=SIM_BATTLES, seed=1, arena=arena)
+    for rate, p in expected.items():
+        stderr = math.sqrt(max(p * (1 - p), 1 / SCALAR_BATTLES) / SCALAR_BATTLES)
+        gap = abs(simulated[rate] - p)
+        assert gap <= TOLERANCE_SIGMA * stderr, (
+            f"{name} ({arena}): {rate} is {p:.3f} in full_battle but {simulated[rate]:.3f} in simulate_battles"
+        )
+
+
+def test_simulate_battles_matches_full_battle():
+    for name, make_bots in MATCHUPS.items():
+        assert_engines_agree(name, make_bots)
+
+
+def test_simulate_battles_matches_full_battle_in_arenas():
+    for arena in ("ironclash", "skyline", "frozen"):
+        assert_engines_agree("mirror melee", MATCHUPS["mirror melee"], arena)
+
+
+def test_overclock_drain_is_a_draw():
+    botA, botB = MATCHUPS["overclock drain"]()
+    result = simulate_battles(botA, botB, n=2000, seed=1)
+    assert result["draws"] == 2000, result
+
+
+if __name__ == "__main__":
+    test_simulate_battles_matches_full_battle()
+    test_simulate_battles_matches_full_battle_in_arenas()
+    test_overclock_drain_is_a_draw()
+    print("simulate_battles agrees with full_battle on", len(MATCHUPS), "matchups")
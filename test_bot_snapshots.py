@@ -0,0 +1,102 @@
+import importlib.util
+import os
+import tempfile
+
+# Use a throwaway database; must be set before app is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bot_snapshots.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from app import app
+from bot_snapshots import SNAPSHOT_FIELDS, content_hash, snapshot_values, store_snapshot, snapshot_battle_bot
+from extensions import db
+from models import BotSnapshot
+
+MIGRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations", "versions",
+                              "5f8b3d1e7a29_add_bot_snapshot.py")
+
+STATS = dict(hp=150, energy=100, proc=42, defense=12, clk=10, luck=10, logic=None, weapon_atk=12,
+             weapon_name="Laser", weapon_type="ranged", algorithm="VEX-01", upgrade_regen_core=1)
+
+
+def load_migration():
+    spec = importlib.util.spec_from_file_location("snapshot_migration", MIGRATION_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_same_stats_share_one_row():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        first = store_snapshot(STATS)
+        db.session.commit()
+        # Same values in another form (0 for None, True for 1, missing flags)
+        again = store_snapshot(dict(STATS, logic=0, upgrade_regen_core=True, upgrade_emp_shield=None))
+        changed = store_snapshot(dict(STATS, upgrade_emp_shield=True))
+        db.session.commit()
+
+        assert again.id == first.id
+        assert changed.id != first.id
+        assert BotSnapshot.query.count() == 2
+        assert first.content_hash == content_hash(STATS)
+
+        bot = snapshot_battle_bot(first, "Copy")
+        assert (bot.proc, bot.logic, bot.weapon_type) == (42, 0, "ranged")
+
+
+def test_migration_backfill_dedups_and_round_trips():
+    migration = load_migration()
+    assert migration.SNAPSHOT_COLUMNS == SNAPSHOT_FIELDS
+
+    # History rows in the pre-migration layout: both sides' stats inline
+    side_columns = [
+        sa.Column(f"{side}_{column.name}", column.type) for side in migration.SIDES for column in migration._columns()
+    ]
+    engine = sa.create_engine("sqlite://")
+    metadata = sa.MetaData()
+    history = sa.Table("history", metadata, sa.Column("id", sa.Integer, primary_key=True), *side_columns)
+    metadata.create_all(engine)
+
+    other = dict(STATS, algorithm="ADAPT-X", weapon_type="melee", upgrade_regen_core=0)
+    sides = [(STATS, other), (other, STATS), (STATS, STATS), (dict(STATS, hp=151), other)]
+    rows = []
+    for history_id, pair in enumerate(sides, start=1):
+        row = {"id": history_id}
+        for side, values in zip(migration.SIDES, pair):
+            row.update({f"{side}_{name}": values.get(name) for name in SNAPSHOT_FIELDS})
+        rows.append(row)
+
+    with engine.begin() as conn:
+        conn.execute(history.insert(), rows)
+        with Operations.context(MigrationContext.configure(conn)):
+            migration.BATCH_SIZE = 3  # more than one batch
+            migration.upgrade()
+
+        columns = {column["name"] for column in sa.inspect(conn).get_columns("history")}
+        assert columns == {"id", "bot1_snapshot_id", "bot2_snapshot_id"}
+        snapshots = {row.id: row for row in conn.execute(sa.text("SELECT * FROM bot_snapshot"))}
+        assert len(snapshots) == 3
+        pairs = conn.execute(sa.text("SELECT bot1_snapshot_id, bot2_snapshot_id FROM history ORDER BY id")).all()
+        for (id1, id2), (values1, values2) in zip(pairs, sides):
+            # The backfill hashes exactly like store_snapshot
+            assert snapshots[id1].content_hash == content_hash(values1)
+            assert snapshots[id2].content_hash == content_hash(values2)
+
+        with Operations.context(MigrationContext.configure(conn)):
+            migration.downgrade()
+        restored = conn.execute(sa.text("SELECT * FROM history ORDER BY id")).mappings().all()
+        for row, pair in zip(restored, sides):
+            for side, values in zip(migration.SIDES, pair):
+                assert snapshot_values({name: row[f"{side}_{name}"] for name in SNAPSHOT_FIELDS}) == snapshot_values(values)
+
+
+if __name__ == "__main__":
+    test_same_stats_share_one_row()
+    test_migration_backfill_dedups_and_round_trips()
+    print("battles with the same stats share one bot_snapshot row")
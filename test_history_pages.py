@@ -0,0 +1,105 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+# Use a throwaway database; must be set before app is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "history_pages.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+
+from werkzeug.security import generate_password_hash
+
+from app import app, history_page, history_cursor, parse_history_cursor
+from extensions import db
+from models import User, Bot, History
+
+PAGE_SIZE = 4
+TIMESTAMP = datetime(2025, 1, 1, 12, 0, 0)
+
+
+def build_history():
+    """
+    Fresh tables where the player fought on both sides, and most battles
+    share one timestamp. Returns (player id, expected (timestamp, id) order).
+    """
+    db.drop_all()
+    db.create_all()
+    users = []
+    for name in ("player", "rival"):
+        user = User(username=name, email=f"{name}@example.com", password=generate_password_hash("pw"))
+        db.session.add(user)
+        db.session.flush()
+        bot = Bot(name=name.title(), algorithm="VEX-01", user_id=user.id)
+        db.session.add(bot)
+        db.session.flush()
+        users.append((user, bot))
+    (player, mine), (rival, theirs) = users
+
+    # (attacker, defender, timestamp): six at the same instant, from either
+    # side, plus one mirror match and a battle the player was not in
+    battles = [(mine, theirs, TIMESTAMP) if i % 2 else (theirs, mine, TIMESTAMP) for i in range(6)]
+    battles += [
+        (mine, theirs, TIMESTAMP + timedelta(minutes=5)),
+        (mine, mine, TIMESTAMP - timedelta(minutes=5)),
+        (theirs, theirs, TIMESTAMP),
+    ]
+    for bot1, bot2, timestamp in battles:
+        db.session.add(History(bot1_id=bot1.id, bot2_id=bot2.id, user1_id=bot1.user_id, user2_id=bot2.user_id,
+                               bot1_name=bot1.name, bot2_name=bot2.name, winner=bot1.name, seed=1,
+                               timestamp=timestamp))
+    db.session.commit()
+
+    mine_rows = History.query.filter((History.user1_id == player.id) | (History.user2_id == player.id))
+    expected = sorted(((row.timestamp, row.id) for row in mine_rows), reverse=True)
+    return player.id, expected
+
+
+def test_keyset_walk_with_equal_timestamps():
+    with app.app_context():
+        player_id, expected = build_history()
+        assert len(expected) == 8
+
+        seen, before, pages = [], None, 0
+        while True:
+            rows, cursor = history_page(player_id, PAGE_SIZE, before)
+            pages += 1
+            seen += [(row.timestamp, row.id) for row in rows]
+            if cursor is None:
+                break
+            # The cursor survives the trip through the query string
+            assert cursor == history_cursor(rows[-1])
+            before = parse_history_cursor(cursor)
+
+        # Every battle once, newest first, ties broken by id
+        assert pages == 2
+        assert seen == expected
+
+
+def test_history_route_follows_the_cursor():
+    app.config["TESTING"] = True
+    with app.app_context():
+        player_id, expected = build_history()
+        cursor = history_page(player_id, PAGE_SIZE)[1]
+
+    client = app.test_client()
+    response = client.post("/login", data={"username": "player", "password": "pw"})
+    assert response.status_code == 302
+
+    page_size = app.config["HISTORY_PAGE_SIZE"]
+    app.config["HISTORY_PAGE_SIZE"] = PAGE_SIZE
+    try:
+        assert client.get("/history").status_code == 200
+        response = client.get("/history", query_string={"before": cursor})
+        assert response.status_code == 200
+        # A malformed cursor falls back to the first page
+        assert client.get("/history", query_string={"before": "not-a-cursor"}).status_code == 200
+    finally:
+        app.config["HISTORY_PAGE_SIZE"] = page_size
+    body = response.get_data(as_text=True)
+    for position, (_, history_id) in enumerate(expected):
+        assert (f'/history/{history_id}"' in body) == (position >= PAGE_SIZE), history_id
+
+
+if __name__ == "__main__":
+    test_keyset_walk_with_equal_timestamps()
+    test_history_route_follows_the_cursor()
+    print("history pages walk every battle once with equal timestamps")
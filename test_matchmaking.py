@@ -0,0 +1,102 @@
+import os
+import random
+import tempfile
+
+# Use a throwaway database; must be set before app is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "matchmaking.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+
+from werkzeug.security import generate_password_hash
+
+from app import app, OPPONENT_SAMPLE, OPPONENT_BOTS_PER_USER
+from extensions import db
+from matchmaking import MatchmakingIndex, MATCH_WINDOW, matchmaking
+from models import User, Bot
+
+
+def build_players(ratings, bots_per_player=1, banned=()):
+    """Fresh tables with one player per rating; returns {user id: rating}."""
+    db.drop_all()
+    db.create_all()
+    players = {}
+    for i, rating in enumerate(ratings):
+        user = User(username=f"p{i}", email=f"p{i}@example.com", password=generate_password_hash("pw"),
+                    rating=rating, banned=i in banned)
+        db.session.add(user)
+        db.session.flush()
+        for j in range(bots_per_player):
+            db.session.add(Bot(name=f"P{i}-{j}", algorithm="VEX-01", user_id=user.id))
+        players[user.id] = rating
+    db.session.commit()
+    return players
+
+
+def test_sample_stays_in_the_window():
+    with app.app_context():
+        players = build_players([600, 650, 700, 1000, 1400, 600], banned={5})
+        index = MatchmakingIndex()
+        me = next(iter(players))
+        rng = random.Random(1)
+
+        for _ in range(20):
+            picked, window = index.sample(600, 2, exclude=me, rng=rng)
+            assert window == MATCH_WINDOW
+            assert me not in picked and len(picked) == 2
+            assert all(abs(players[user_id] - 600) <= MATCH_WINDOW for user_id in picked)
+
+        # Too few players nearby: the window doubles until it holds k
+        picked, window = index.sample(600, 3, exclude=me, rng=rng)
+        assert window == 2 * MATCH_WINDOW
+        assert sorted(players[user_id] for user_id in picked) == [650, 700, 1000]
+
+        # Banned players are never offered
+        picked, _ = index.sample(600, 10, exclude=me, rng=rng)
+        assert len(picked) == 4
+
+
+def test_updates_move_players_between_buckets():
+    with app.app_context():
+        players = build_players([600, 1500])
+        me, far = players
+        index = MatchmakingIndex()
+
+        assert index.sample(600, 1, exclude=me, window=100)[0] == [far]  # only after widening
+        index.set_rating(far, 620)
+        assert index.sample(600, 1, exclude=me, window=100) == ([far], 100)
+
+        index.remove_user(far)
+        assert index.sample(600, 1, exclude=me)[0] == []
+
+
+def test_sample_bots_caps_bots_per_player():
+    with app.app_context():
+        players = build_players([600] * 4, bots_per_player=6)
+        me = next(iter(players))
+        index = MatchmakingIndex()
+
+        bot_ids, _ = index.sample_bots(600, 3, 2, exclude=me, rng=random.Random(1))
+        owners = [db.session.get(Bot, bot_id).user_id for bot_id in bot_ids]
+        assert len(bot_ids) == len(set(bot_ids)) == 6
+        assert me not in owners and all(owners.count(owner) == 2 for owner in owners)
+
+
+def test_battle_page_offers_a_bounded_number_of_bots():
+    app.config["TESTING"] = True
+    with app.app_context():
+        build_players([600] * (OPPONENT_SAMPLE + 3), bots_per_player=5)
+        matchmaking.reload()
+
+    client = app.test_client()
+    response = client.post("/login", data={"username": "p0", "password": "pw"})
+    assert response.status_code == 302
+    page = client.get("/battle").get_data(as_text=True)
+    offered = page.count("(Rating: ")
+    assert 0 < offered <= OPPONENT_SAMPLE * OPPONENT_BOTS_PER_USER, offered
+
+
+if __name__ == "__main__":
+    test_sample_stays_in_the_window()
+    test_updates_move_players_between_buckets()
+    test_sample_bots_caps_bots_per_player()
+    test_battle_page_offers_a_bounded_number_of_bots()
+    print("matchmaking samples nearby players and a bounded number of their bots")
@@ -0,0 +1,90 @@
+import os
+import tempfile
+
+# Use a throwaway database; must be set before app is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "ranking.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+
+from werkzeug.security import generate_password_hash
+
+from app import app
+from extensions import db
+from models import User
+from ranking import RankingIndex, index_rank, ranking, supports_window_functions, window_rank
+
+# username -> (rating, wins + losses); unranked players have no battles
+PLAYERS = {
+    "ace": (900, 4),
+    "tied1": (700, 2),
+    "tied2": (700, 3),
+    "mid": (650, 1),
+    "low": (500, 5),
+    "newbie": (1000, 0),
+}
+
+
+def build_players():
+    """Fresh tables holding PLAYERS; returns {username: id}."""
+    db.drop_all()
+    db.create_all()
+    for name, (rating, battles) in PLAYERS.items():
+        db.session.add(User(username=name, email=f"{name}@example.com", password=generate_password_hash("pw"),
+                            rating=rating, wins=battles, losses=0))
+    db.session.commit()
+    return {user.username: user.id for user in User.query.all()}
+
+
+def test_index_ranks_ties_and_skips_unranked():
+    with app.app_context():
+        ids = build_players()
+        index = RankingIndex()
+
+        assert index.top(3) == [ids["ace"], ids["tied1"], ids["tied2"]]
+        assert len(index) == 5  # newbie has no battles
+        assert index.rank(700) == 2  # ties share a rank
+        assert index.rank(650) == 4
+
+        start, around = index.around(ids["mid"], 1)
+        assert (start, around) == (2, [ids["tied2"], ids["mid"], ids["low"]])
+        assert index.around(ids["newbie"], 1) == (None, [])
+
+        index.set(ids["low"], 950)
+        index.discard(ids["ace"])
+        assert index.top(2) == [ids["low"], ids["tied1"]]
+
+
+def test_changes_during_a_reload_are_replayed():
+    with app.app_context():
+        ids = build_players()
+        index = RankingIndex()
+        index.reload()
+
+        # A background reload has started (as _ensure_fresh does); a battle
+        # settles before it reads the database, so its snapshot is stale
+        index._pending = []
+        index.set(ids["mid"], 990)
+        index.reload()
+
+        assert index._pending is None
+        assert index.top(1) == [ids["mid"]]
+        assert index.rank(990) == 1
+
+
+def test_window_rank_matches_the_index():
+    with app.app_context():
+        ids = build_players()
+        if not supports_window_functions(db.engine):
+            return
+        ranking.reload()
+        for name in ("ace", "tied2", "mid", "low"):
+            rating = PLAYERS[name][0]
+            expected = index_rank(ids[name], rating, 1)
+            rank, position, users = window_rank(ids[name], 1)
+            assert (rank, position, [user.id for user in users]) == (expected[0], expected[1], [user.id for user in expected[2]]), name
+
+
+if __name__ == "__main__":
+    test_index_ranks_ties_and_skips_unranked()
+    test_changes_during_a_reload_are_replayed()
+    test_window_rank_matches_the_index()
+    print("ranking index agrees with the database on", len(PLAYERS), "players")
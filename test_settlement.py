@@ -0,0 +1,111 @@
+import os
+import tempfile
+
+# Use a throwaway database; must be set before app is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), "settlement.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_PATH
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import app
+from extensions import db
+from models import User, Bot, History
+from ranking import ranking
+from settlement import settle_battle, calculate_elo_change, BOT_XP_REWARDS, USER_XP_WIN, USER_XP_LOSS, WIN_TOKENS
+
+
+def build_players():
+    """Fresh tables with two players, one bot each; alice's bot holds an upgrade."""
+    db.drop_all()
+    db.create_all()
+    alice = User(username="alice", email="alice@example.com", password=generate_password_hash("pw"),
+                 rating=600, wins=0, losses=0, xp=0, tokens=100, level=1)
+    bob = User(username="bob", email="bob@example.com", password=generate_password_hash("pw"),
+               rating=620, wins=0, losses=0, xp=0, tokens=100, level=1)
+    db.session.add_all([alice, bob])
+    db.session.flush()
+    mine = Bot(name="Mine", algorithm="VEX-01", user_id=alice.id, upgrade_armor_plating=True)
+    theirs = Bot(name="Theirs", algorithm="ADAPT-X", user_id=bob.id)
+    db.session.add_all([mine, theirs])
+    db.session.commit()
+    ranking.reload()
+    return alice.id, bob.id, mine.id, theirs.id
+
+
+def history_for(bot1, bot2, winner, seed):
+    return History(bot1_id=bot1.id, bot2_id=bot2.id, user1_id=bot1.user_id, user2_id=bot2.user_id,
+                   bot1_name=bot1.name, bot2_name=bot2.name, winner=winner, seed=seed)
+
+
+def settle(user_id, bot1_id, bot2_id, winner_side, seed, reward_both=False):
+    """settle_battle on freshly loaded rows, like a request does."""
+    db.session.remove()
+    user = db.session.get(User, user_id)
+    bot1, bot2 = db.session.get(Bot, bot1_id), db.session.get(Bot, bot2_id)
+    winner = None if winner_side is None else (bot1, bot2)[winner_side].name
+    return settle_battle(user, bot1, bot2, winner_side, history_for(bot1, bot2, winner, seed), reward_both)
+
+
+def test_win_is_settled_in_one_commit():
+    with app.app_context():
+        alice_id, bob_id, mine_id, theirs_id = build_players()
+        gain, loss = calculate_elo_change(600, 620)
+
+        commits = []
+        record = lambda conn: commits.append(conn)
+        event.listen(db.engine, "commit", record)
+        try:
+            summary = settle(alice_id, mine_id, theirs_id, 0, seed=1)
+        finally:
+            event.remove(db.engine, "commit", record)
+        assert len(commits) == 1, commits
+        assert summary["user_result"] == "win"
+        assert summary["xp_gained"] == USER_XP_WIN
+        assert summary["elo"][4:] == (gain, loss)
+
+        # Everything is read back from a new session
+        db.session.remove()
+        alice, bob = db.session.get(User, alice_id), db.session.get(User, bob_id)
+        mine, theirs = db.session.get(Bot, mine_id), db.session.get(Bot, theirs_id)
+        assert (alice.rating, alice.wins, alice.xp, alice.tokens) == (600 + gain, 1, USER_XP_WIN, 100 + WIN_TOKENS)
+        assert (bob.rating, bob.losses, bob.xp, bob.tokens) == (620 + loss, 1, 0, 100)
+        assert (mine.botwins, mine.xp, mine.upgrade_armor_plating) == (1, BOT_XP_REWARDS["win"], False)
+        # Only the player who started the battle is rewarded
+        assert (theirs.botlosses, theirs.xp) == (1, 0)
+        history = History.query.one()
+        assert (history.winner, history.seed) == ("Mine", 1)
+
+        # The in-process ranking follows the new ratings
+        assert ranking.top(2) == [alice_id, bob_id]
+
+
+def test_reward_both_and_draw():
+    with app.app_context():
+        alice_id, bob_id, mine_id, theirs_id = build_players()
+
+        summary = settle(alice_id, mine_id, theirs_id, 1, seed=1, reward_both=True)
+        assert summary["user_result"] == "lose"
+        db.session.remove()
+        alice, bob = db.session.get(User, alice_id), db.session.get(User, bob_id)
+        assert (alice.xp, bob.xp, bob.tokens) == (USER_XP_LOSS, USER_XP_WIN, 100 + WIN_TOKENS)
+        assert db.session.get(Bot, mine_id).xp == BOT_XP_REWARDS["lose"]
+        assert db.session.get(Bot, theirs_id).xp == BOT_XP_REWARDS["win"]
+        ratings = (alice.rating, bob.rating)
+
+        summary = settle(alice_id, mine_id, theirs_id, None, seed=2, reward_both=True)
+        assert summary["user_result"] is None and summary["elo"] is None
+        db.session.remove()
+        alice, bob = db.session.get(User, alice_id), db.session.get(User, bob_id)
+        assert (alice.rating, bob.rating) == ratings
+        mine, theirs = db.session.get(Bot, mine_id), db.session.get(Bot, theirs_id)
+        assert mine.xp == BOT_XP_REWARDS["lose"] + BOT_XP_REWARDS["draw"]
+        assert theirs.xp == BOT_XP_REWARDS["win"] + BOT_XP_REWARDS["draw"]
+        assert (mine.botwins, mine.botlosses, theirs.botwins, theirs.botlosses) == (0, 1, 1, 0)
+        assert History.query.count() == 2
+
+
+if __name__ == "__main__":
+    test_win_is_settled_in_one_commit()
+    test_reward_both_and_draw()
+    print("settle_battle writes every battle outcome in one commit")
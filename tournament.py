@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from battle import BattleBot, full_battle, ARENA_EFFECTS
+from bot_stats import derived_stats_many
+from extensions import db
+from models import Bot, TournamentResult
+
+# -----------------------------
+# Round-Robin Tournament Runner
+# -----------------------------
+# Every bot plays every other bot in every arena, once from each side so that
+# moving first is not an advantage. Bots are snapshotted into plain tuples once.
+# Each worker process receives the snapshot table through the pool initializer.
+# After that, a task is just a (start, stop) range of match numbers. The
+# worker decodes each match number into (arena, botA, botB), derives the
+# match seed from the master seed, and returns its aggregated counts. Seeds
+# depend only on the master seed and the match itself, so results are
+# identical for any worker count or chunk size.
+
+ARENAS = tuple(ARENA_EFFECTS)
+CHUNKS_PER_WORKER = 8
+
+# Snapshot tuple layout
+SNAPSHOT_FIELDS = ("bot_id", "name", "hp", "energy", "proc", "defense", "clk", "luck", "logic", "weapon_type", "algorithm")
+
+
+def snapshot_bots(bots=None):
+    """
+    Freeze bots into plain tuples (SNAPSHOT_FIELDS) with the same combat
+    stats combat_log uses: each bot's bot_stats block (algorithm
+    multipliers, equipped weapon ATK folded into proc). One-time upgrades are left out since they are consumables.
+    Needs an app context.
+    """
+    if bots is None:
+        bots = Bot.query.order_by(Bot.id).all()
+
+    blocks = derived_stats_many(bots)
+    snapshots = []
+    for bot in bots:
+        final = blocks[bot.id].final
+        snapshots.append((
+            bot.id,
+            bot.name,
+            final["hp"],
+            final["energy"],
+            final["proc"],
+            final["def"],
+            final["clk"],
+            final["luck"],
+            final["logic"],
+            blocks[bot.id].weapon_type,
+            bot.algorithm,
+        ))
+    return snapshots
+
+
+def match_seed(master_seed, bot_a_id, bot_b_id, arena):
+    """Deterministic per-match seed (stable across processes and Python runs)."""
+    key = f"{master_seed}:{bot_a_id}:{bot_b_id}:{arena}".encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=4).digest(), "big")
+
+
+def _decode_match(k, n):
+    """Match number -> (arena_index, i, j) over ordered pairs i != j."""
+    arena_index, k = divmod(k, n * (n - 1))
+    i, r = divmod(k, n - 1)
+    j = r if r < i else r + 1
+    return arena_index, i, j
+
+
+# Per-process state, set once by the pool initializer
+_worker = {}
+
+
+def _init_worker(snapshots, arenas, master_seed):
+    # One prepared BattleBot per snapshot, reset with restore() before each
+    # match. Names are only used to report the winner, so the snapshot
+    # index keeps bots with the same name apart.
+    bots = [_battle_bot(snapshot, str(i)) for i, snapshot in enumerate(snapshots)]
+    _worker["snapshots"] = snapshots
+    _worker["bots"] = bots
+    _worker["states"] = [bot.snapshot() for bot in bots]
+    _worker["arenas"] = arenas
+    _worker["master_seed"] = master_seed
+
+
+def _battle_bot(snapshot, name):
+    _, _, hp, energy, proc, defense, clk, luck, logic, weapon_type, algorithm = snapshot
+    return BattleBot(
+        name=name,
+        hp=hp,
+        energy=energy,
+        proc=proc,
+        defense=defense,
+        clk=clk,
+        luck=luck,
+        logic=logic,
+        weapon_atk=0,
+        weapon_type=weapon_type,
+        algorithm=algorithm,
+    )
+
+
+def _play_range(bounds):
+    """Play matches [start, stop); returns flat counts [(arena, bot) x (wins, losses, draws)]."""
+    start, stop = bounds
+    snapshots = _worker["snapshots"]
+    bots = _worker["bots"]
+    states = _worker["states"]
+    arenas = _worker["arenas"]
+    master_seed = _worker["master_seed"]
+    n = len(snapshots)
+    counts = [0] * (len(arenas) * n * 3)
+
+    for k in range(start, stop):
+        arena_index, i, j = _decode_match(k, n)
+        arena = arenas[arena_index]
+        seed = match_seed(master_seed, snapshots[i][0], snapshots[j][0], arena)
+        bot_a, bot_b = bots[i], bots[j]
+        bot_a.restore(states[i])
+        bot_b.restore(states[j])
+        result = full_battle(bot_a, bot_b, seed=seed, arena=arena, headless=True)
+        base = arena_index * n
+        if result["winner"] == bot_a.name:
+            counts[(base + i) * 3] += 1
+            counts[(base + j) * 3 + 1] += 1
+        elif result["winner"] == bot_b.name:
+            counts[(base + j) * 3] += 1
+            counts[(base + i) * 3 + 1] += 1
+        else:
+            # "draw" or a stall (None), same as combat_log
+            counts[(base + i) * 3 + 2] += 1
+            counts[(base + j) * 3 + 2] += 1
+    return counts
+
+
+def run_tournament(snapshots, master_seed=0, arenas=ARENAS, workers=None, chunk_size=None):
+    """
+    Play a double round-robin of `snapshots` (from snapshot_bots) in every arena.
+    workers=1 runs in-process; otherwise a ProcessPoolExecutor with
+    `workers` processes (default: CPU count) is used.
+
+    Returns a dict: master_seed, arenas, matches and results, where
+    results maps (bot_id, arena) -> (wins, losses, draws).
+    """
+    arenas = tuple(arenas)
+    n = len(snapshots)
+    total = len(arenas) * n * (n - 1)
+    workers = workers or os.cpu_count() or 1
+
+    if chunk_size is None:
+        chunk_size = max(1, -(-total // (workers * CHUNKS_PER_WORKER)))
+    ranges = [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+    counts = [0] * (len(arenas) * n * 3)
+
+    def add(chunk_counts):
+        for index, value in enumerate(chunk_counts):
+            if value:
+                counts[index] += value
+
+    if workers == 1:
+        _init_worker(snapshots, arenas, master_seed)
+        for bounds in ranges:
+            add(_play_range(bounds))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(snapshots, arenas, master_seed),
+        ) as pool:
+            for chunk_counts in pool.map(_play_range, ranges):
+                add(chunk_counts)
+
+    results = {}
+    for arena_index, arena in enumerate(arenas):
+        for i, snapshot in enumerate(snapshots):
+            offset = (arena_index * n + i) * 3
+            results[(snapshot[0], arena)] = tuple(counts[offset:offset + 3])
+
+    return {
+        "master_seed": master_seed,
+        "arenas": arenas,
+        "matches": total,
+        "results": results,
+    }
+
+
+def save_results(tournament, snapshots, run_id=None):
+    """Bulk-insert one TournamentResult row per (bot, arena). Returns the run_id."""
+    run_id = run_id or uuid.uuid4().hex
+    names = {snapshot[0]: snapshot[1] for snapshot in snapshots}
+    rows = [
+        {
+            "run_id": run_id,
+            "master_seed": tournament["master_seed"],
+            "bot_id": bot_id,
+            "bot_name": names[bot_id],
+            "arena": arena,
+            "wins": wins,
+            "losses": losses,
+            "draws": draws,
+        }
+        for (bot_id, arena), (wins, losses, draws) in tournament["results"].items()
+    ]
+    if rows:
+        db.session.execute(db.insert(TournamentResult), rows)
+    db.session.commit()
+    return run_id
+
+
+def standings(tournament, snapshots):
+    """Overall table sorted by wins: [(bot_id, name, wins, losses, draws), ...]."""
+    totals = {snapshot[0]: [snapshot[1], 0, 0, 0] for snapshot in snapshots}
+    for (bot_id, _), (wins, losses, draws) in tournament["results"].items():
+        row = totals[bot_id]
+        row[1] += wins
+        row[2] += losses
+        row[3] += draws
+    table = [(bot_id, name, wins, losses, draws) for bot_id, (name, wins, losses, draws) in totals.items()]
+    table.sort(key=lambda row: (-row[2], row[3], row[0]))
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a round-robin tournament of every bot in the database.")
+    parser.add_argument("--seed", type=int, default=0, help="master seed (default 0)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="matches per task")
+    parser.add_argument("--arena", action="append", choices=ARENAS, help="limit to an arena (repeatable)")
+    parser.add_argument("--top", type=int, default=20, help="standings rows to print")
+    parser.add_argument("--no-save", action="store_true", help="do not write results to the database")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        snapshots = snapshot_bots()
+        started = time.perf_counter()
+        tournament = run_tournament(
+            snapshots,
+            master_seed=args.seed,
+            arenas=args.arena or ARENAS,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+        )
+        elapsed = time.perf_counter() - started
+
+        print(f"{len(snapshots)} bots, {tournament['matches']} matches in {elapsed:.2f}s "
+              f"({tournament['matches'] / elapsed if elapsed else 0:.0f} battles/s)")
+        for rank, (bot_id, name, wins, losses, draws) in enumerate(standings(tournament, snapshots)[:args.top], start=1):
+            print(f"{rank:>4}. {name} (#{bot_id})  W {wins}  L {losses}  D {draws}")
+
+        if not args.no_save:
+            run_id = save_results(tournament, snapshots)
+            print(f"Saved as run {run_id}")
+
+
+if __name__ == "__main__":
+    main()